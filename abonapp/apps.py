@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AbonappConfig(AppConfig):
     name = 'abonapp'
     verbose_name = 'Abonent app'
+
+    def ready(self):
+        # connect signals that keep index of subscribers actual
+        from abonapp import dhcp_index  # noqa
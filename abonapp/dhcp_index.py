@@ -0,0 +1,188 @@
+#
+# Index of subscribers by switch mac and port, for fast
+# search of subscriber by dhcp option 82.
+#
+from threading import Lock
+from time import monotonic
+from typing import Optional, Tuple, List
+
+from django.conf import settings
+from django.db.models import DEFERRED
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from netaddr import EUI, AddrFormatError
+from redis import Redis
+from redis.exceptions import RedisError
+
+from abonapp.models import Abon
+from devapp.models import Device, Port
+
+# Changes made by other processes are seen through this counter in redis
+VERSION_KEY = 'abonapp_dhcp_index_version'
+
+# Index is rebuilt after this time in seconds
+# if changes of other processes are not known
+INDEX_MAX_AGE = 60
+
+# Version in redis is checked not more often than this, seconds
+VERSION_CHECK_INTERVAL = 2
+
+# Fields that are used by index, changes of other fields are ignored
+ABON_FIELDS = {'device', 'dev_port', 'is_active', 'is_dynamic_ip'}
+DEVICE_FIELDS = {'mac_addr', 'devtype'}
+PORT_FIELDS = {'device', 'num'}
+
+
+class DeviceNotFound(Exception):
+    pass
+
+
+class SubscriberIndex(object):
+    """
+    (switch mac, port) or switch mac -> subscribers on it.
+    Port is used only for devices which manager uses ports.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        # (switch mac, port or None) -> list of (subscriber id, is dynamic ip)
+        self._index = None
+        # macs of devices that uses ports
+        self._port_devices = set()
+        self._built_at = 0.0
+        self._checked_at = 0.0
+        # local and redis versions of data from which index is built
+        self._generation = 0
+        self._built_generation = None
+        self._version = None
+        self._redis = Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+
+    def _remote_version(self) -> Optional[bytes]:
+        try:
+            return self._redis.get(VERSION_KEY)
+        except RedisError:
+            return
+
+    def build(self):
+        generation = self._generation
+        version = self._remote_version()
+        use_port = {code: klass.get_is_use_device_port() for code, klass in Device.DEVICE_TYPES}
+        index = {}
+        port_devices = set()
+        for mac, devtype in Device.objects.exclude(mac_addr=None).values_list('mac_addr', 'devtype').iterator():
+            if use_port.get(devtype):
+                port_devices.add(int(EUI(mac)))
+            else:
+                index[(int(EUI(mac)), None)] = []
+        customers = Abon.objects.filter(is_active=True).exclude(device=None).values_list(
+            'pk', 'is_dynamic_ip', 'device__mac_addr', 'device__devtype', 'dev_port__num'
+        )
+        for uid, is_dynamic, mac, devtype, port_num in customers.iterator():
+            if mac is None:
+                continue
+            if use_port.get(devtype):
+                if port_num is None:
+                    continue
+                key = (int(EUI(mac)), port_num)
+            else:
+                key = (int(EUI(mac)), None)
+            index.setdefault(key, []).append((uid, is_dynamic))
+        with self._lock:
+            self._index = index
+            self._port_devices = port_devices
+            self._built_generation = generation
+            self._version = version
+            self._built_at = self._checked_at = monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+        try:
+            self._redis.incr(VERSION_KEY)
+        except RedisError:
+            pass
+
+    def _is_actual(self) -> bool:
+        if self._index is None or self._built_generation != self._generation:
+            return False
+        now = monotonic()
+        if now - self._built_at > INDEX_MAX_AGE:
+            return False
+        if now - self._checked_at < VERSION_CHECK_INTERVAL:
+            return True
+        self._checked_at = now
+        version = self._remote_version()
+        return version is None or version == self._version
+
+    def lookup(self, switch_mac: str, switch_port) -> List[Tuple[int, bool]]:
+        """
+        Find subscribers on switch port
+        :return: list of pairs (subscriber id, is dynamic ip)
+        :raises DeviceNotFound: if switch is not found
+        """
+        try:
+            mac = int(EUI(switch_mac))
+        except (AddrFormatError, TypeError, ValueError):
+            raise DeviceNotFound
+        if not self._is_actual():
+            self.build()
+        with self._lock:
+            index, port_devices = self._index, self._port_devices
+        found = index.get((mac, None))
+        if found is not None:
+            return found
+        if mac not in port_devices:
+            raise DeviceNotFound
+        try:
+            return index.get((mac, int(switch_port)), [])
+        except (TypeError, ValueError):
+            return []
+
+
+subscriber_index = SubscriberIndex()
+
+
+def _attnames(model, fields: set) -> Tuple[str, ...]:
+    return tuple(sorted(model._meta.get_field(f).attname for f in fields))
+
+
+# model -> (fields used by index, their attribute names)
+INDEXED_FIELDS = {
+    Abon: (ABON_FIELDS, _attnames(Abon, ABON_FIELDS)),
+    Device: (DEVICE_FIELDS, _attnames(Device, DEVICE_FIELDS)),
+    Port: (PORT_FIELDS, _attnames(Port, PORT_FIELDS))
+}
+
+
+def _indexed_values(instance) -> tuple:
+    attrs = INDEXED_FIELDS[type(instance)][1]
+    # deferred fields are not in __dict__
+    return tuple(instance.__dict__.get(a, DEFERRED) for a in attrs)
+
+
+@receiver(post_init, sender=Abon)
+@receiver(post_init, sender=Device)
+@receiver(post_init, sender=Port)
+def index_post_init(sender, instance, **kwargs):
+    instance._indexed_values = _indexed_values(instance)
+
+
+@receiver(post_save, sender=Abon)
+@receiver(post_save, sender=Device)
+@receiver(post_save, sender=Port)
+def index_post_save(sender, instance, created=False, update_fields=None, **kwargs):
+    if update_fields is not None:
+        changed = bool(INDEXED_FIELDS[sender][0].intersection(update_fields))
+    else:
+        # whole object is saved, compare with values it was loaded with
+        changed = created or getattr(instance, '_indexed_values', None) != _indexed_values(instance)
+    if changed:
+        subscriber_index.invalidate()
+    instance._indexed_values = _indexed_values(instance)
+
+
+@receiver(post_delete, sender=Abon)
+@receiver(post_delete, sender=Device)
+@receiver(post_delete, sender=Port)
+def index_post_delete(sender, **kwargs):
+    subscriber_index.invalidate()
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('abonapp', '0009_auto_20181123_1556'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AbonReachability',
+            fields=[
+                ('abon', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='reachability', serialize=False, to='abonapp.Abon')),
+                ('is_alive', models.BooleanField(default=False, verbose_name='Is alive')),
+                ('received', models.PositiveSmallIntegerField(default=0, verbose_name='Received')),
+                ('sent', models.PositiveSmallIntegerField(default=0, verbose_name='Sent')),
+                ('latency', models.FloatField(blank=True, null=True, verbose_name='Latency')),
+                ('last_check', models.DateTimeField(auto_now=True, verbose_name='Last check')),
+            ],
+            options={
+                'verbose_name': 'Reachability',
+                'verbose_name_plural': 'Reachability',
+                'db_table': 'abonent_reachability',
+            },
+        ),
+    ]
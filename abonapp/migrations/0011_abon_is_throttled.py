@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('abonapp', '0010_abonreachability'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='abon',
+            name='is_throttled',
+            field=models.BooleanField(default=False, verbose_name='Quota exceeded'),
+        ),
+    ]
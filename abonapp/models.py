@@ -167,6 +167,8 @@ class Abon(BaseAccount):
         Tariff, verbose_name=_('Last connected service'),
         on_delete=models.SET_NULL, null=True, blank=True, default=None
     )
+    # speed is lowered because traffic quota of service is exceeded
+    is_throttled = models.BooleanField(_('Quota exceeded'), default=False)
 
     MARKER_FLAGS = (
         ('icon_donkey', _('Donkey')),
@@ -313,10 +315,14 @@ class Abon(BaseAccount):
         abon_tariff = self.active_tariff()
         if abon_tariff:
             abon_tariff = abon_tariff.tariff
+            if self.is_throttled and abon_tariff.quota:
+                max_limit = (abon_tariff.quota_speed, abon_tariff.quota_speed)
+            else:
+                max_limit = (abon_tariff.speedIn, abon_tariff.speedOut)
             return SubnetQueue(
                 name="uid%d" % self.pk,
                 network=self.ip_address,
-                max_limit=(abon_tariff.speedIn, abon_tariff.speedOut),
+                max_limit=max_limit,
                 is_access=self.is_access()
             )
 
@@ -525,6 +531,30 @@ class PeriodicPayForId(models.Model):
         ordering = ('last_pay',)
 
 
+class AbonReachability(models.Model):
+    """
+    Result of last ping of subscriber from his gateway
+    """
+    abon = models.OneToOneField(
+        Abon, models.CASCADE, primary_key=True,
+        related_name='reachability'
+    )
+    is_alive = models.BooleanField(_('Is alive'), default=False)
+    received = models.PositiveSmallIntegerField(_('Received'), default=0)
+    sent = models.PositiveSmallIntegerField(_('Sent'), default=0)
+    # average round trip time in milliseconds
+    latency = models.FloatField(_('Latency'), blank=True, null=True)
+    last_check = models.DateTimeField(_('Last check'), auto_now=True)
+
+    def __str__(self):
+        return "%s - %s" % (self.abon, self.is_alive)
+
+    class Meta:
+        db_table = 'abonent_reachability'
+        verbose_name = _('Reachability')
+        verbose_name_plural = _('Reachability')
+
+
 @receiver(post_init, sender=AbonTariff)
 def abon_tariff_post_init(sender, **kwargs):
     abon_tariff = kwargs["instance"]
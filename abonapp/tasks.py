@@ -1,9 +1,21 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+from uuid import uuid4
+
 from celery import shared_task
+from django.conf import settings
+from django.db import transaction, connection, IntegrityError
+from django.db.models import Q
+from django.utils.translation import gettext as _
+from redis import Redis
 
-from abonapp.models import Abon
+from abonapp.dhcp_index import subscriber_index, DeviceNotFound
+from abonapp.models import Abon, AbonReachability
 from djing.lib import LogicError
 from gw_app.models import NASModel
 from gw_app.nas_managers import NasFailedResult, NasNetworkError, SubnetQueue
+from traf_stat.models import get_month_octets
 
 
 @shared_task
@@ -44,3 +56,321 @@ def customer_nas_remove(customer_uid: int, ip_addr: str, speed: tuple, is_access
         return 'ABONAPP ERROR: %s' % e
     except NASModel.DoesNotExist:
         return 'NASModel.DoesNotExist id=%d' % nas_pk
+
+
+# While ping job is running, same requests are joined to it
+PING_JOB_TTL = 20
+
+# How long result of ping is available for subscriber page
+PING_RESULT_TTL = 300
+
+
+def _ping_text(icon: str, text: str) -> str:
+    return '<span class="glyphicon glyphicon-%s"></span> %s' % (icon, text)
+
+
+@shared_task
+def customer_ping(nas_pk: int, ip_addr: str) -> dict:
+    try:
+        nas = NASModel.objects.get(pk=nas_pk)
+        mngr = nas.get_nas_manager()
+        ping_result = mngr.ping(ip_addr)
+        if ping_result is None:
+            return {'status': 1, 'dat': _ping_text('exclamation-sign', _('no ping'))}
+        received, sent = ping_result
+        if received == 0:
+            ping_result = mngr.ping(ip_addr, arp=True)
+            if ping_result is None:
+                return {'status': 1, 'dat': _ping_text('exclamation-sign', _('no ping'))}
+            received, sent = ping_result
+        loses_percent = received / sent if sent != 0 else 1
+        ping_result = {'return': received, 'all': sent}
+        if loses_percent > 1.0:
+            return {'status': 1, 'dat': _ping_text('exclamation-sign', _(
+                'IP Conflict! %(return)d/%(all)d results'
+            ) % ping_result)}
+        elif loses_percent > 0.5:
+            return {'status': 0, 'dat': _ping_text('ok', _(
+                'ok ping, %(return)d/%(all)d loses'
+            ) % ping_result)}
+        return {'status': 1, 'dat': _ping_text('exclamation-sign', _(
+            'no ping, %(return)d/%(all)d loses'
+        ) % ping_result)}
+    except NASModel.DoesNotExist:
+        return {'status': 1, 'dat': 'NASModel.DoesNotExist id=%d' % nas_pk}
+    except (NasFailedResult, NasNetworkError, LogicError, ConnectionResetError) as e:
+        return {'status': 1, 'dat': str(e)}
+
+
+def _start_ping_job(redis: Redis, nas_pk: int, ip_addr: str) -> str:
+    job_key = 'abon_ping_%d_%s' % (nas_pk, ip_addr)
+    job_id = str(uuid4())
+    if redis.set(job_key, job_id, nx=True, ex=PING_JOB_TTL):
+        customer_ping.apply_async((nas_pk, ip_addr), task_id=job_id)
+        return job_id
+    running_job_id = redis.get(job_key)
+    if running_job_id is None:
+        # job has just finished
+        customer_ping.apply_async((nas_pk, ip_addr), task_id=job_id)
+        return job_id
+    return running_job_id.decode()
+
+
+def start_ping_job(uid: int, nas_pk: int, ip_addr: str) -> str:
+    """
+    Run ping in background, or join to already running ping of same ip
+    :param uid: id of subscriber, only his job result is given by get_ping_job
+    :return: id of job
+    """
+    redis = Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+    job_id = _start_ping_job(redis, nas_pk, ip_addr)
+    redis.set('abon_ping_job_%d' % uid, job_id, ex=PING_RESULT_TTL)
+    return job_id
+
+
+def is_ping_job_of(uid: int, job_id: str) -> bool:
+    """
+    Is job started by start_ping_job for this subscriber
+    """
+    redis = Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+    return redis.get('abon_ping_job_%d' % uid) == job_id.encode()
+
+
+# How many gateways are pinging subscribers at the same time
+SWEEP_NAS_CONCURRENCY = 4
+
+
+def _sweep_nas(nas_pk: int, hosts: dict) -> int:
+    """
+    Ping all subscribers of one gateway via one connection
+    :param hosts: ip address -> subscriber id
+    :return: count of saved results
+    """
+    try:
+        nas = NASModel.objects.get(pk=nas_pk)
+        # own connection, because sweep of gateway takes a long time
+        mngr = nas.create_nas_manager()
+        results = mngr.ping_many(hosts.keys())
+        rows = []
+        for ip, uid in hosts.items():
+            r = results.get(ip)
+            received, sent, latency = r if r is not None else (0, 0, None)
+            rows.append(AbonReachability(
+                abon_id=uid, is_alive=received > 0,
+                received=received, sent=sent,
+                latency=latency if received > 0 else None
+            ))
+        with transaction.atomic():
+            AbonReachability.objects.filter(abon_id__in=hosts.values()).delete()
+            AbonReachability.objects.bulk_create(rows)
+        return len(rows)
+    except NASModel.DoesNotExist:
+        return 0
+    except (NasFailedResult, NasNetworkError, LogicError, ConnectionResetError, OSError) as e:
+        print('Ping sweep %d:' % nas_pk, e)
+        return 0
+    finally:
+        # thread has own db connection
+        connection.close()
+
+
+@shared_task
+def group_ping_sweep(group_id: int) -> str:
+    """
+    Ping all subscribers of group, each gateway pings its
+    subscribers by itself
+    """
+    by_nas = defaultdict(dict)
+    customers = Abon.objects.filter(group__pk=group_id).exclude(
+        ip_address=None
+    ).exclude(nas=None).values_list('pk', 'ip_address', 'nas')
+    for uid, ip, nas_pk in customers.iterator():
+        by_nas[nas_pk][str(ip)] = uid
+    with ThreadPoolExecutor(max_workers=SWEEP_NAS_CONCURRENCY) as executor:
+        futures = [executor.submit(_sweep_nas, nas_pk, hosts) for nas_pk, hosts in by_nas.items()]
+        count = sum(f.result() for f in futures)
+    return 'Ping sweep of group %d: %d subscribers checked' % (group_id, count)
+
+
+def save_ips(abons: Iterable[Abon]) -> Dict[int, str]:
+    """
+    Save ip addresses of subscribers by one bulk update. If it fails
+    by conflict of addresses, subscribers are saved one by one, each
+    in its savepoint. Subscriber that fails is tried again after the
+    others, and those that still fail are tried together, as they may
+    exchange addresses.
+    :return: subscriber id -> error, for subscribers that are not saved
+    """
+    pending = list(abons)
+    if not pending:
+        return {}
+    try:
+        with transaction.atomic():
+            Abon.objects.bulk_update(pending, ('ip_address',))
+        return {}
+    except IntegrityError:
+        pass
+    errors = {}
+    while pending:
+        failed = []
+        for abon in pending:
+            try:
+                with transaction.atomic():
+                    abon.save(update_fields=('ip_address',))
+            except IntegrityError as e:
+                errors[abon.pk] = str(e).replace('\n', ' ')
+                failed.append(abon)
+            else:
+                errors.pop(abon.pk, None)
+        if len(failed) == len(pending):
+            break
+        pending = failed
+    if len(pending) > 1:
+        try:
+            with transaction.atomic():
+                Abon.objects.filter(pk__in=[a.pk for a in pending]).update(ip_address=None)
+                for abon in pending:
+                    abon.save(update_fields=('ip_address',))
+        except IntegrityError:
+            pass
+        else:
+            errors.clear()
+    return errors
+
+
+def reconcile_nas_leases(nas: NASModel) -> Tuple[int, Dict[int, str]]:
+    """
+    Correct dynamic ip of subscribers of gateway by bound leases on it,
+    for cases when event from dhcp server has been lost
+    :return: count of corrected subscribers, and errors of subscribers
+    whose address can not be saved
+    """
+    mngr = nas.get_nas_manager()
+    leased = {}
+    for lease in mngr.read_leases():
+        if lease.switch_mac is None:
+            continue
+        try:
+            customers = subscriber_index.lookup(lease.switch_mac, lease.switch_port)
+        except DeviceNotFound:
+            continue
+        if len(customers) != 1:
+            continue
+        uid, is_dynamic_ip = customers[0]
+        if is_dynamic_ip:
+            leased[uid] = lease.ip
+    if not leased:
+        return 0, {}
+    changed = [
+        abon for abon in Abon.objects.filter(pk__in=leased.keys(), nas=nas).select_related('current_tariff__tariff')
+        if abon.ip_address != leased[abon.pk]
+    ]
+    if not changed:
+        return 0, {}
+    # these addresses are leased to other subscribers of gateway now
+    displaced = list(Abon.objects.filter(
+        ip_address__in=[leased[abon.pk] for abon in changed], is_dynamic_ip=True, nas=nas
+    ).exclude(pk__in=[abon.pk for abon in changed]).select_related('current_tariff__tariff'))
+    stale_queues = [abon.build_agent_struct() for abon in displaced]
+    for abon in displaced:
+        abon.ip_address = None
+    for abon in changed:
+        abon.ip_address = leased[abon.pk]
+    with transaction.atomic():
+        errors = save_ips(displaced + changed)
+    changed = [abon for abon in changed if abon.pk not in errors]
+    # queues of displaced subscribers have addresses of others now
+    for abon, queue in zip(displaced, stale_queues):
+        if queue is None or abon.pk in errors:
+            continue
+        try:
+            mngr.remove_user(queue)
+        except (NasFailedResult, NasNetworkError, ConnectionResetError) as e:
+            errors[abon.pk] = str(e)
+    for abon in changed:
+        queue = abon.build_agent_struct()
+        if queue is not None and queue.is_access:
+            mngr.update_user(queue)
+    return len(changed), errors
+
+
+@shared_task
+def reconcile_dhcp_leases():
+    res = []
+    for nas in NASModel.objects.filter(enabled=True).iterator():
+        try:
+            count, errors = reconcile_nas_leases(nas)
+            if count:
+                res.append('%s: %d corrected' % (nas, count))
+            for uid, error in errors.items():
+                res.append('%s: subscriber %d: %s' % (nas, uid, error))
+        except NotImplementedError:
+            pass
+        except (NasFailedResult, NasNetworkError, LogicError, ConnectionResetError, IntegrityError) as e:
+            res.append('%s: %s' % (nas, e))
+    return '; '.join(res)
+
+
+def quota_changes(abons: Iterable[Tuple[int, bool, Optional[int]]],
+                  month_octets: Dict[int, int]) -> Tuple[List[int], List[int]]:
+    """
+    Which subscribers exceeded their quota, and which are not exceeding it
+    any more, because month is changed or service is changed
+    :param abons: (subscriber id, is throttled, quota in octets or None)
+    :param month_octets: subscriber id -> octets of current month
+    :return: ids to throttle and ids to release
+    """
+    throttle, release = [], []
+    for uid, is_throttled, quota in abons:
+        exceeded = bool(quota) and month_octets.get(uid, 0) >= quota
+        if exceeded and not is_throttled:
+            throttle.append(uid)
+        elif is_throttled and not exceeded:
+            release.append(uid)
+    return throttle, release
+
+
+@shared_task
+def enforce_traffic_quotas():
+    abons = Abon.objects.filter(
+        Q(current_tariff__tariff__quota__gt=0) | Q(is_throttled=True)
+    ).values_list('pk', 'is_throttled', 'current_tariff__tariff__quota')
+    throttle, release = quota_changes(
+        ((uid, is_throttled, quota * 1024 ** 3 if quota else None)
+         for uid, is_throttled, quota in abons.iterator()),
+        get_month_octets()
+    )
+    if not throttle and not release:
+        return
+
+    # flag is saved only when speed is changed on gateway,
+    # otherwise subscriber is found by next run again
+    applied = {True: [], False: []}
+    by_nas = defaultdict(list)
+    changed = Abon.objects.filter(pk__in=throttle + release).select_related('current_tariff__tariff')
+    throttle = set(throttle)
+    for abon in changed.iterator():
+        abon.is_throttled = abon.pk in throttle
+        queue = abon.build_agent_struct() if abon.nas_id is not None else None
+        if queue is not None and queue.is_access:
+            by_nas[abon.nas_id].append((abon, queue))
+        else:
+            applied[abon.is_throttled].append(abon.pk)
+    res = []
+    enabled = NASModel.objects.filter(pk__in=by_nas.keys(), enabled=True)
+    for nas in enabled:
+        try:
+            # change speed on gateway, all subscribers of gateway at once
+            nas.get_nas_manager().update_limits([queue for abon, queue in by_nas[nas.pk]])
+        except (NasFailedResult, NasNetworkError, LogicError, ConnectionResetError) as e:
+            res.append('%s: %s' % (nas, e))
+            del by_nas[nas.pk]
+    # disabled gateways get new speed when they are synchronized
+    for items in by_nas.values():
+        for abon, queue in items:
+            applied[abon.is_throttled].append(abon.pk)
+    with transaction.atomic():
+        Abon.objects.filter(pk__in=applied[True]).update(is_throttled=True)
+        Abon.objects.filter(pk__in=applied[False]).update(is_throttled=False)
+    res.insert(0, '%d throttled, %d released' % (len(applied[True]), len(applied[False])))
+    return '; '.join(res)
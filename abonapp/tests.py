@@ -1,17 +1,25 @@
 from abc import ABCMeta
 from hashlib import md5
 from datetime import date
+from json import dumps
+from unittest.mock import patch
 
 from accounts_app.models import UserProfile
 from django.shortcuts import resolve_url
-from django.test import TestCase, RequestFactory
+from django.test import SimpleTestCase, TestCase, RequestFactory, override_settings
 from django.conf import settings
+from django.db import OperationalError
 from django.utils.translation import gettext_lazy as _
 
+from abonapp.dhcp_index import subscriber_index, DeviceNotFound
 from abonapp.models import Abon, AbonStreet, PassportInfo
+from abonapp.tasks import quota_changes, save_ips
+from devapp.models import Device, Port
 from group_app.models import Group
+from gw_app.models import NASModel
 from tariff_app.models import Tariff
 from ip_pool.models import NetworkModel
+from djing.lib import calc_hash
 
 rf = RequestFactory()
 
@@ -238,6 +246,23 @@ class AbonServiceTestCase(MyBaseTestCase, TestCase):
         )
 
 
+class TrafficQuotaTestCase(SimpleTestCase):
+    def test_quota_changes(self):
+        throttle, release = quota_changes((
+            (1, False, 1000),
+            (2, False, 1000),
+            # already throttled
+            (3, True, 1000),
+            # new month
+            (4, True, 1000),
+            # service without quota
+            (5, True, None),
+            (6, False, None),
+        ), {1: 1000, 2: 999, 3: 5000, 6: 10 ** 12})
+        self.assertListEqual(throttle, [1])
+        self.assertListEqual(release, [4, 5])
+
+
 class ClientLeasesTestCase(MyBaseTestCase, TestCase):
     def setUp(self):
         super(ClientLeasesTestCase, self).setUp()
@@ -369,3 +394,104 @@ class ClientLeasesTestCase(MyBaseTestCase, TestCase):
         updated_abon = Abon.objects.get(username=self.abon.username)
         ip_addr = updated_abon.ip_addresses.all().first()
         self.assertEqual('fde8:86a9:f132:1::7', ip_addr.ip)
+
+
+@override_settings(API_AUTH_SECRET='secret', API_AUTH_SUBNET='127.0.0.0/8')
+class DhcpBatchTestCase(MyBaseTestCase, TestCase):
+    def _post_batch(self, events):
+        body = dumps({'events': events})
+        body_hash = calc_hash(body)
+        sign = calc_hash('_'.join((body_hash, 'secret')))
+        return self.client.post(
+            '/abons/api/dhcp_lever/?body_hash=%s&sign=%s' % (body_hash, sign),
+            data=body, content_type='application/json'
+        )
+
+    def test_bad_body_hash(self):
+        sign = calc_hash('_'.join(('abc', 'secret')))
+        r = self.client.post(
+            '/abons/api/dhcp_lever/?body_hash=abc&sign=%s' % sign,
+            data=dumps({'events': []}), content_type='application/json'
+        )
+        self.assertEqual(r.json().get('status'), 'body_hash is invalid')
+
+    def test_results_in_order(self):
+        self.abon.ip_address = '10.0.0.2'
+        self.abon.is_active = True
+        self.abon.save(update_fields=('ip_address', 'is_active'))
+        r = self._post_batch([
+            {'cmd': 'expiry', 'client_ip': '10.0.0.3'},
+            {'cmd': 'release'},
+            {'cmd': 'unknown', 'client_ip': '10.0.0.2'},
+            {'cmd': 'commit', 'client_ip': '10.0.0.4', 'switch_mac': '12:34:56:78:9a:bc', 'switch_port': 1}
+        ])
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json().get('results'), [
+            {'text': 'Subscriber with ip 10.0.0.3 does not exist'},
+            {'text': '"client_ip" parameter is missing'},
+            {'text': '"cmd" parameter is invalid: unknown'},
+            {'text': 'Device with mac 12:34:56:78:9a:bc not found'}
+        ])
+
+    def test_database_error(self):
+        with patch('abonapp.views.dhcp_batch', side_effect=OperationalError('gone away')):
+            r = self._post_batch([{'cmd': 'expiry', 'client_ip': '10.0.0.3'}])
+        self.assertEqual(r.status_code, 503)
+        self.assertEqual(r.json().get('status'), 'gone away')
+
+    def test_save_ips_exchange(self):
+        nas = NASModel.objects.create(
+            title='Title', ip_address='192.168.8.12', ip_port=123,
+            auth_login='admin', auth_passw='admin', nas_type='mktk'
+        )
+        a2 = Abon.objects.create_user(telephone='+79781234568', username='abon2', password='passw2')
+        self.abon.nas = a2.nas = nas
+        self.abon.ip_address, a2.ip_address = '10.0.0.2', '10.0.0.3'
+        self.abon.save(update_fields=('nas', 'ip_address'))
+        a2.save(update_fields=('nas', 'ip_address'))
+        self.abon.ip_address, a2.ip_address = '10.0.0.3', '10.0.0.2'
+        self.assertDictEqual(save_ips((self.abon, a2)), {})
+        a3 = Abon.objects.create_user(telephone='+79781234569', username='abon3', password='passw3')
+        a3.nas, a3.ip_address = nas, '10.0.0.3'
+        self.assertListEqual(list(save_ips((a3,)).keys()), [a3.pk])
+
+
+class SubscriberIndexTestCase(MyBaseTestCase, TestCase):
+    def setUp(self):
+        super(SubscriberIndexTestCase, self).setUp()
+        self.switch = Device.objects.create(
+            mac_addr='12:34:56:78:9a:bc', comment='switch', devtype='Dl'
+        )
+        self.port = Port.objects.create(device=self.switch, num=3)
+        self.onu = Device.objects.create(
+            mac_addr='12:34:56:78:9a:bd', comment='onu', devtype='On'
+        )
+        self.abon.device = self.switch
+        self.abon.dev_port = self.port
+        self.abon.is_active = True
+        self.abon.is_dynamic_ip = True
+        self.abon.save(update_fields=('device', 'dev_port', 'is_active', 'is_dynamic_ip'))
+
+    def test_lookup_by_port(self):
+        self.assertEqual(subscriber_index.lookup('12:34:56:78:9A:BC', '3'), [(self.abon.pk, True)])
+        self.assertEqual(subscriber_index.lookup('12:34:56:78:9a:bc', 4), [])
+        self.assertEqual(subscriber_index.lookup('12:34:56:78:9a:bd', 4), [])
+        with self.assertRaises(DeviceNotFound):
+            subscriber_index.lookup('12:34:56:78:9a:be', 3)
+
+    def test_invalidate_on_save(self):
+        self.assertEqual(subscriber_index.lookup('12:34:56:78:9a:bc', 3), [(self.abon.pk, True)])
+        self.abon.device = self.onu
+        self.abon.save(update_fields=('device',))
+        self.assertEqual(subscriber_index.lookup('12:34:56:78:9a:bc', 3), [])
+        self.assertEqual(subscriber_index.lookup('12:34:56:78:9a:bd', 3), [(self.abon.pk, True)])
+
+    def test_other_fields_keep_index(self):
+        subscriber_index.lookup('12:34:56:78:9a:bc', 3)
+        generation = subscriber_index._generation
+        self.abon.fio = 'New name'
+        self.abon.save()
+        self.assertEqual(subscriber_index._generation, generation)
+        self.abon.is_dynamic_ip = False
+        self.abon.save()
+        self.assertEqual(subscriber_index.lookup('12:34:56:78:9a:bc', 3), [(self.abon.pk, False)])
@@ -1,4 +1,5 @@
 from django.urls import path, include, re_path
+from django.views.decorators.csrf import csrf_exempt
 
 from abonapp import views
 
@@ -29,6 +30,7 @@ subscriber_patterns = [
     path('periodic_pay/<int:periodic_pay_id>/', views.add_edit_periodic_pay, name='add_periodic_pay'),
     path('periodic_pay/<int:periodic_pay_id>/del/', views.del_periodic_pay, name='del_periodic_pay'),
     path('ping/', views.abon_ping, name='ping'),
+    path('ping/status/', views.abon_ping_status, name='ping_status'),
     path('set_auto_continue_service/', views.set_auto_continue_service, name='set_auto_continue_service'),
     path('update_ip/', views.IpUpdateView.as_view(), name='update_ip')
 ]
@@ -44,6 +46,7 @@ group_patterns = [
     path('street/<int:sid>/delete/', views.street_del, name='street_del'),
     path('active_networks/', views.active_nets, name='active_nets'),
     path('attach_nas/', views.attach_nas, name='attach_nas'),
+    path('ping_sweep/', views.ping_sweep, name='ping_sweep'),
     re_path('^(?P<uname>\w{1,127})/', include(subscriber_patterns))
 ]
 
@@ -57,5 +60,5 @@ urlpatterns = [
     # Api's
     path('api/abons/', views.abons),
     path('api/abon_filter/', views.search_abon),
-    path('api/dhcp_lever/', views.DhcpLever.as_view())
+    path('api/dhcp_lever/', csrf_exempt(views.DhcpLever.as_view()))
 ]
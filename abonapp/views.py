@@ -1,26 +1,32 @@
+import json
 from datetime import datetime
 from typing import Dict, Optional
 from kombu.exceptions import OperationalError
+from redis.exceptions import RedisError
 
-from abonapp.tasks import customer_nas_command, customer_nas_remove
-from agent.commands.dhcp import dhcp_commit, dhcp_expiry, dhcp_release
+from abonapp.tasks import (
+    customer_nas_command, customer_nas_remove,
+    customer_ping, start_ping_job, is_ping_job_of, group_ping_sweep
+)
+from agent.commands.dhcp import dhcp_commit, dhcp_expiry, dhcp_release, dhcp_batch
 from devapp.models import Device, Port as DevPort
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.core.exceptions import PermissionDenied, ValidationError
-from django.db import IntegrityError, transaction
+from django.db import IntegrityError, DatabaseError, transaction
 from django.db.models import Count
 from django.http import (
     HttpResponse, HttpResponseBadRequest,
-    HttpResponseRedirect
+    HttpResponseRedirect, JsonResponse
 )
 from django.shortcuts import render, redirect, get_object_or_404, resolve_url
 from django.urls import reverse_lazy
 
 from django.utils.decorators import method_decorator
 from django.utils.translation import gettext_lazy as _
+from django.views.decorators.http import require_POST
 from django.views.generic import ListView, UpdateView, CreateView, DeleteView, DetailView
 from djing import lib
 from djing.global_base_views import OrderedFilteredList, SecureApiView
@@ -36,9 +42,11 @@ from guardian.decorators import \
 from guardian.shortcuts import get_objects_for_user, assign_perm
 from gw_app.models import NASModel
 from gw_app.nas_managers import NasFailedResult, NasNetworkError
+from gw_app.tasks import rebalance_group_nas
 from ip_pool.models import NetworkModel
 from tariff_app.models import Tariff
 from taskapp.models import Task
+from traf_stat.online import get_online_counts, get_group_online
 from abonapp import forms
 from abonapp import models
 
@@ -54,7 +62,8 @@ class PeoplesListView(LoginRequiredMixin, OnlyAdminsMixin,
         if street_id > 0:
             peoples_list = peoples_list.filter(street=street_id)
         peoples_list = peoples_list.select_related(
-            'group', 'street', 'current_tariff__tariff', 'statcache'
+            'group', 'street', 'current_tariff__tariff', 'statcache',
+            'reachability'
         ).only(
             'group', 'street', 'fio', 'birth_day',
             'street', 'house', 'telephone', 'ballance', 'markers',
@@ -81,6 +90,10 @@ class PeoplesListView(LoginRequiredMixin, OnlyAdminsMixin,
         ).only('name')
         context['street_id'] = lib.safe_int(self.request.GET.get('street'))
         context['group'] = group
+        try:
+            context['online_count'] = get_group_online(gid)
+        except RedisError:
+            pass
         return context
 
 
@@ -97,6 +110,16 @@ class GroupListView(LoginRequiredMixin, OnlyAdminsMixin, OrderedFilteredList):
         )
         return queryset.annotate(usercount=Count('abon'))
 
+    def get_context_data(self, **kwargs):
+        context = super(GroupListView, self).get_context_data(**kwargs)
+        try:
+            online = get_online_counts()
+        except RedisError:
+            online = None
+        for gr in context['groups']:
+            gr.online_count = None if online is None else online.get(gr.pk, 0)
+        return context
+
 
 class AbonCreateView(LoginRequiredMixin, OnlyAdminsMixin,
                      PermissionRequiredMixin, CreateView):
@@ -710,64 +733,68 @@ def clear_dev(request, gid: int, uname):
 @json_view
 def abon_ping(request, gid: int, uname):
     ip = request.GET.get('cmd_param')
-    status = 1
-    text = '<span class="glyphicon glyphicon-exclamation-sign"></span> %s' % _('no ping')
     abon = get_object_or_404(models.Abon, username=uname)
+    if ip is None:
+        return {
+            'status': 1,
+            'dat': str(_('Ip not passed'))
+        }
+    if abon.nas is None:
+        return {
+            'status': 1,
+            'dat': '<span class="glyphicon glyphicon-exclamation-sign">'
+                   '</span> %s' % _('gateway required')
+        }
     try:
-        if ip is None:
-            raise lib.LogicError(_('Ip not passed'))
+        job_id = start_ping_job(abon.pk, abon.nas_id, ip)
+    except (OperationalError, RedisError) as e:
+        return {
+            'status': 1,
+            'dat': str(e)
+        }
+    return {
+        'status': 2,
+        'job_id': job_id,
+        'status_url': resolve_url('abonapp:ping_status', gid, uname),
+        'dat': '<span class="glyphicon glyphicon-refresh"></span> %s' % _('Wait...')
+    }
 
-        if abon.nas is None:
+
+@login_required
+@only_admins
+@permission_required('abonapp.can_ping')
+@json_view
+def abon_ping_status(request, gid: int, uname):
+    job_id = request.GET.get('job_id')
+    if not job_id:
+        return {
+            'status': 1,
+            'dat': str(_('Job id not passed'))
+        }
+    abon = get_object_or_404(models.Abon, username=uname)
+    try:
+        if not is_ping_job_of(abon.pk, job_id):
             return {
                 'status': 1,
-                'dat': '<span class="glyphicon glyphicon-exclamation-sign">'
-                       '</span> %s' % _('gateway required')
+                'dat': str(_('Job not found'))
             }
-        mngr = abon.nas.get_nas_manager()
-        ping_result = mngr.ping(ip)
-        if ping_result is None:
+        result = customer_ping.AsyncResult(job_id)
+        if not result.ready():
+            return {
+                'status': 2,
+                'job_id': job_id
+            }
+        if result.failed():
             return {
                 'status': 1,
-                'dat': text
+                'dat': str(result.result)
             }
-        if isinstance(ping_result, tuple):
-            received, sent = ping_result
-            if received == 0:
-                ping_result = mngr.ping(ip, arp=True)
-                if ping_result is not None and isinstance(ping_result, tuple):
-                    received, sent = ping_result
-                else:
-                    return {
-                        'status': 1,
-                        'dat': text
-                    }
-            loses_percent = (
-                received / sent if sent != 0 else 1
-            )
-            ping_result = {'return': received, 'all': sent}
-            if loses_percent > 1.0:
-                text = '<span class="glyphicon glyphicon-exclamation-sign"></span> %s' % _(
-                    'IP Conflict! %(return)d/%(all)d results'
-                ) % ping_result
-            elif loses_percent > 0.5:
-                text = '<span class="glyphicon glyphicon-ok"></span> %s' % _(
-                    'ok ping, %(return)d/%(all)d loses'
-                ) % ping_result
-                status = 0
-            else:
-                text = '<span class="glyphicon glyphicon-exclamation-sign"></span> %s' % _(
-                    'no ping, %(return)d/%(all)d loses'
-                ) % ping_result
-
-    except (NasFailedResult, lib.LogicError) as e:
-        text = str(e)
-    except NasNetworkError as e:
-        text = str(e)
-
-    return {
-        'status': status,
-        'dat': text
-    }
+        return result.result
+    except RedisError as e:
+        return {
+            'status': 1,
+            'dat': str(e)
+        }
 
 
 @login_required
@@ -1235,6 +1262,17 @@ class UserSessionFree(LoginRequiredMixin, OnlyAdminsMixin, PermissionRequiredMix
 @permission_required('abonapp.change_abon')
 def attach_nas(request, gid):
     if request.method == 'POST':
+        if request.POST.get('gateway') == 'auto':
+            try:
+                rebalance_group_nas.delay(gid)
+                messages.success(
+                    request,
+                    _('Subscribers in this group will be spread '
+                      'between gateways that serve it')
+                )
+            except OperationalError as e:
+                messages.error(request, e)
+            return redirect('abonapp:group_list')
         gateway_id = lib.safe_int(request.POST.get('gateway'))
         if gateway_id:
             nas = get_object_or_404(NASModel, pk=gateway_id)
@@ -1257,6 +1295,26 @@ def attach_nas(request, gid):
     })
 
 
+@login_required
+@only_admins
+@permission_required('abonapp.can_ping')
+@require_POST
+def ping_sweep(request, gid: int):
+    group = get_object_or_404(Group, pk=gid)
+    if not request.user.has_perm('group_app.view_group', group):
+        raise PermissionDenied
+    try:
+        group_ping_sweep.delay(group.pk)
+        messages.success(
+            request,
+            _('Subscribers in this group are pinging, '
+              'refresh page a bit later')
+        )
+    except OperationalError as e:
+        messages.error(request, e)
+    return redirect('abonapp:people_list', gid=gid)
+
+
 # API's
 @login_required
 @only_admins
@@ -1301,7 +1359,7 @@ class DhcpLever(SecureApiView):
     #
     # Api view for dhcp event
     #
-    http_method_names = ('get',)
+    http_method_names = ('get', 'post')
 
     @method_decorator(json_view)
     def get(self, request, *args, **kwargs):
@@ -1314,6 +1372,30 @@ class DhcpLever(SecureApiView):
         except IntegrityError as e:
             return {'status': str(e).replace('\n', ' ')}
 
+    @method_decorator(json_view)
+    def post(self, request, *args, **kwargs):
+        """
+        Batch of events in json body: {"events": [event, event, ...]}.
+        Body is signed by its hash in "body_hash" get parameter.
+        """
+        if request.GET.get('body_hash') != lib.calc_hash(request.body):
+            return {'status': 'body_hash is invalid'}
+        try:
+            events = json.loads(request.body.decode()).get('events')
+        except (ValueError, AttributeError):
+            events = None
+        if not isinstance(events, list) or not all(isinstance(ev, dict) for ev in events):
+            return {'status': '"events" parameter is invalid'}
+        try:
+            results = dhcp_batch(events)
+        except DatabaseError as e:
+            # batch is kept by dhcp_lever and sent again
+            return JsonResponse({'status': str(e).replace('\n', ' ')}, status=503)
+        return {
+            'status': 'ok',
+            'results': [{'status': 'ok'} if r is None else {'text': r} for r in results]
+        }
+
     @staticmethod
     def on_dhcp_event(data: Dict) -> Optional[str]:
         """
@@ -1,44 +1,38 @@
-from typing import Optional
-from django.core.exceptions import MultipleObjectsReturned
+from collections import defaultdict
+from typing import Optional, List, Dict
+from django.utils.translation import gettext_lazy as _
+from kombu.exceptions import OperationalError
+from abonapp.dhcp_index import subscriber_index, DeviceNotFound
 from abonapp.models import Abon
-from devapp.models import Device, Port
+from abonapp.tasks import customer_nas_command, save_ips
+from gw_app.nas_managers import NasFailedResult, NasNetworkError
 
 
 def dhcp_commit(client_ip: str, client_mac: str,
                 switch_mac: str, switch_port: int) -> Optional[str]:
     try:
-        dev = Device.objects.get(mac_addr=switch_mac)
-        mngr_class = dev.get_manager_klass()
-
-        if mngr_class.get_is_use_device_port():
-            abon = Abon.objects.get(dev_port__device=dev,
-                                    dev_port__num=switch_port,
-                                    device=dev, is_active=True)
-        else:
-            abon = Abon.objects.get(device=dev, is_active=True)
-        if not abon.is_dynamic_ip:
-            return 'User settings is not dynamic'
-        if client_ip == abon.ip_address:
-            return 'Ip has already attached'
-        abon.attach_ip_addr(client_ip, strict=False)
-        if abon.is_access():
-            r = abon.nas_sync_self()
-            return r if r else None
-        else:
-            return 'User %s is not access to service' % abon.username
-    except Abon.DoesNotExist:
-        return "User with device with mac '%s' does not exist" % switch_mac
-    except Device.DoesNotExist:
+        customers = subscriber_index.lookup(switch_mac, switch_port)
+    except DeviceNotFound:
         return 'Device with mac %s not found' % switch_mac
-    except Port.DoesNotExist:
-        return 'Port %(switch_port)d on device with mac %(switch_mac)s does not exist' % {
-            'switch_port': int(switch_port),
-            'switch_mac': switch_mac
-        }
-    except MultipleObjectsReturned as e:
-        return 'MultipleObjectsReturned:' + ' '.join(
-            (type(e), e, str(switch_port))
-        )
+    if not customers:
+        return "User with device with mac '%s' does not exist" % switch_mac
+    if len(customers) > 1:
+        return 'MultipleObjectsReturned: %s' % switch_port
+    uid, is_dynamic_ip = customers[0]
+    if not is_dynamic_ip:
+        return 'User settings is not dynamic'
+    updated = Abon.objects.filter(pk=uid).exclude(ip_address=client_ip).update(ip_address=client_ip)
+    if not updated:
+        return 'Ip has already attached'
+    abon = Abon.objects.select_related('nas', 'current_tariff__tariff').get(pk=uid)
+    if not abon.is_access():
+        return 'User %s is not access to service' % abon.username
+    try:
+        # gateway is updated by celery, so that dhcp server does not wait for it
+        customer_nas_command.delay(uid, 'sync')
+    except OperationalError:
+        r = abon.nas_sync_self()
+        return str(r) if r else None
 
 
 def dhcp_expiry(client_ip: str) -> Optional[str]:
@@ -55,3 +49,128 @@ def dhcp_expiry(client_ip: str) -> Optional[str]:
 
 def dhcp_release(client_ip: str) -> Optional[str]:
     return dhcp_expiry(client_ip)
+
+
+def dhcp_batch(events: List[Dict]) -> List[Optional[str]]:
+    """
+    Process several dhcp events with a few queries.
+    Events are applied in order of passing.
+    :param events: list of dicts like in agent.commands.dhcp.dhcp_commit
+    :return: list of results, one for each event. Result is
+    the same as result of function for one event
+    """
+    results = [None] * len(events)
+
+    # subscribers on switch ports from index
+    on_port = {}
+    for i, ev in enumerate(events):
+        if ev.get('cmd') != 'commit':
+            continue
+        try:
+            on_port[i] = subscriber_index.lookup(ev.get('switch_mac'), ev.get('switch_port'))
+        except DeviceNotFound:
+            pass
+    uids = {customers[0][0] for customers in on_port.values() if len(customers) == 1}
+    abons = {
+        abon.pk: abon for abon in Abon.objects.filter(pk__in=uids).select_related(
+            'nas', 'current_tariff__tariff'
+        )
+    }
+
+    # subscribers of expired leases by one query
+    by_ip = {}
+    expired_ips = {ev.get('client_ip') for ev in events if ev.get('cmd') in ('expiry', 'release')}
+    expired_ips.discard(None)
+    for abon in Abon.objects.filter(ip_address__in=expired_ips, is_active=True).exclude(current_tariff=None):
+        by_ip.setdefault(abon.ip_address, abon)
+    for abon in abons.values():
+        if abon.ip_address and abon.current_tariff_id is not None:
+            by_ip[abon.ip_address] = abon
+
+    changed = {}
+    # events that changed each subscriber
+    changed_by = defaultdict(list)
+    to_sync = defaultdict(list)
+    for i, ev in enumerate(events):
+        action = ev.get('cmd')
+        client_ip = ev.get('client_ip')
+        if action is None:
+            results[i] = '"cmd" parameter is missing'
+            continue
+        if client_ip is None:
+            results[i] = '"client_ip" parameter is missing'
+            continue
+        if action in ('expiry', 'release'):
+            abon = by_ip.pop(client_ip, None)
+            if abon is None:
+                results[i] = "Subscriber with ip %s does not exist" % client_ip
+            else:
+                abon.ip_address = None
+                changed[abon.pk] = abon
+                changed_by[abon.pk].append(i)
+            continue
+        elif action != 'commit':
+            results[i] = '"cmd" parameter is invalid: %s' % action
+            continue
+
+        switch_mac = ev.get('switch_mac')
+        switch_port = ev.get('switch_port')
+        if i not in on_port:
+            results[i] = 'Device with mac %s not found' % switch_mac
+            continue
+        customers = on_port[i]
+        if not customers:
+            results[i] = "User with device with mac '%s' does not exist" % switch_mac
+            continue
+        if len(customers) > 1:
+            results[i] = 'MultipleObjectsReturned: %s' % switch_port
+            continue
+        abon = abons.get(customers[0][0])
+        if abon is None:
+            results[i] = "User with device with mac '%s' does not exist" % switch_mac
+            continue
+        if not abon.is_dynamic_ip:
+            results[i] = 'User settings is not dynamic'
+            continue
+        if client_ip == abon.ip_address:
+            results[i] = 'Ip has already attached'
+            continue
+        if by_ip.get(abon.ip_address) is abon:
+            del by_ip[abon.ip_address]
+        abon.ip_address = client_ip
+        if abon.current_tariff_id is not None:
+            by_ip[client_ip] = abon
+        changed[abon.pk] = abon
+        changed_by[abon.pk].append(i)
+        if abon.is_access():
+            to_sync[abon.nas].append((i, abon))
+        else:
+            results[i] = 'User %s is not access to service' % abon.username
+
+    errors = save_ips(changed.values())
+    for uid, error in errors.items():
+        for i in changed_by[uid]:
+            results[i] = error
+    for nas in tuple(to_sync.keys()):
+        to_sync[nas] = [(i, abon) for i, abon in to_sync[nas] if abon.pk not in errors]
+
+    # one connection for each gateway
+    for nas, items in to_sync.items():
+        if nas is None:
+            for i, abon in items:
+                results[i] = str(_('gateway required'))
+            continue
+        try:
+            mngr = nas.get_nas_manager()
+        except (NasFailedResult, NasNetworkError, ConnectionResetError) as e:
+            for i, abon in items:
+                results[i] = str(e)
+            continue
+        for i, abon in items:
+            try:
+                agent_abon = abon.build_agent_struct()
+                if agent_abon is not None:
+                    mngr.update_user(agent_abon)
+            except (NasFailedResult, NasNetworkError, ConnectionResetError) as e:
+                results[i] = str(e)
+    return results
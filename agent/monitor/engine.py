@@ -0,0 +1,173 @@
+#
+# Monitoring of devices without ICMP. Devices with snmp community are
+# checked by SNMP GET, the others by TCP connect, reset of connection
+# means that device is alive. All devices are checked every interval
+# by one event loop, state is chosen with parents of device in mind,
+# and only changes of states are passed to sink.
+#
+import asyncio
+import time
+from collections import namedtuple, defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from agent.monitor.snmp import SnmpProber
+
+# States, same as in devapp.models.Device.NETWORK_STATES
+UNDEFINED = 'und'
+UP = 'up'
+UNREACHABLE = 'unr'
+DOWN = 'dwn'
+
+# Seconds between checks of all devices
+CHECK_INTERVAL = 60
+
+# Seconds to wait for answer of device
+PROBE_TIMEOUT = 2.0
+
+# How many devices are checked at the same time, TCP checks
+# need a socket each, so keep it below limit of open files
+CONCURRENCY = 512
+
+# Port for TCP check of devices without snmp community
+TCP_PORT = 80
+
+# Device that was up is down after this count of failed checks in a row
+CONFIRM_CHECKS = 2
+
+# community is None for TCP check
+Target = namedtuple('Target', 'pk host community')
+
+# device id -> (old state, new state)
+Changes = Dict[int, Tuple[str, str]]
+
+
+async def tcp_probe(host: str, port: int, timeout: float) -> bool:
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        writer.close()
+        return True
+    except ConnectionRefusedError:
+        # device has answered by reset
+        return True
+    except (asyncio.TimeoutError, OSError):
+        return False
+
+
+def classify(alive: Dict[int, bool], parents: Dict[int, Optional[int]]) -> Dict[int, str]:
+    """
+    Device that does not answer is unreachable if its nearest checked
+    parent does not answer too, otherwise it is down
+    :param alive: device id -> is device answered
+    :param parents: device id -> id of parent device, for all devices,
+    so that parents that are not checked are passed through
+    """
+    states = {}
+    for pk, ok in alive.items():
+        if ok:
+            states[pk] = UP
+            continue
+        state = DOWN
+        seen = {pk}
+        parent = parents.get(pk)
+        while parent is not None and parent not in seen:
+            if parent in alive:
+                if not alive[parent]:
+                    state = UNREACHABLE
+                break
+            seen.add(parent)
+            parent = parents.get(parent)
+        states[pk] = state
+    return states
+
+
+class StateTracker(object):
+    def __init__(self, confirm=CONFIRM_CHECKS):
+        self.confirm = confirm
+        self.states = {}  # type: Dict[int, str]
+        self.fails = defaultdict(int)  # type: Dict[int, int]
+
+    def load(self, states: Dict[int, str]):
+        self.states.update(states)
+
+    def update(self, alive: Dict[int, bool], parents: Dict[int, Optional[int]]) -> Changes:
+        """
+        Apply results of check
+        :return: devices whose state is changed
+        """
+        effective = {}
+        for pk, ok in alive.items():
+            self.fails[pk] = 0 if ok else self.fails[pk] + 1
+            # single fail of device that was up is not trusted yet
+            effective[pk] = ok or (self.fails[pk] < self.confirm and self.states.get(pk) == UP)
+        changes = {}
+        for pk, state in classify(effective, parents).items():
+            old = self.states.get(pk, UNDEFINED)
+            if old != state:
+                changes[pk] = (old, state)
+                self.states[pk] = state
+        for pk in set(self.states.keys()) - set(alive.keys()):
+            # device is removed, or its address is removed
+            del self.states[pk]
+            self.fails.pop(pk, None)
+        return changes
+
+
+class Monitor(object):
+    def __init__(self, load_devices: Callable[[], Tuple[List[Target], Dict[int, Optional[int]], Dict[int, str]]],
+                 sink: Callable[[Changes], None], interval=CHECK_INTERVAL, timeout=PROBE_TIMEOUT,
+                 concurrency=CONCURRENCY, tcp_port=TCP_PORT, confirm=CONFIRM_CHECKS):
+        """
+        :param load_devices: returns devices for check, parents of all devices
+        and states of devices that are saved, it is called before each check,
+        so that changes of devices are seen
+        :param sink: receives changes of states
+        """
+        self.load_devices = load_devices
+        self.sink = sink
+        self.interval = interval
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.tcp_port = tcp_port
+        self.tracker = StateTracker(confirm)
+        self.snmp = None  # type: Optional[SnmpProber]
+
+    async def check(self, targets: Iterable[Target]) -> Dict[int, bool]:
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def check_one(target: Target):
+            async with sem:
+                if target.community:
+                    ok = await self.snmp.probe(target.host, target.community, self.timeout)
+                else:
+                    ok = await tcp_probe(target.host, self.tcp_port, self.timeout)
+                return target.pk, ok
+
+        return dict(await asyncio.gather(*(check_one(t) for t in targets)))
+
+    async def run(self, rounds: Optional[int] = None):
+        loop = asyncio.get_event_loop()
+        _, self.snmp = await loop.create_datagram_endpoint(SnmpProber, local_addr=('0.0.0.0', 0))
+        first = True
+        while rounds is None or rounds > 0:
+            started = time.monotonic()
+            # database is used from thread, so that checks are not blocked
+            targets, parents, states = await loop.run_in_executor(None, self.load_devices)
+            if first:
+                self.tracker.load(states)
+                first = False
+            alive = await self.check(targets)
+            changes = self.tracker.update(alive, parents)
+            if changes:
+                await loop.run_in_executor(None, self.sink, changes)
+            elapsed = time.monotonic() - started
+            counts = defaultdict(int)
+            for state in self.tracker.states.values():
+                counts[state] += 1
+            print('%d devices checked in %.1f sec: %d up, %d down, %d unreachable, %d changed' % (
+                len(alive), elapsed, counts[UP], counts[DOWN], counts[UNREACHABLE], len(changes)
+            ))
+            if rounds is not None:
+                rounds -= 1
+                if not rounds:
+                    break
+            await asyncio.sleep(max(self.interval - elapsed, 0))
@@ -0,0 +1,124 @@
+#
+# Minimal SNMP for checking devices: GET request of sysUpTime is encoded
+# by hand, and only request id is read from response. All requests go
+# through one udp socket, so that thousands of devices are checked
+# without thousands of sockets.
+#
+import asyncio
+import random
+from typing import Optional, Tuple
+
+SYS_UPTIME = '1.3.6.1.2.1.1.3.0'
+SNMP_PORT = 161
+
+# version field of SNMPv2c
+VERSION_2C = 1
+
+
+def _length(n: int) -> bytes:
+    if n < 0x80:
+        return bytes((n,))
+    b = n.to_bytes((n.bit_length() + 7) // 8, 'big')
+    return bytes((0x80 | len(b),)) + b
+
+
+def _tlv(tag: int, value: bytes) -> bytes:
+    return bytes((tag,)) + _length(len(value)) + value
+
+
+def _integer(v: int) -> bytes:
+    return _tlv(0x02, v.to_bytes(v.bit_length() // 8 + 1, 'big', signed=True))
+
+
+def _oid(oid: str) -> bytes:
+    parts = [int(p) for p in oid.strip('.').split('.')]
+    body = bytearray((40 * parts[0] + parts[1],))
+    for p in parts[2:]:
+        chunk = [p & 0x7f]
+        p >>= 7
+        while p:
+            chunk.append(0x80 | (p & 0x7f))
+            p >>= 7
+        body.extend(reversed(chunk))
+    return _tlv(0x06, bytes(body))
+
+
+def get_request(community: str, request_id: int, oid=SYS_UPTIME) -> bytes:
+    varbinds = _tlv(0x30, _tlv(0x30, _oid(oid) + b'\x05\x00'))
+    pdu = _tlv(0xa0, _integer(request_id) + _integer(0) + _integer(0) + varbinds)
+    return _tlv(0x30, _integer(VERSION_2C) + _tlv(0x04, community.encode()) + pdu)
+
+
+def _read(data: bytes, pos: int) -> Tuple[int, int, int]:
+    """
+    :return: tag, start and end of value
+    """
+    tag, length = data[pos], data[pos + 1]
+    pos += 2
+    if length & 0x80:
+        n = length & 0x7f
+        length = int.from_bytes(data[pos:pos + n], 'big')
+        pos += n
+    return tag, pos, pos + length
+
+
+def response_id(data: bytes) -> Optional[int]:
+    """
+    Request id of response, None if it is not SNMP response
+    """
+    try:
+        tag, start, end = _read(data, 0)
+        if tag != 0x30:
+            return
+        # version, community, pdu
+        tag, start, end = _read(data, start)
+        tag, start, end = _read(data, end)
+        tag, start, end = _read(data, end)
+        if tag != 0xa2:
+            return
+        tag, start, end = _read(data, start)
+        if tag != 0x02:
+            return
+        return int.from_bytes(data[start:end], 'big', signed=True)
+    except IndexError:
+        return
+
+
+class SnmpProber(asyncio.DatagramProtocol):
+    """
+    Device is alive if it answers anything to request
+    """
+
+    def __init__(self):
+        self.transport = None
+        # request id -> future of response
+        self.waiters = {}
+        self.request_id = random.randrange(1, 2 ** 30)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        fut = self.waiters.pop(response_id(data), None)
+        if fut is not None and not fut.done():
+            fut.set_result(True)
+
+    def _next_id(self) -> int:
+        self.request_id = self.request_id % (2 ** 31 - 1) + 1
+        return self.request_id
+
+    async def probe(self, host: str, community: str, timeout: float, retries=1) -> bool:
+        loop = asyncio.get_event_loop()
+        for attempt in range(retries + 1):
+            request_id = self._next_id()
+            fut = self.waiters[request_id] = loop.create_future()
+            try:
+                self.transport.sendto(get_request(community, request_id), (host, SNMP_PORT))
+                return await asyncio.wait_for(fut, timeout)
+            except asyncio.TimeoutError:
+                pass
+            except OSError:
+                return False
+            finally:
+                self.waiters.pop(request_id, None)
+        return False
@@ -0,0 +1,200 @@
+#
+# NetFlow collector. Flows are summed per subscriber in memory,
+# and once per interval sums are passed to sink for saving.
+#
+import asyncio
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Iterable, Tuple, Optional
+
+import numpy as np
+
+from agent.netflow.decoder import decode, V9Decoder, NetflowDecodeError, Flow
+from agent.netflow.online import OnlineState
+from agent.netflow.resolver import IpResolver, UNKNOWN
+from agent.netflow.talkers import TopTalkers
+
+# How often sums are saved, in seconds
+FLUSH_INTERVAL = 60
+
+# Flows are resolved to subscribers by batches of this size
+RESOLVE_BATCH = 4096
+
+# subscriber id -> [ip, octets, packets]
+Counters = Dict[int, List[int]]
+
+
+class FlowAggregator(object):
+    """
+    Sums traffic of flows per subscriber. Flow belongs to subscriber
+    whose address is destination of flow, or source if destination
+    is not an address of subscriber. Flows are buffered and resolved
+    to subscribers by batches.
+    """
+
+    def __init__(self, resolver: IpResolver, batch_size=RESOLVE_BATCH):
+        self.resolver = resolver
+        self.batch_size = batch_size
+        self.pending = []  # type: List[Flow]
+        self.counters = {}  # type: Counters
+        self.flows = 0
+        self.unknown = 0
+
+    def add(self, flows: List[Flow]):
+        self.pending.extend(flows)
+        if len(self.pending) >= self.batch_size:
+            self._aggregate()
+
+    def _aggregate(self):
+        if not self.pending:
+            return
+        flows = np.array(self.pending, dtype=np.uint64)
+        self.pending = []
+        self.flows += len(flows)
+        src = flows[:, 0].astype(np.uint32)
+        ips = flows[:, 1].astype(np.uint32)
+        uids = self.resolver.resolve(ips)
+        miss = np.flatnonzero(uids == UNKNOWN)
+        if len(miss):
+            ips[miss] = src[miss]
+            uids[miss] = self.resolver.resolve(src[miss])
+        known = np.flatnonzero(uids != UNKNOWN)
+        self.unknown += len(flows) - len(known)
+        if not len(known):
+            return
+
+        # sum flows of each subscriber
+        order = known[np.argsort(uids[known], kind='stable')]
+        uids = uids[order]
+        starts = np.flatnonzero(np.r_[True, uids[1:] != uids[:-1]])
+        octets = np.add.reduceat(flows[order, 2], starts)
+        packets = np.add.reduceat(flows[order, 3], starts)
+
+        counters = self.counters
+        for uid, ip, o, p in zip(uids[starts].tolist(), ips[order[starts]].tolist(),
+                                 octets.tolist(), packets.tolist()):
+            c = counters.get(uid)
+            if c is None:
+                counters[uid] = [ip, o, p]
+            else:
+                c[1] += o
+                c[2] += p
+
+    def swap(self) -> Counters:
+        """
+        Take sums collected since last call
+        """
+        self._aggregate()
+        counters = self.counters
+        self.counters = {}
+        return counters
+
+
+class NetflowProtocol(asyncio.DatagramProtocol):
+    def __init__(self, aggregator: FlowAggregator, v9: V9Decoder):
+        self.aggregator = aggregator
+        self.v9 = v9
+        self.errors = 0
+
+    def datagram_received(self, data: bytes, addr):
+        try:
+            flows = decode(data, addr[0], self.v9)
+        except NetflowDecodeError:
+            self.errors += 1
+            return
+        self.aggregator.add(flows)
+
+
+class Collector(object):
+    """
+    Listens NetFlow on udp ports and saves traffic
+    of subscribers every interval
+    """
+
+    def __init__(self, ports: Iterable[int], sink: Callable[[datetime, Counters], None],
+                 load_subscribers: Callable[[], Iterable[Tuple[str, int, Optional[int], Optional[int]]]],
+                 publish_talkers: Optional[Callable[[dict], None]] = None,
+                 load_seen: Optional[Callable[[], Iterable[Tuple[int, int]]]] = None,
+                 publish_online: Optional[Callable[[int, Dict[int, int]], None]] = None,
+                 interval=FLUSH_INTERVAL, host='0.0.0.0'):
+        """
+        :param sink: saves sums of traffic for time of interval end
+        :param load_subscribers: returns (address or network, subscriber id, group id, gateway id),
+        it is called on every flush, so that changes of addresses are seen
+        :param publish_talkers: receives snapshot of top talkers after every flush
+        :param load_seen: returns (subscriber id, unix time of last traffic), it is
+        called on start, so that subscribers are online from the first flush
+        :param publish_online: receives count of online subscribers, and
+        counts of each group, after every flush
+        """
+        self.ports = tuple(ports)
+        self.host = host
+        self.sink = sink
+        self.load_subscribers = load_subscribers
+        self.publish_talkers = publish_talkers
+        self.load_seen = load_seen
+        self.publish_online = publish_online
+        self.online = OnlineState()
+        self.interval = interval
+        self.talkers = TopTalkers(interval)
+        self.resolver = IpResolver()
+        self.aggregator = FlowAggregator(self.resolver)
+        self.v9 = V9Decoder()
+        self.protocols = []
+
+    async def flush(self, loop, last_flush: float) -> float:
+        counters = self.aggregator.swap()
+        flows, unknown = self.aggregator.flows, self.aggregator.unknown
+        self.aggregator.flows = self.aggregator.unknown = 0
+        now = time.monotonic()
+        errors = sum(p.errors for p in self.protocols)
+        print('%d flows, %.0f flows/sec, %d of unknown addresses, %d subscribers, %d broken packets' % (
+            flows, flows / (now - last_flush), unknown, len(counters), errors
+        ))
+        self.talkers.add(counters)
+        timestamp = int(time.time())
+        self.online.touch(counters.keys(), timestamp)
+        # database is used from thread, so that receiving is not blocked
+        if counters:
+            await loop.run_in_executor(None, self.sink, datetime.now(), counters)
+        if self.publish_talkers is not None:
+            await loop.run_in_executor(None, self.publish_talkers, self.talkers.snapshot())
+        if self.publish_online is not None:
+            await loop.run_in_executor(None, self.publish_online, *self.online.counts(timestamp))
+        await self.update_subscribers(loop)
+        return now
+
+    async def update_subscribers(self, loop):
+        # addresses are loaded and arrays are built in thread, so that receiving
+        # is not stalled, and resolver is replaced here at once, so that
+        # resolving never sees arrays half changed
+        subscribers = await loop.run_in_executor(None, self.load_subscribers)
+        resolver, changed = await loop.run_in_executor(None, self.resolver.synced, [
+            (address, uid) for address, uid, group_id, nas_id in subscribers
+        ])
+        self.resolver = self.aggregator.resolver = resolver
+        if changed:
+            print('%d subscribers changed addresses' % changed)
+        self.talkers.set_owners({
+            uid: (group_id, nas_id) for address, uid, group_id, nas_id in subscribers
+        })
+        self.online.set_groups({
+            uid: group_id for address, uid, group_id, nas_id in subscribers
+        })
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        await self.update_subscribers(loop)
+        if self.load_seen is not None:
+            self.online.load(await loop.run_in_executor(None, self.load_seen))
+        for port in self.ports:
+            _, protocol = await loop.create_datagram_endpoint(
+                lambda: NetflowProtocol(self.aggregator, self.v9),
+                local_addr=(self.host, port)
+            )
+            self.protocols.append(protocol)
+        last_flush = time.monotonic()
+        while True:
+            # flush at start of each interval of wall clock
+            await asyncio.sleep(self.interval - time.time() % self.interval)
+            last_flush = await self.flush(loop, last_flush)
@@ -0,0 +1,134 @@
+#
+# Decoding of NetFlow v5 and v9 packets. Only fields that are
+# needed for traffic accounting are taken from flows.
+#
+from struct import Struct
+from typing import List, Tuple
+
+# (source ip, destination ip, octets, packets), ips are integers
+Flow = Tuple[int, int, int, int]
+
+V5_HEADER = Struct('!HHIIIIBBH')
+V5_RECORD = Struct('!IIIHHIIIIHHBBBBHHBBH')
+
+V9_HEADER = Struct('!HHIIII')
+V9_FLOWSET_HEADER = Struct('!HH')
+V9_TEMPLATE_FIELD = Struct('!HH')
+
+# Field types of NetFlow v9
+IN_BYTES = 1
+IN_PKTS = 2
+IPV4_SRC_ADDR = 8
+IPV4_DST_ADDR = 12
+
+TEMPLATE_FLOWSET_ID = 0
+OPTIONS_TEMPLATE_FLOWSET_ID = 1
+
+
+class NetflowDecodeError(ValueError):
+    pass
+
+
+def decode_v5(data: bytes) -> List[Flow]:
+    if len(data) < V5_HEADER.size:
+        raise NetflowDecodeError('Packet is too short')
+    version, count = V5_HEADER.unpack_from(data)[:2]
+    end = V5_HEADER.size + count * V5_RECORD.size
+    if len(data) < end:
+        raise NetflowDecodeError('Packet is too short for %d flows' % count)
+    return [
+        (r[0], r[1], r[6], r[5])
+        for r in V5_RECORD.iter_unpack(data[V5_HEADER.size:end])
+    ]
+
+
+class V9Template(object):
+    __slots__ = ('length', 'src', 'dst', 'octets', 'packets')
+
+    def __init__(self, fields: List[Tuple[int, int]]):
+        """
+        :param fields: list of pairs (type, length) of template fields
+        """
+        offsets = {}
+        offset = 0
+        for field_type, field_len in fields:
+            offsets.setdefault(field_type, (offset, offset + field_len))
+            offset += field_len
+        self.length = offset
+        self.src = offsets.get(IPV4_SRC_ADDR)
+        self.dst = offsets.get(IPV4_DST_ADDR)
+        self.octets = offsets.get(IN_BYTES)
+        self.packets = offsets.get(IN_PKTS)
+
+    @property
+    def is_useful(self) -> bool:
+        return None not in (self.src, self.dst, self.octets) and self.length > 0
+
+    def decode(self, data: bytes, start: int, end: int) -> List[Flow]:
+        flows = []
+        from_bytes = int.from_bytes
+        src, dst, octets, packets = self.src, self.dst, self.octets, self.packets
+        for pos in range(start, end - self.length + 1, self.length):
+            flows.append((
+                from_bytes(data[pos + src[0]:pos + src[1]], 'big'),
+                from_bytes(data[pos + dst[0]:pos + dst[1]], 'big'),
+                from_bytes(data[pos + octets[0]:pos + octets[1]], 'big'),
+                from_bytes(data[pos + packets[0]:pos + packets[1]], 'big') if packets else 0
+            ))
+        return flows
+
+
+class V9Decoder(object):
+    """
+    Templates of v9 are sent by exporter from time to time,
+    data of unknown template is skipped until template arrives
+    """
+
+    def __init__(self):
+        # (exporter address, source id, template id) -> template
+        self.templates = {}
+
+    def _read_templates(self, exporter: str, source_id: int, data: bytes, start: int, end: int):
+        pos = start
+        while pos + 4 <= end:
+            template_id, field_count = V9_TEMPLATE_FIELD.unpack_from(data, pos)
+            pos += 4
+            if pos + field_count * 4 > end:
+                raise NetflowDecodeError('Template %d is broken' % template_id)
+            fields = [V9_TEMPLATE_FIELD.unpack_from(data, pos + i * 4) for i in range(field_count)]
+            pos += field_count * 4
+            self.templates[(exporter, source_id, template_id)] = V9Template(fields)
+
+    def decode(self, data: bytes, exporter: str) -> List[Flow]:
+        if len(data) < V9_HEADER.size:
+            raise NetflowDecodeError('Packet is too short')
+        source_id = V9_HEADER.unpack_from(data)[5]
+        flows = []
+        pos = V9_HEADER.size
+        while pos + V9_FLOWSET_HEADER.size <= len(data):
+            flowset_id, length = V9_FLOWSET_HEADER.unpack_from(data, pos)
+            if length < V9_FLOWSET_HEADER.size or pos + length > len(data):
+                raise NetflowDecodeError('Flowset %d is broken' % flowset_id)
+            start, end = pos + V9_FLOWSET_HEADER.size, pos + length
+            if flowset_id == TEMPLATE_FLOWSET_ID:
+                self._read_templates(exporter, source_id, data, start, end)
+            elif flowset_id > 255:
+                template = self.templates.get((exporter, source_id, flowset_id))
+                if template is not None and template.is_useful:
+                    flows.extend(template.decode(data, start, end))
+            pos = end
+        return flows
+
+
+def decode(data: bytes, exporter: str, v9: V9Decoder) -> List[Flow]:
+    """
+    Decode packet of any supported version
+    """
+    if len(data) < 2:
+        raise NetflowDecodeError('Packet is too short')
+    version = int.from_bytes(data[:2], 'big')
+    if version == 5:
+        return decode_v5(data)
+    elif version == 9:
+        return v9.decode(data, exporter)
+    raise NetflowDecodeError('Unsupported version %d' % version)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+#
+# Generator of NetFlow packets for load tests of collector.
+# Sends flows of random addresses from passed network.
+#
+import socket
+import time
+from argparse import ArgumentParser
+from ipaddress import ip_network
+from random import randrange
+from struct import Struct
+from typing import List, Tuple
+
+V5_HEADER = Struct('!HHIIIIBBH')
+V5_RECORD = Struct('!IIIHHIIIIHHBBBBHHBBH')
+V5_MAX_FLOWS = 30
+
+V9_HEADER = Struct('!HHIIII')
+V9_TEMPLATE_ID = 256
+# IPV4_SRC_ADDR, IPV4_DST_ADDR, IN_BYTES, IN_PKTS
+V9_TEMPLATE_FIELDS = ((8, 4), (12, 4), (1, 4), (2, 4))
+V9_RECORD = Struct('!IIII')
+V9_MAX_FLOWS = 60
+# Template is repeated in each of this count of packets
+V9_TEMPLATE_PERIOD = 20
+
+
+def make_v5_packet(flows: List[Tuple[int, int, int, int]], seq: int) -> bytes:
+    now = time.time()
+    header = V5_HEADER.pack(5, len(flows), 0, int(now), int(now % 1 * 1e9), seq, 0, 0, 0)
+    return header + b''.join(
+        V5_RECORD.pack(src, dst, 0, 0, 0, packets, octets, 0, 0, 0, 0, 0, 0, 6, 0, 0, 0, 0, 0, 0)
+        for src, dst, octets, packets in flows
+    )
+
+
+def make_v9_packet(flows: List[Tuple[int, int, int, int]], seq: int,
+                   source_id=0, with_template=False) -> bytes:
+    flowsets = []
+    if with_template:
+        template = Struct('!HH').pack(V9_TEMPLATE_ID, len(V9_TEMPLATE_FIELDS)) + b''.join(
+            Struct('!HH').pack(*f) for f in V9_TEMPLATE_FIELDS
+        )
+        flowsets.append(Struct('!HH').pack(0, len(template) + 4) + template)
+    if flows:
+        records = b''.join(V9_RECORD.pack(*f) for f in flows)
+        flowsets.append(Struct('!HH').pack(V9_TEMPLATE_ID, len(records) + 4) + records)
+    count = len(flows) + (1 if with_template else 0)
+    header = V9_HEADER.pack(9, count, 0, int(time.time()), seq, source_id)
+    return header + b''.join(flowsets)
+
+
+def random_flows(count: int, first_ip: int, size: int) -> List[Tuple[int, int, int, int]]:
+    return [
+        (randrange(0x01000000, 0xdf000000), first_ip + randrange(size),
+         randrange(64, 1500 * 100), randrange(1, 100))
+        for _ in range(count)
+    ]
+
+
+def main():
+    parser = ArgumentParser(description='Send NetFlow packets to collector')
+    parser.add_argument('host')
+    parser.add_argument('port', type=int)
+    parser.add_argument('-v', '--version', type=int, choices=(5, 9), default=5)
+    parser.add_argument('-r', '--rate', type=int, default=10000, help='flows per second, 0 is unlimited')
+    parser.add_argument('-n', '--network', default='10.0.0.0/16', help='addresses of subscribers')
+    parser.add_argument('-d', '--duration', type=float, default=10, help='seconds')
+    args = parser.parse_args()
+
+    net = ip_network(args.network)
+    first_ip, size = int(net.network_address), net.num_addresses
+    per_packet = V5_MAX_FLOWS if args.version == 5 else V9_MAX_FLOWS
+    sk = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    addr = (args.host, args.port)
+    sent = seq = 0
+    start = time.monotonic()
+    report_time = start
+    report_sent = 0
+    while True:
+        now = time.monotonic()
+        if now - start >= args.duration:
+            break
+        if args.rate and sent > args.rate * (now - start):
+            time.sleep(0.001)
+            continue
+        flows = random_flows(per_packet, first_ip, size)
+        if args.version == 5:
+            packet = make_v5_packet(flows, seq)
+        else:
+            packet = make_v9_packet(flows, seq, with_template=seq % V9_TEMPLATE_PERIOD == 0)
+        sk.sendto(packet, addr)
+        seq += 1
+        sent += len(flows)
+        if now - report_time >= 1:
+            print('%d flows/sec' % ((sent - report_sent) / (now - report_time)))
+            report_time, report_sent = now, sent
+    elapsed = time.monotonic() - start
+    print('sent %d flows in %d packets, %d flows/sec' % (sent, seq, sent / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#
+# Online state of subscribers. Time of last traffic is kept in array
+# indexed by subscriber id, so that online counts of all groups
+# are taken at once by numpy.
+#
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+# Subscriber is online if he had traffic during this time, seconds
+ONLINE_TIMEOUT = 55 * 60
+
+
+class OnlineState(object):
+    def __init__(self, timeout=ONLINE_TIMEOUT):
+        self.timeout = timeout
+        self.last_seen = np.zeros(0, dtype=np.uint32)
+        # group of each subscriber, -1 if he has no group
+        self.groups = np.zeros(0, dtype=np.int64)
+
+    def _grow(self, max_uid: int):
+        if max_uid >= len(self.last_seen):
+            size = max(max_uid + 1, len(self.last_seen) * 2, 1024)
+            self.last_seen = np.pad(self.last_seen, (0, size - len(self.last_seen)))
+            self.groups = np.pad(self.groups, (0, size - len(self.groups)), constant_values=-1)
+
+    def touch(self, uids: Iterable[int], timestamp: int):
+        uids = np.fromiter(uids, dtype=np.int64)
+        if len(uids):
+            self._grow(int(uids.max()))
+            self.last_seen[uids] = timestamp
+
+    def load(self, seen: Iterable[Tuple[int, int]]):
+        """
+        :param seen: (subscriber id, unix time of last traffic)
+        """
+        seen = np.array(list(seen), dtype=np.int64).reshape(-1, 2)
+        if len(seen):
+            self._grow(int(seen[:, 0].max()))
+            np.maximum.at(self.last_seen, seen[:, 0], seen[:, 1].astype(np.uint32))
+
+    def set_groups(self, groups: Dict[int, Optional[int]]):
+        """
+        :param groups: subscriber id -> group id
+        """
+        if groups:
+            self._grow(max(groups))
+        self.groups[:] = -1
+        uids = np.fromiter(groups.keys(), dtype=np.int64, count=len(groups))
+        self.groups[uids] = np.fromiter(
+            (-1 if g is None else g for g in groups.values()), dtype=np.int64, count=len(groups)
+        )
+
+    def online(self, now: int) -> np.ndarray:
+        """
+        :return: ids of online subscribers
+        """
+        return np.flatnonzero(self.last_seen > now - self.timeout)
+
+    def counts(self, now: int) -> Tuple[int, Dict[int, int]]:
+        """
+        :return: count of all online subscribers, and counts of each group
+        """
+        groups = self.groups[self.online(now)]
+        total = len(groups)
+        groups = groups[groups >= 0]
+        ids, counts = np.unique(groups, return_counts=True)
+        return total, dict(zip(ids.tolist(), counts.tolist()))
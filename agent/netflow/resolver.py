@@ -0,0 +1,220 @@
+#
+# Resolving of ip addresses of flows to subscribers. Addresses are
+# kept in sorted NumPy arrays and resolved by vectorized binary search.
+#
+from copy import copy
+from ipaddress import ip_network
+from typing import Iterable, Tuple, Optional
+
+import numpy as np
+
+# Value of uid for addresses that do not belong to anybody
+UNKNOWN = -1
+
+# When part of changed addresses is greater than this,
+# arrays are built again instead of patching
+REBUILD_RATIO = 0.1
+
+
+def _parse(address: str) -> Optional[Tuple[int, int]]:
+    """
+    :return: first and last addresses of network as integers, or None for ipv6
+    """
+    try:
+        net = ip_network(address, strict=False)
+    except ValueError:
+        return
+    if net.version != 4:
+        return
+    return int(net.network_address), int(net.broadcast_address)
+
+
+class IpResolver(object):
+    """
+    Single addresses are searched by exact match, and networks are searched
+    by range for addresses that are not found as single. Networks must
+    not overlap each other, overlapping network is ignored.
+    """
+
+    def __init__(self):
+        # address or network of subscriber in text view, by uid
+        self.addresses = {}
+        self._hosts = np.empty(0, dtype=np.uint32)
+        self._host_uids = np.empty(0, dtype=np.int64)
+        self._net_starts = np.empty(0, dtype=np.uint32)
+        self._net_ends = np.empty(0, dtype=np.uint32)
+        self._net_uids = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self._hosts) + len(self._net_starts)
+
+    def build(self, pairs: Iterable[Tuple[str, int]]):
+        """
+        Build arrays from scratch
+        :param pairs: (address or network, uid)
+        """
+        self.addresses = {uid: str(address) for address, uid in pairs}
+        hosts, nets = [], []
+        for uid, address in self.addresses.items():
+            r = _parse(address)
+            if r is None:
+                continue
+            if r[0] == r[1]:
+                hosts.append((r[0], uid))
+            else:
+                nets.append((r[0], r[1], uid))
+        hosts.sort()
+        self._hosts = np.fromiter((h[0] for h in hosts), dtype=np.uint32, count=len(hosts))
+        self._host_uids = np.fromiter((h[1] for h in hosts), dtype=np.int64, count=len(hosts))
+        nets.sort()
+        free_from = 0
+        starts, ends, uids = [], [], []
+        for start, end, uid in nets:
+            if start < free_from:
+                # overlaps previous network
+                continue
+            starts.append(start)
+            ends.append(end)
+            uids.append(uid)
+            free_from = end + 1
+        self._net_starts = np.array(starts, dtype=np.uint32)
+        self._net_ends = np.array(ends, dtype=np.uint32)
+        self._net_uids = np.array(uids, dtype=np.int64)
+
+    def _remove_hosts(self, hosts: np.ndarray, uids: np.ndarray):
+        """
+        Remove entries by address and uid, the same address
+        may belong to subscribers of different gateways
+        """
+        lefts = np.searchsorted(self._hosts, hosts, side='left')
+        rights = np.searchsorted(self._hosts, hosts, side='right')
+        idx = []
+        for left, right, uid in zip(lefts, rights, uids):
+            found = np.flatnonzero(self._host_uids[left:right] == uid)
+            if len(found):
+                idx.append(left + found[0])
+        self._hosts = np.delete(self._hosts, idx)
+        self._host_uids = np.delete(self._host_uids, idx)
+
+    def _insert_hosts(self, hosts: np.ndarray, uids: np.ndarray):
+        order = np.argsort(hosts)
+        hosts, uids = hosts[order], uids[order]
+        idx = np.searchsorted(self._hosts, hosts)
+        self._hosts = np.insert(self._hosts, idx, hosts)
+        self._host_uids = np.insert(self._host_uids, idx, uids)
+
+    def sync(self, pairs: Iterable[Tuple[str, int]]) -> int:
+        """
+        Apply only changed addresses of subscribers
+        :param pairs: actual (address or network, uid) of all subscribers
+        :return: count of changed subscribers
+        """
+        actual = {uid: str(address) for address, uid in pairs}
+        old = self.addresses
+        changed = [uid for uid, address in actual.items() if old.get(uid) != address]
+        changed.extend(uid for uid in old if uid not in actual)
+        if not changed:
+            return 0
+        is_net_changed = any(
+            (r is not None and r[0] != r[1])
+            for uid in changed
+            for r in (_parse(old.get(uid, '')), _parse(actual.get(uid, '')))
+        )
+        if is_net_changed or len(changed) > len(self) * REBUILD_RATIO:
+            self.build((address, uid) for uid, address in actual.items())
+            return len(changed)
+
+        removed = [(_parse(old[uid]), uid) for uid in changed if uid in old]
+        removed = [(r[0], uid) for r, uid in removed if r is not None]
+        if removed:
+            self._remove_hosts(
+                np.array([r[0] for r in removed], dtype=np.uint32),
+                np.array([r[1] for r in removed], dtype=np.int64)
+            )
+        added = [(_parse(actual[uid]), uid) for uid in changed if uid in actual]
+        added = [(r[0], uid) for r, uid in added if r is not None]
+        if added:
+            self._insert_hosts(
+                np.array([a[0] for a in added], dtype=np.uint32),
+                np.array([a[1] for a in added], dtype=np.int64)
+            )
+        self.addresses = actual
+        return len(changed)
+
+    def synced(self, pairs: Iterable[Tuple[str, int]]) -> Tuple['IpResolver', int]:
+        """
+        Same as sync, but changes are applied to copy of resolver, so that
+        it may be built in other thread while this one is resolving.
+        Arrays are never changed in place, so copy shares them until changed.
+        :return: new resolver and count of changed subscribers
+        """
+        resolver = copy(self)
+        return resolver, resolver.sync(pairs)
+
+    def resolve(self, ips: np.ndarray) -> np.ndarray:
+        """
+        :param ips: array of ipv4 addresses as integers
+        :return: array of subscriber ids, UNKNOWN for not found addresses
+        """
+        ips = np.asarray(ips, dtype=np.uint32)
+        res = np.full(len(ips), UNKNOWN, dtype=np.int64)
+        if len(self._hosts):
+            idx = np.searchsorted(self._hosts, ips)
+            np.minimum(idx, len(self._hosts) - 1, out=idx)
+            found = self._hosts[idx] == ips
+            res[found] = self._host_uids[idx[found]]
+        if len(self._net_starts):
+            rest = np.flatnonzero(res == UNKNOWN)
+            if len(rest):
+                rest_ips = ips[rest]
+                idx = np.searchsorted(self._net_starts, rest_ips, side='right') - 1
+                ok = idx >= 0
+                idx[~ok] = 0
+                ok &= rest_ips <= self._net_ends[idx]
+                res[rest[ok]] = self._net_uids[idx[ok]]
+        return res
+
+    def resolve_one(self, ip: int) -> Optional[int]:
+        uid = int(self.resolve(np.array((ip,), dtype=np.uint32))[0])
+        if uid != UNKNOWN:
+            return uid
+
+
+def benchmark(subscribers=100000, flows=5000000, networks=1000):
+    """
+    Measure how many flow addresses are resolved per second
+    """
+    from time import perf_counter
+    from ipaddress import ip_address
+    rng = np.random.default_rng(1)
+    hosts = rng.choice(2 ** 24, subscribers, replace=False).astype(np.uint32) + 0x0a000000
+    pairs = [(str(ip_address(int(h))), i) for i, h in enumerate(hosts)]
+    pairs.extend(
+        ('172.%d.%d.0/24' % (16 + i // 256, i % 256), subscribers + i) for i in range(networks)
+    )
+    resolver = IpResolver()
+    t = perf_counter()
+    resolver.build(pairs)
+    print('build of %d entries: %.3f sec' % (len(resolver), perf_counter() - t))
+
+    # half of flows are to known addresses
+    ips = np.where(
+        rng.random(flows) < 0.5,
+        rng.choice(hosts, flows),
+        rng.integers(0, 2 ** 32, flows, dtype=np.uint32)
+    ).astype(np.uint32)
+    t = perf_counter()
+    uids = resolver.resolve(ips)
+    elapsed = perf_counter() - t
+    print('resolved %d addresses, %d found: %.3f sec, %.1f millions per second' % (
+        flows, (uids != UNKNOWN).sum(), elapsed, flows / elapsed / 1e6
+    ))
+
+    changed = [(str(ip_address(int(h) + 2 ** 24)), i) for i, h in enumerate(hosts[:100])]
+    t = perf_counter()
+    resolver.sync(changed + pairs[100:])
+    print('sync of 100 changed addresses: %.3f sec' % (perf_counter() - t))
+
+
+if __name__ == '__main__':
+    benchmark()
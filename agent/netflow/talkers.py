@@ -0,0 +1,121 @@
+#
+# Top talkers of sliding windows of time. Sums of each flush interval
+# are kept in ring of rows, column for each subscriber, so that sums of
+# window are taken by numpy without any query to database.
+#
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Windows of time in seconds
+WINDOWS = (60, 300, 3600)
+
+# Count of talkers in each of lists
+TOP_COUNT = 10
+
+
+class TopTalkers(object):
+    def __init__(self, interval: int, windows: Iterable[int] = WINDOWS, count=TOP_COUNT):
+        """
+        :param interval: seconds between calls of add
+        """
+        self.interval = interval
+        self.windows = tuple(windows)
+        self.count = count
+        self.slots = max(max(self.windows) // interval, 1)
+        self.pos = 0
+        self.filled = 0
+        # subscriber id -> column
+        self.columns = {}  # type: Dict[int, int]
+        self.uids = np.empty(0, dtype=np.int64)
+        self.octets = np.zeros((self.slots, 0), dtype=np.float64)
+        # group and gateway of each column, -1 if subscriber has no one
+        self.groups = np.empty(0, dtype=np.int64)
+        self.nases = np.empty(0, dtype=np.int64)
+        self.owners = {}  # type: Dict[int, Tuple[Optional[int], Optional[int]]]
+
+    def _column(self, uid: int) -> int:
+        col = self.columns.get(uid)
+        if col is None:
+            col = self.columns[uid] = len(self.columns)
+            if col >= self.octets.shape[1]:
+                grow = max(col, 64)
+                self.octets = np.pad(self.octets, ((0, 0), (0, grow)))
+                self.uids = np.pad(self.uids, (0, grow))
+                self.groups = np.pad(self.groups, (0, grow), constant_values=-1)
+                self.nases = np.pad(self.nases, (0, grow), constant_values=-1)
+            group_id, nas_id = self.owners.get(uid, (None, None))
+            self.uids[col] = uid
+            self.groups[col] = -1 if group_id is None else group_id
+            self.nases[col] = -1 if nas_id is None else nas_id
+        return col
+
+    def set_owners(self, owners: Dict[int, Tuple[Optional[int], Optional[int]]]):
+        """
+        :param owners: subscriber id -> (group id, gateway id)
+        """
+        self.owners = owners
+        for uid, col in self.columns.items():
+            group_id, nas_id = owners.get(uid, (None, None))
+            self.groups[col] = -1 if group_id is None else group_id
+            self.nases[col] = -1 if nas_id is None else nas_id
+
+    def add(self, counters: Dict[int, List[int]]):
+        """
+        Push sums of interval, the oldest interval is forgotten
+        :param counters: subscriber id -> [ip, octets, packets]
+        """
+        self.pos = (self.pos + 1) % self.slots
+        self.filled = min(self.filled + 1, self.slots)
+        cols = np.fromiter((self._column(uid) for uid in counters), dtype=np.int64, count=len(counters))
+        row = self.octets[self.pos]
+        row[:] = 0
+        row[cols] = np.fromiter((c[1] for c in counters.values()), dtype=np.float64, count=len(counters))
+
+    def window_sums(self, seconds: int) -> Tuple[np.ndarray, int]:
+        """
+        :return: octets of each column, and seconds that are really
+        summed, it is less than window while collector just started
+        """
+        n = min(max(seconds // self.interval, 1), self.filled)
+        rows = (self.pos - np.arange(n)) % self.slots
+        return self.octets[rows, :len(self.columns)].sum(axis=0), max(n, 1) * self.interval
+
+    def _top(self, sums: np.ndarray, cols: np.ndarray, seconds: int) -> List[list]:
+        if len(cols) > self.count:
+            cols = cols[np.argpartition(-sums[cols], self.count - 1)[:self.count]]
+        cols = cols[np.argsort(-sums[cols], kind='stable')]
+        cols = cols[sums[cols] > 0]
+        return [
+            [int(self.uids[c]), int(sums[c]), round(float(sums[c]) * 8 / seconds / 2 ** 20, 3)]
+            for c in cols
+        ]
+
+    def _top_by(self, sums: np.ndarray, keys: np.ndarray, seconds: int) -> Dict[int, list]:
+        keys = keys[:len(sums)]
+        order = np.lexsort((-sums, keys))
+        sorted_keys = keys[order]
+        bounds = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1], True])
+        res = {}
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            if sorted_keys[lo] < 0:
+                continue
+            top = self._top(sums, order[lo:min(hi, lo + self.count)], seconds)
+            if top:
+                res[int(sorted_keys[lo])] = top
+        return res
+
+    def snapshot(self) -> dict:
+        """
+        Top of all subscribers, of each group and of each gateway, for each
+        window. Talker is [subscriber id, octets, average Mbit/s].
+        """
+        res = {}
+        for seconds in self.windows:
+            sums, summed = self.window_sums(seconds)
+            res[seconds] = {
+                'all': self._top(sums, np.arange(len(sums)), summed),
+                'groups': self._top_by(sums, self.groups, summed),
+                'nas': self._top_by(sums, self.nases, summed)
+            }
+        return res
@@ -1,10 +1,13 @@
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import timedelta
+from time import monotonic
 from typing import Union, Iterable, AnyStr, Generator, Optional, Dict
-from easysnmp import Session
+from easysnmp import EasySNMPTimeoutError
 
 from django.utils.translation import gettext, gettext_lazy as _
 
+from devapp.snmp_pool import snmp_pool
 from djing.lib import RuTimedelta
 
 ListOrError = Union[
@@ -12,6 +15,12 @@ ListOrError = Union[
     Union[Exception, Iterable]
 ]
 
+# How many rows of column are asked by one GETBULK request
+BULK_REPETITIONS = 32
+
+# Seconds that may be spent for walking of all columns of table
+TABLE_TIMEOUT = 30
+
 
 class DeviceImplementationError(NotImplementedError):
     pass
@@ -125,7 +134,10 @@ class BasePort(object, metaclass=ABCMeta):
 
 
 class SNMPBaseWorker(object, metaclass=ABCMeta):
-    ses = None
+    # sessions are shared with other managers of process
+    pool = snmp_pool
+    # how many columns of table are walked at the same time
+    snmp_concurrency = 1
 
     def __init__(self, ip: Optional[str], community='public', ver=2):
         if ip is None or ip == '':
@@ -134,30 +146,82 @@ class SNMPBaseWorker(object, metaclass=ABCMeta):
         self._community = community
         self._ver = ver
 
-    def start_ses(self):
-        if self.ses is None:
-            self.ses = Session(
-                hostname=self._ip, community=self._community,
-                version=self._ver
-            )
+    def session(self):
+        """
+        Context manager that gives session from pool
+        """
+        return self.pool.session(self._ip, self._community, self._ver)
 
     def set_int_value(self, oid: str, value):
-        self.start_ses()
-        return self.ses.set(oid, value, 'i')
+        with self.session() as ses:
+            return ses.set(oid, value, 'i')
 
     def get_list(self, oid) -> Generator:
-        self.start_ses()
-        for v in self.ses.walk(oid):
+        # session is not kept while values are consumed
+        with self.session() as ses:
+            variables = ses.walk(oid)
+        for v in variables:
             yield v.value
 
     def get_list_keyval(self, oid) -> Generator:
-        self.start_ses()
-        for v in self.ses.walk(oid):
+        with self.session() as ses:
+            variables = ses.walk(oid)
+        for v in variables:
             snmpnum = v.oid.split('.')[-1:]
             yield v.value, snmpnum[0] if len(snmpnum) > 0 else None
 
     def get_item(self, oid):
-        self.start_ses()
-        v = self.ses.get(oid).value
+        with self.session() as ses:
+            v = ses.get(oid).value
         if v != 'NOSUCHINSTANCE':
             return v
+
+    def walk_column(self, oid: str) -> Dict[str, str]:
+        """
+        Walk column of table by GETBULK requests
+        :return: last number of oid of each row -> value
+        """
+        with self.session() as ses:
+            if self._ver == 1:
+                # GETBULK is absent in SNMPv1
+                variables = ses.walk(oid)
+            else:
+                variables = ses.bulkwalk(oid, max_repetitions=BULK_REPETITIONS)
+        res = {}
+        for v in variables:
+            full_oid = '%s.%s' % (v.oid, v.oid_index) if v.oid_index else v.oid
+            res[full_oid.rsplit('.', 1)[-1]] = v.value
+        return res
+
+    def get_columns(self, columns: Dict[str, str], concurrency: Optional[int] = None,
+                    timeout=TABLE_TIMEOUT) -> Dict[str, Dict[str, str]]:
+        """
+        Walk several columns of table, so that rows are joined by index
+        instead of getting each value by own request
+        :param columns: name -> oid of column
+        :param concurrency: how many columns are walked at the same time,
+        snmp_concurrency by default, it is limited by pool for host too
+        :param timeout: seconds for all columns, EasySNMPTimeoutError is raised
+        if they are not walked in time
+        :return: name -> {index: value}
+        """
+        if concurrency is None:
+            concurrency = self.snmp_concurrency
+        if concurrency <= 1:
+            deadline = monotonic() + timeout
+            res = {}
+            for name, oid in columns.items():
+                if monotonic() > deadline:
+                    raise EasySNMPTimeoutError('Table of %s is not walked in %d seconds' % (self._ip, timeout))
+                res[name] = self.walk_column(oid)
+            return res
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        try:
+            futures = {name: executor.submit(self.walk_column, oid) for name, oid in columns.items()}
+            done, not_done = wait(futures.values(), timeout=timeout)
+            if not_done:
+                raise EasySNMPTimeoutError('Table of %s is not walked in %d seconds' % (self._ip, timeout))
+            return {name: f.result() for name, f in futures.items()}
+        finally:
+            # walks that are late are left to finish by themselves
+            executor.shutdown(wait=False)
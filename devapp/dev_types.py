@@ -171,32 +171,39 @@ class OLTDevice(DevBase, SNMPBaseWorker):
     has_attachable_to_subscriber = False
     description = 'PON OLT'
     is_use_device_port = False
+    # there may be hundreds of ONU in columns
+    snmp_concurrency = 4
 
     def __init__(self, dev_instance):
         DevBase.__init__(self, dev_instance)
         SNMPBaseWorker.__init__(self, dev_instance.ip_address, dev_instance.man_passw, 2)
 
     def get_ports(self) -> ListOrError:
-        nms = self.get_list('.1.3.6.1.4.1.3320.101.10.1.1.79')
-        res = []
         try:
-            for nm in nms:
-                n = int(nm)
-                status = self.get_item('.1.3.6.1.4.1.3320.101.10.1.1.26.%d' % n)
-                signal = safe_float(self.get_item('.1.3.6.1.4.1.3320.101.10.5.1.5.%d' % n))
-                onu = ONUdev(
-                    num=n,
-                    name=self.get_item('.1.3.6.1.2.1.2.2.1.2.%d' % n),
-                    status=status == '3',
-                    mac=self.get_item('.1.3.6.1.4.1.3320.101.10.1.1.3.%d' % n),
-                    speed=0,
-                    signal=signal / 10 if signal else '—',
-                    snmp_worker=self)
-                res.append(onu)
+            cols = self.get_columns({
+                'nums': '.1.3.6.1.4.1.3320.101.10.1.1.79',
+                'status': '.1.3.6.1.4.1.3320.101.10.1.1.26',
+                'signal': '.1.3.6.1.4.1.3320.101.10.5.1.5',
+                'name': '.1.3.6.1.2.1.2.2.1.2',
+                'mac': '.1.3.6.1.4.1.3320.101.10.1.1.3'
+            })
         except EasySNMPTimeoutError as e:
             return EasySNMPTimeoutError(
                 "%s (%s)" % (gettext('wait for a reply from the SNMP Timeout'), e)
-            ), res
+            ), []
+        res = []
+        for nm in cols['nums'].values():
+            n = int(nm)
+            signal = safe_float(cols['signal'].get(str(n)))
+            onu = ONUdev(
+                num=n,
+                name=cols['name'].get(str(n)),
+                status=cols['status'].get(str(n)) == '3',
+                mac=cols['mac'].get(str(n), ''),
+                speed=0,
+                signal=signal / 10 if signal else '—',
+                snmp_worker=self)
+            res.append(onu)
         return res
 
     def get_device_name(self):
@@ -344,14 +351,20 @@ class EltexSwitch(DLinkDevice):
     tech_code = 'eltex_sw'
 
     def get_ports(self) -> ListOrError:
+        cols = self.get_columns({
+            'speed': '.1.3.6.1.2.1.2.2.1.5',
+            'name': '.1.3.6.1.2.1.31.1.1.1.18',
+            'status': '.1.3.6.1.2.1.2.2.1.8',
+            'mac': '.1.3.6.1.2.1.2.2.1.6'
+        })
         for i, n in enumerate(range(49, 77), 1):
-            speed = self.get_item('.1.3.6.1.2.1.2.2.1.5.%d' % n)
+            n = str(n)
             yield EltexPort(self,
                 num=i,
-                name=self.get_item('.1.3.6.1.2.1.31.1.1.1.18.%d' % n),
-                status=self.get_item('.1.3.6.1.2.1.2.2.1.8.%d' % n),
-                mac=self.get_item('.1.3.6.1.2.1.2.2.1.6.%d' % n),
-                speed=int(speed or 0)
+                name=cols['name'].get(n),
+                status=cols['status'].get(n),
+                mac=cols['mac'].get(n, ''),
+                speed=safe_int(cols['speed'].get(n))
             )
 
     def get_device_name(self):
@@ -568,24 +581,25 @@ class HuaweiSwitch(EltexSwitch):
     tech_code = 'huawei_s2300'
 
     def get_ports(self):
-        interfaces_ids = self.get_list('.1.3.6.1.2.1.17.1.4.1.2')
-        if interfaces_ids is None:
-            raise DeviceImplementationError('Switch returned null')
-        for i, n in enumerate(interfaces_ids):
+        cols = self.get_columns({
+            'interfaces_ids': '.1.3.6.1.2.1.17.1.4.1.2',
+            'speed': '.1.3.6.1.2.1.2.2.1.5',
+            'oper_status': '.1.3.6.1.2.1.2.2.1.7',
+            'link_status': '.1.3.6.1.2.1.2.2.1.8',
+            'name': '.1.3.6.1.2.1.2.2.1.2'
+        })
+        for i, n in enumerate(cols['interfaces_ids'].values()):
             n = int(n)
-            speed = self.get_item('.1.3.6.1.2.1.2.2.1.5.%d' % n)
-            oper_status = safe_int(self.get_item('.1.3.6.1.2.1.2.2.1.7.%d' % n))
-            oper_status = oper_status == 1
-            link_status = safe_int(self.get_item('.1.3.6.1.2.1.2.2.1.8.%d' % n))
-            link_status = link_status == 1
+            oper_status = safe_int(cols['oper_status'].get(str(n))) == 1
+            link_status = safe_int(cols['link_status'].get(str(n))) == 1
             ep = EltexPort(
                 self,
                 num=i+1,
                 snmp_num=n,
-                name=self.get_item('.1.3.6.1.2.1.2.2.1.2.%d' % n),         # name
+                name=cols['name'].get(str(n)),                             # name
                 status=oper_status,                                        # status
-                mac='', # self.get_item('.1.3.6.1.2.1.2.2.1.6.%d' % n),    # mac
-                speed=0 if not link_status else safe_int(speed)            # speed
+                mac='',                                                    # mac
+                speed=0 if not link_status else safe_int(cols['speed'].get(str(n)))  # speed
             )
             ep.writable = True
             yield ep
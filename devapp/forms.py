@@ -49,6 +49,15 @@ class DeviceForm(forms.ModelForm):
                 )
         return snmp_extra
 
+    def clean_parent_dev(self):
+        parent_dev = self.cleaned_data.get('parent_dev')
+        device = self.instance
+        if parent_dev is not None and device.tree_path and parent_dev.tree_path.startswith(device.tree_path):
+            raise ValidationError(
+                _('Device can not be a parent of itself or of its parents'), code='invalid'
+            )
+        return parent_dev
+
     class Meta:
         model = models.Device
         exclude = ('map_dot', 'status', 'extra_data')
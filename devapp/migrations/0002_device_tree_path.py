@@ -0,0 +1,43 @@
+from django.db import migrations, models
+
+
+def tree_paths(parents):
+    # copy of devapp.topology.tree_paths, so that migration does not depend on current code
+    paths = {}
+    for pk in parents:
+        chain = []
+        node = pk
+        while node is not None and node not in paths and node not in chain:
+            chain.append(node)
+            node = parents.get(node)
+        prefix = paths.get(node, '')
+        for n in reversed(chain):
+            prefix = '%s%d/' % (prefix, n)
+            paths[n] = prefix
+    return paths
+
+
+def fill_tree_paths(apps, schema_editor):
+    Device = apps.get_model('devapp', 'Device')
+    devices = list(Device.objects.only('pk', 'parent_dev_id'))
+    paths = tree_paths({d.pk: d.parent_dev_id for d in devices})
+    for d in devices:
+        d.tree_path = paths[d.pk]
+    Device.objects.bulk_update(devices, ('tree_path',), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devapp', '0001_squashed_0005_device_ip_address_change'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='tree_path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255,
+                                   verbose_name='Path in tree of devices'),
+        ),
+        migrations.RunPython(fill_tree_paths, migrations.RunPython.noop)
+    ]
@@ -1,9 +1,13 @@
 from typing import Optional, AnyStr
 
 from jsonfield import JSONField
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.shortcuts import resolve_url
-from django.utils.translation import gettext_lazy as _
+from django.utils.translation import gettext_lazy as _, gettext
 
 from djing.fields import MACAddressField
 from djing.lib import MyChoicesAdapter
@@ -58,6 +62,11 @@ class Device(models.Model):
 
     is_noticeable = models.BooleanField(_('Send notify when monitoring state changed'), default=False)
 
+    # ids of parents and of device itself, like "1/5/12/", so that
+    # subtree of device is taken by one range query
+    tree_path = models.CharField(_('Path in tree of devices'), max_length=255, default='',
+                                 db_index=True, editable=False)
+
     class Meta:
         db_table = 'dev'
         verbose_name = _('Device')
@@ -99,6 +108,59 @@ class Device(models.Model):
     def get_absolute_url(self):
         return resolve_url('devapp:edit', self.group.pk, self.pk)
 
+    def _parent_tree_path(self) -> str:
+        if self.parent_dev_id is None:
+            return ''
+        return Device.objects.filter(pk=self.parent_dev_id).values_list('tree_path', flat=True).first() or ''
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not {'parent_dev', 'parent_dev_id'}.intersection(update_fields):
+            return super().save(*args, **kwargs)
+        parent_path = self._parent_tree_path()
+        if self.tree_path and parent_path.startswith(self.tree_path):
+            raise DeviceDBException(gettext('Device can not be a parent of itself or of its parents'))
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self._move_subtree('%s%d/' % (parent_path, self.pk))
+
+    def _move_subtree(self, new_path: str):
+        old_path = self.tree_path
+        if old_path == new_path:
+            return
+        Device.objects.filter(pk=self.pk).update(tree_path=new_path)
+        if old_path:
+            Device.objects.filter(subtree_q(old_path)).exclude(pk=self.pk).update(
+                tree_path=Concat(Value(new_path), Substr('tree_path', len(old_path) + 1))
+            )
+        self.tree_path = new_path
+
+    def get_subtree(self):
+        """
+        Device and all devices under it
+        """
+        return Device.objects.filter(subtree_q(self.tree_path))
+
+
+def subtree_q(path: str, field='tree_path') -> models.Q:
+    """
+    Filter of devices whose path starts with path. Range is used instead
+    of LIKE so that index is used by mysql, '0' is next char after '/'
+    """
+    return models.Q(**{
+        '%s__gte' % field: path,
+        '%s__lt' % field: path[:-1] + '0'
+    })
+
+
+@receiver(post_delete, sender=Device)
+def device_post_delete(sender, instance, **kwargs):
+    # children of device are detached by SET_NULL, so they become roots
+    if instance.tree_path:
+        Device.objects.filter(subtree_q(instance.tree_path)).update(
+            tree_path=Substr('tree_path', len(instance.tree_path) + 1)
+        )
+
 
 class Port(models.Model):
     device = models.ForeignKey(Device, on_delete=models.CASCADE, verbose_name=_('Device'))
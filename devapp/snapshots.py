@@ -0,0 +1,162 @@
+#
+# Snapshots of devices. Ports, uptime and other info of device are
+# collected by celery and kept in redis, so that page of device is
+# rendered without any request to device.
+#
+import json
+from datetime import datetime
+from time import time
+from typing import Optional
+
+from django.conf import settings
+from django.utils.translation import gettext
+from easysnmp import EasySNMPError
+from redis import Redis
+
+from devapp.base_intr import BasePort, DeviceImplementationError
+from devapp.models import Device, DeviceDBException
+from djing import ping
+from djing.lib import RuTimedelta
+
+SNAPSHOT_KEY = 'device_snapshot_%d'
+SNAPSHOT_TIMES_KEY = 'device_snapshot_times'
+REFRESH_KEY = 'device_snapshot_refresh_%d'
+
+# Snapshot is kept for this time, seconds
+SNAPSHOT_TTL = 24 * 3600
+
+# Poller refreshes snapshots that are older than this, seconds
+SNAPSHOT_MAX_AGE = getattr(settings, 'DEVICE_SNAPSHOT_MAX_AGE', 600)
+
+# Device is not refreshed again while its refresh is running, seconds
+REFRESH_TTL = 120
+
+
+def snapshot_redis() -> Redis:
+    return Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+
+
+class PortSnapshot(BasePort):
+    """
+    Port that is read from snapshot, it can not be switched
+    """
+    __slots__ = ('signal',)
+
+    def __init__(self, signal=None, **kwargs):
+        super().__init__(**kwargs)
+        self.signal = signal
+
+    def disable(self):
+        raise DeviceImplementationError('Port of snapshot can not be switched')
+
+    def enable(self):
+        raise DeviceImplementationError('Port of snapshot can not be switched')
+
+
+def port_dict(port: BasePort) -> dict:
+    return {
+        'num': port.num,
+        'snmp_num': port.snmp_num,
+        'name': port.nm,
+        'status': port.st,
+        'mac': port._mac or '',
+        'speed': port.sp,
+        'uptime': port.uptime,
+        'writable': port.writable,
+        'signal': getattr(port, 'signal', None)
+    }
+
+
+class DeviceSnapshot(object):
+    def __init__(self, data: dict):
+        self.timestamp = data['time']
+        self.time = datetime.fromtimestamp(data['time'])
+        self.template = data['template']
+        self.error = data.get('error')
+        self.ports = [PortSnapshot(**p) for p in data.get('ports', ())]
+        uptime = data.get('uptime')
+        self.uptime = RuTimedelta(seconds=uptime) if uptime else None
+        self.fibers = data.get('fibers', ())
+        self.unregistered = data.get('unregistered', ())
+        self.details = data.get('details')
+        self.fiber_str = data.get('fiber_str')
+        self.long_description = data.get('long_description')
+        self.hostname = data.get('hostname')
+
+    def age(self) -> float:
+        return (datetime.now() - self.time).total_seconds()
+
+
+def take_snapshot(device: Device) -> dict:
+    """
+    Collect info of device by snmp, errors are saved into snapshot
+    """
+    data = {
+        'time': int(time()),
+        'template': 'generic_switch.html',
+        'error': None
+    }
+    try:
+        manager = device.get_manager_object()
+        data['template'] = manager.get_template_name()
+        if device.ip_address and not ping(str(device.ip_address)):
+            data['error'] = gettext('Dot was not pinged')
+            return data
+        uptime = manager.uptime()
+        data['uptime'] = int(uptime.total_seconds()) if uptime else None
+        ports = tuple(manager.get_ports())
+        if len(ports) > 0 and isinstance(ports[0], Exception):
+            data['error'] = str(ports[0])
+            ports = ports[1]
+        data['ports'] = [port_dict(p) for p in ports]
+        if hasattr(manager, 'get_fibers'):
+            data['fibers'] = list(manager.get_fibers())
+            data['unregistered'] = [
+                onu for fiber in data['fibers']
+                for onu in manager.get_units_unregistered(int(fiber.get('fb_id'))) if onu
+            ]
+            data['long_description'] = manager.get_long_description()
+            data['hostname'] = manager.get_hostname()
+        if hasattr(manager, 'get_details'):
+            data['details'] = manager.get_details()
+        if hasattr(manager, 'get_fiber_str'):
+            data['fiber_str'] = manager.get_fiber_str()
+    except EasySNMPError as e:
+        data['error'] = "%s: %s" % (gettext('SNMP error on device'), e)
+    except (DeviceDBException, DeviceImplementationError, TypeError) as e:
+        # TypeError is raised for unknown type of device
+        data['error'] = str(e)
+    return data
+
+
+def save_snapshot(device_id: int, data: dict):
+    redis = snapshot_redis()
+    pipe = redis.pipeline()
+    pipe.set(SNAPSHOT_KEY % device_id, json.dumps(data), ex=SNAPSHOT_TTL)
+    pipe.hset(SNAPSHOT_TIMES_KEY, device_id, data['time'])
+    pipe.delete(REFRESH_KEY % device_id)
+    pipe.execute()
+
+
+def get_snapshot(device_id: int) -> Optional[DeviceSnapshot]:
+    data = snapshot_redis().get(SNAPSHOT_KEY % device_id)
+    if data is not None:
+        return DeviceSnapshot(json.loads(data))
+
+
+def get_snapshot_time(device_id: int) -> Optional[int]:
+    t = snapshot_redis().hget(SNAPSHOT_TIMES_KEY, device_id)
+    if t is not None:
+        return int(t)
+
+
+def is_refreshing(device_id: int) -> bool:
+    return bool(snapshot_redis().exists(REFRESH_KEY % device_id))
+
+
+def stale_devices(device_ids, now: int, times: dict, max_age=SNAPSHOT_MAX_AGE):
+    """
+    :param times: device id -> time of snapshot, as it is kept in redis
+    :return: ids of devices without snapshot or with old one
+    """
+    return [pk for pk in device_ids if now - int(times.get(str(pk).encode(), 0)) >= max_age]
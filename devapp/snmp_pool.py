@@ -0,0 +1,144 @@
+#
+# Sessions of SNMP shared by all device managers of process. Session is
+# given to one user at a time, and count of users of one host is
+# limited, so that admins who open same switch do not load it.
+#
+from collections import defaultdict
+from contextlib import contextmanager
+from threading import Lock, BoundedSemaphore
+from time import monotonic
+from typing import Callable, Dict, Tuple
+
+from django.conf import settings
+from easysnmp import Session, EasySNMPTimeoutError
+
+# Session is closed if it is not used for this time, seconds
+IDLE_TIMEOUT = 300
+
+# How many requests to one host may be sent at the same time
+HOST_CONCURRENCY = getattr(settings, 'SNMP_HOST_CONCURRENCY', 4)
+
+# How long to wait for free place of host, seconds
+HOST_WAIT = 30
+
+# (host, community, version)
+SessionKey = Tuple[str, str, int]
+
+
+class HostStats(object):
+    __slots__ = ('requests', 'timeouts', 'waits', 'latency', 'max_latency')
+
+    def __init__(self):
+        self.requests = 0
+        self.timeouts = 0
+        # how many times request waited for other requests to host
+        self.waits = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+
+    def add(self, seconds: float, timeout=False):
+        self.requests += 1
+        self.latency += seconds
+        self.max_latency = max(self.max_latency, seconds)
+        if timeout:
+            self.timeouts += 1
+
+    def as_dict(self) -> dict:
+        return {
+            'requests': self.requests,
+            'timeouts': self.timeouts,
+            'waits': self.waits,
+            'avg_latency': round(self.latency / self.requests, 4) if self.requests else None,
+            'max_latency': round(self.max_latency, 4)
+        }
+
+
+def _make_session(host: str, community: str, version: int) -> Session:
+    return Session(hostname=host, community=community, version=version)
+
+
+class SnmpSessionPool(object):
+    def __init__(self, idle_timeout=IDLE_TIMEOUT, host_concurrency=HOST_CONCURRENCY,
+                 factory: Callable[[str, str, int], Session] = _make_session):
+        self.idle_timeout = idle_timeout
+        self.host_concurrency = host_concurrency
+        self.factory = factory
+        self._lock = Lock()
+        # session key -> free sessions with time when they were returned
+        self._idle = defaultdict(list)
+        self._limits = {}  # type: Dict[str, BoundedSemaphore]
+        self._stats = defaultdict(HostStats)  # type: Dict[str, HostStats]
+
+    def _take(self, key: SessionKey) -> Session:
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop()[0]
+        return self.factory(*key)
+
+    def _give(self, key: SessionKey, ses: Session):
+        now = monotonic()
+        with self._lock:
+            self._idle[key].append((ses, now))
+            self._expire(now)
+
+    def _expire(self, now: float):
+        for key in tuple(self._idle.keys()):
+            idle = [(s, t) for s, t in self._idle[key] if now - t < self.idle_timeout]
+            if idle:
+                self._idle[key] = idle
+            else:
+                del self._idle[key]
+
+    def _host(self, host: str) -> Tuple[BoundedSemaphore, HostStats]:
+        with self._lock:
+            sem = self._limits.get(host)
+            if sem is None:
+                sem = self._limits[host] = BoundedSemaphore(self.host_concurrency)
+            return sem, self._stats[host]
+
+    @contextmanager
+    def session(self, host: str, community: str, version: int):
+        """
+        Take session for host, it is returned to pool after the block
+        """
+        key = (host, community, version)
+        sem, stats = self._host(host)
+        if not sem.acquire(blocking=False):
+            with self._lock:
+                stats.waits += 1
+            if not sem.acquire(timeout=HOST_WAIT):
+                with self._lock:
+                    stats.add(HOST_WAIT, timeout=True)
+                raise EasySNMPTimeoutError('Too many requests to %s' % host)
+        try:
+            ses = self._take(key)
+            start = monotonic()
+            try:
+                yield ses
+            except Exception as e:
+                # session is not returned, it may be broken
+                with self._lock:
+                    stats.add(monotonic() - start, timeout=isinstance(e, EasySNMPTimeoutError))
+                raise
+            else:
+                with self._lock:
+                    stats.add(monotonic() - start)
+                self._give(key, ses)
+        finally:
+            sem.release()
+
+    def idle_count(self) -> int:
+        with self._lock:
+            self._expire(monotonic())
+            return sum(len(i) for i in self._idle.values())
+
+    def stats(self) -> Dict[str, dict]:
+        """
+        Requests of this process for each host
+        """
+        with self._lock:
+            return {host: s.as_dict() for host, s in self._stats.items()}
+
+
+snmp_pool = SnmpSessionPool()
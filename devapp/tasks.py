@@ -1,27 +1,168 @@
-from typing import Iterable
+import os
+from collections import defaultdict
+from hashlib import sha256
 from subprocess import run
+from time import time
+from typing import Optional
+
 from celery import shared_task
+from django.conf import settings
+from django.utils.translation import gettext
+from redis import Redis
+
+from accounts_app.models import UserProfile
 from devapp.models import Device
+from devapp.snapshots import (
+    take_snapshot, save_snapshot, stale_devices, snapshot_redis,
+    REFRESH_KEY, REFRESH_TTL, SNAPSHOT_TIMES_KEY
+)
+from devapp.topology import affected_counts
+from messenger.tasks import multicast_viber_notify
+
+MACS_CONF_PATH = '/etc/dhcp/macs.conf'
+DHCP_RELOAD_COMMAND = ('/usr/bin/sudo', 'systemctl', 'restart', 'isc-dhcp-server.service')
+
+# Changes of devices during this time in seconds are
+# collected into one regeneration of config
+MACS_CONF_DEBOUNCE = 5
+MACS_CONF_PENDING_KEY = 'devapp_macs_conf_pending'
+
+STATE_NOTIFY_TEXTS = {
+    'up': 'Device %(device_name)s is up',
+    'dwn': 'Device %(device_name)s is down',
+    'unr': 'Device %(device_name)s is unreachable',
+    'und': 'Device %(device_name)s getting undefined status code'
+}
+
+
+def render_macs_conf() -> str:
+    """
+    Make config with classes of devices, that can be attached to subscribers, for dhcpd
+    """
+    codes = {
+        code: klass.tech_code for code, klass in Device.DEVICE_TYPES
+        if klass.has_attachable_to_subscriber
+    }
+    devs = Device.objects.filter(devtype__in=codes.keys()).exclude(
+        mac_addr=None
+    ).exclude(group=None).values_list('mac_addr', 'devtype', 'group__code').order_by('pk')
+    lines = []
+    for mac, devtype, group_code in devs.iterator():
+        if not group_code:
+            continue
+        lines.append('subclass "%(group_code)s.%(dev_code)s" "%(mac)s";\n' % {
+            'group_code': group_code,
+            'mac': mac,
+            'dev_code': codes[devtype]
+        })
+    return ''.join(lines)
+
+
+def write_if_changed(path: str, content: str) -> bool:
+    """
+    Atomically replace file if its content is changed,
+    so that reader never sees half written file.
+    :return: True if file is replaced
+    """
+    content = content.encode()
+    try:
+        with open(path, 'rb') as f:
+            if sha256(f.read()).digest() == sha256(content).digest():
+                return False
+    except FileNotFoundError:
+        pass
+    tmp_path = '%s.tmp' % path
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return True
+
+
+@shared_task
+def update_macs_conf():
+    # changes made from here will be applied by next run
+    Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT).delete(MACS_CONF_PENDING_KEY)
+    if write_if_changed(MACS_CONF_PATH, render_macs_conf()):
+        run(DHCP_RELOAD_COMMAND)
+
+
+def schedule_macs_conf_update():
+    """
+    Regenerate config a bit later, if it is not already scheduled
+    """
+    redis = Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+    if redis.set(MACS_CONF_PENDING_KEY, 1, nx=True, ex=MACS_CONF_DEBOUNCE * 10):
+        try:
+            update_macs_conf.apply_async(countdown=MACS_CONF_DEBOUNCE)
+        except Exception:
+            # nothing is scheduled, so next change must schedule it again
+            redis.delete(MACS_CONF_PENDING_KEY)
+            raise
+
+
+@shared_task
+def refresh_device_snapshot(device_id: int):
+    try:
+        device = Device.objects.select_related('parent_dev').get(pk=device_id)
+    except Device.DoesNotExist:
+        snapshot_redis().delete(REFRESH_KEY % device_id)
+        return 'Device.DoesNotExist id=%d' % device_id
+    save_snapshot(device_id, take_snapshot(device))
+
+
+def start_snapshot_refresh(device_id: int, redis: Optional[Redis] = None) -> bool:
+    """
+    Refresh snapshot of device in background, if it is not refreshing already
+    :return: False if refresh is running already
+    """
+    redis = redis or snapshot_redis()
+    if redis.set(REFRESH_KEY % device_id, 1, nx=True, ex=REFRESH_TTL):
+        refresh_device_snapshot.delay(device_id)
+        return True
+    return False
+
+
+@shared_task
+def poll_device_snapshots():
+    """
+    Refresh old snapshots of devices that are managed by snmp
+    """
+    devices = list(Device.objects.exclude(man_passw=None).exclude(man_passw='').values_list('pk', flat=True))
+    redis = snapshot_redis()
+    times = redis.hgetall(SNAPSHOT_TIMES_KEY)
+    count = sum(start_snapshot_refresh(pk, redis) for pk in stale_devices(devices, int(time()), times))
+    removed = set(times.keys()) - {str(pk).encode() for pk in devices}
+    if removed:
+        redis.hdel(SNAPSHOT_TIMES_KEY, *removed)
+    return '%d devices are refreshing' % count
 
 
 @shared_task
-def onu_register(device_ids: Iterable[int]):
-    with open('/etc/dhcp/macs.conf', 'w') as f:
-        for dev_id in device_ids:
-            dev = Device.objects.get(pk=dev_id)
-            if not dev.has_attachable_to_subscriber() or dev.mac_addr is None:
-                continue
-            group_code = dev.group.code
-            if not group_code:
-                continue
-            try:
-                mn = dev.get_manager_klass()
-                dev_code = mn.tech_code
-                f.write('subclass "%(group_code)s.%(dev_code)s" "%(mac)s";\n' % {
-                    'group_code': group_code,
-                    'mac': dev.mac_addr,
-                    'dev_code': dev_code
-                })
-            except TypeError:
-                continue
-    run(('/usr/bin/sudo', 'systemctl', 'restart', 'isc-dhcp-server.service'))
+def notify_device_states(states: dict):
+    """
+    Notify employees of groups about new states of devices,
+    one message for each group
+    :param states: device id -> new status
+    """
+    states = {int(pk): st for pk, st in states.items()}
+    devices = Device.objects.filter(pk__in=states.keys(), is_noticeable=True).exclude(group=None).values_list(
+        'pk', 'ip_address', 'mac_addr', 'comment', 'group_id'
+    )
+    affected = affected_counts([pk for pk, st in states.items() if st in ('dwn', 'unr')])
+    texts = defaultdict(list)
+    for pk, ip, mac, comment, group_id in devices.iterator():
+        text = gettext(STATE_NOTIFY_TEXTS.get(states[pk], STATE_NOTIFY_TEXTS['und'])) % {
+            'device_name': "%s(%s) %s" % (ip or '', mac, comment)
+        }
+        if affected.get(pk):
+            text = '%s, %s' % (text, gettext('affected subscribers: %(count)d') % {'count': affected[pk]})
+        texts[group_id].append(text)
+    for group_id, group_texts in texts.items():
+        user_ids = tuple(UserProfile.objects.get_profiles_by_group(group_id).filter(
+            flags=UserProfile.flags.notify_mon
+        ).values_list('pk', flat=True))
+        if user_ids:
+            multicast_viber_notify.delay(None, account_id_list=user_ids, message_text='\n'.join(group_texts))
+    return '%d groups are notified' % len(texts)
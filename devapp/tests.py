@@ -1,9 +1,23 @@
+import os
+from collections import namedtuple
 from hashlib import sha256
+from tempfile import TemporaryDirectory
+from time import sleep
+from unittest.mock import patch
 from django.shortcuts import resolve_url
-from django.test import TestCase, RequestFactory, override_settings
+from django.test import SimpleTestCase, TestCase, RequestFactory, override_settings
+from easysnmp import EasySNMPTimeoutError
 
+from abonapp.models import Abon
 from accounts_app.models import UserProfile
-from devapp.models import Device
+from agent.monitor.engine import classify, StateTracker, UP, DOWN, UNREACHABLE, UNDEFINED
+from agent.monitor.snmp import get_request, response_id
+from devapp.base_intr import SNMPBaseWorker
+from devapp.snapshots import DeviceSnapshot, PortSnapshot, port_dict, stale_devices, take_snapshot
+from devapp.snmp_pool import SnmpSessionPool
+from devapp.models import Device, DeviceDBException
+from devapp.tasks import render_macs_conf, write_if_changed
+from devapp.topology import tree_paths, count_in_subtrees, affected_counts, rebuild_tree_paths
 from group_app.models import Group
 
 rf = RequestFactory()
@@ -52,3 +66,220 @@ class DevTest(TestCase):
             'sign': sign
         })
         self.assertEqual(r.status_code, 200)
+
+
+class MacsConfTest(TestCase):
+    def setUp(self):
+        grp = Group.objects.create(title='Grp1', code='grp')
+        Device.objects.create(
+            mac_addr='78:81:f2:1f:d2:a9', comment='Onu', devtype='On', group=grp
+        )
+        # olt can not be attached to subscriber
+        Device.objects.create(
+            mac_addr='78:81:f2:1f:d2:b0', comment='Olt', devtype='Pn', group=grp
+        )
+        # device without group
+        Device.objects.create(
+            mac_addr='78:81:f2:1f:d2:b1', comment='Onu', devtype='On'
+        )
+
+    def test_render(self):
+        conf = render_macs_conf()
+        self.assertEqual(conf.count('subclass'), 1)
+        self.assertIn('"grp.bdcom_onu"', conf)
+
+    def test_write_if_changed(self):
+        with TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'macs.conf')
+            self.assertTrue(write_if_changed(path, 'a'))
+            self.assertFalse(write_if_changed(path, 'a'))
+            self.assertTrue(write_if_changed(path, 'b'))
+            with open(path) as f:
+                self.assertEqual(f.read(), 'b')
+            self.assertEqual(os.listdir(tmp_dir), ['macs.conf'])
+
+
+SnmpVar = namedtuple('SnmpVar', 'oid oid_index value')
+
+
+class TableSession(object):
+    def __init__(self, table):
+        self.table = table
+        self.requests = 0
+
+    def bulkwalk(self, oid, max_repetitions=10):
+        self.requests += 1
+        return [SnmpVar(oid, idx, v) for idx, v in self.table[oid]]
+
+
+class TableWorker(SNMPBaseWorker):
+    def __init__(self, table, concurrency):
+        super().__init__('192.168.0.100')
+        self.sessions = []
+        self.snmp_concurrency = concurrency
+        self.pool = SnmpSessionPool(factory=self._make_session)
+        self.table = table
+
+    def _make_session(self, host, community, version):
+        ses = TableSession(self.table)
+        self.sessions.append(ses)
+        return ses
+
+
+class SnmpTableTest(SimpleTestCase):
+    table = {
+        '.1.3.6.1.2.1.2.2.1.2': [('1', 'eth1'), ('2', 'eth2'), ('3', 'eth3')],
+        '.1.3.6.1.2.1.2.2.1.8': [('1', '1'), ('3', '2')],
+    }
+
+    def test_columns(self):
+        for concurrency in (1, 2):
+            worker = TableWorker(self.table, concurrency)
+            cols = worker.get_columns({
+                'name': '.1.3.6.1.2.1.2.2.1.2',
+                'status': '.1.3.6.1.2.1.2.2.1.8'
+            })
+            self.assertDictEqual(cols['name'], {'1': 'eth1', '2': 'eth2', '3': 'eth3'})
+            self.assertDictEqual(cols['status'], {'1': '1', '3': '2'})
+        # one walk for each column, by the same session
+        worker = TableWorker(self.table, 1)
+        worker.get_columns({'name': '.1.3.6.1.2.1.2.2.1.2', 'status': '.1.3.6.1.2.1.2.2.1.8'})
+        self.assertEqual(len(worker.sessions), 1)
+        self.assertEqual(worker.sessions[0].requests, 2)
+        self.assertEqual(worker.pool.stats()['192.168.0.100']['requests'], 2)
+
+
+class SnmpSessionPoolTest(SimpleTestCase):
+    def test_reuse_and_expire(self):
+        pool = SnmpSessionPool(idle_timeout=0.05, factory=lambda *key: object())
+        with pool.session('10.0.0.1', 'public', 2) as ses:
+            pass
+        with pool.session('10.0.0.1', 'public', 2) as ses2:
+            self.assertIs(ses, ses2)
+            # session is given to one user at a time
+            with pool.session('10.0.0.1', 'public', 2) as ses3:
+                self.assertIsNot(ses, ses3)
+        with pool.session('10.0.0.1', 'private', 2) as ses4:
+            self.assertIsNot(ses, ses4)
+        self.assertEqual(pool.idle_count(), 3)
+        sleep(0.06)
+        self.assertEqual(pool.idle_count(), 0)
+
+    def test_host_limit(self):
+        pool = SnmpSessionPool(host_concurrency=1, factory=lambda *key: object())
+        with pool.session('10.0.0.1', 'public', 2):
+            # other host is not limited
+            with pool.session('10.0.0.2', 'public', 2):
+                pass
+            with patch('devapp.snmp_pool.HOST_WAIT', 0.01):
+                with self.assertRaises(EasySNMPTimeoutError):
+                    with pool.session('10.0.0.1', 'public', 2):
+                        pass
+        stats = pool.stats()['10.0.0.1']
+        self.assertEqual((stats['requests'], stats['timeouts'], stats['waits']), (2, 1, 1))
+
+
+class DeviceSnapshotTest(SimpleTestCase):
+    def test_ports(self):
+        port = PortSnapshot(num=2, name='eth2', status=True, mac='\x00\x11\x22\x33\x44\x55',
+                            speed=100000000, uptime=6000, signal=-21.5)
+        snapshot = DeviceSnapshot({
+            'time': 1500000000,
+            'template': 'olt.html',
+            'uptime': 3600,
+            'ports': [port_dict(port)]
+        })
+        p = snapshot.ports[0]
+        self.assertEqual((p.num, p.nm, p.st, p.sp, p.signal), (2, 'eth2', True, 100000000, -21.5))
+        self.assertEqual(p.mac(), '0:11:22:33:44:55')
+        self.assertEqual(snapshot.uptime.total_seconds(), 3600)
+        self.assertIsNone(snapshot.error)
+
+    def test_stale_devices(self):
+        times = {b'1': b'1000', b'2': b'1500'}
+        self.assertListEqual(stale_devices((1, 2, 3), 1700, times, max_age=600), [1, 3])
+
+    def test_broken_manager(self):
+        data = take_snapshot(Device(comment='unknown', devtype='Xx'))
+        self.assertIsNotNone(data['error'])
+        self.assertEqual(DeviceSnapshot(data).template, 'generic_switch.html')
+
+
+class DeviceMonitorTest(SimpleTestCase):
+    # 1 <- 2 <- 3(without address) <- 4
+    parents = {1: None, 2: 1, 3: 2, 4: 3}
+
+    def test_classify(self):
+        states = classify({1: True, 2: False, 4: False}, self.parents)
+        self.assertDictEqual(states, {1: UP, 2: DOWN, 4: UNREACHABLE})
+        states = classify({1: False, 2: True, 4: False}, self.parents)
+        self.assertDictEqual(states, {1: DOWN, 2: UP, 4: DOWN})
+
+    def test_classify_cycle(self):
+        self.assertDictEqual(classify({1: False, 2: False}, {1: 3, 2: 3, 3: 2}), {1: UNREACHABLE, 2: DOWN})
+
+    def test_tracker(self):
+        tracker = StateTracker(confirm=2)
+        tracker.load({1: UP, 2: UNDEFINED})
+        self.assertDictEqual(tracker.update({1: False, 2: True}, self.parents), {2: (UNDEFINED, UP)})
+        self.assertDictEqual(tracker.update({1: False, 2: False}, self.parents), {1: (UP, DOWN)})
+        self.assertDictEqual(tracker.update({1: False, 2: False}, self.parents), {2: (UP, UNREACHABLE)})
+        self.assertDictEqual(tracker.update({1: True}, self.parents), {1: (DOWN, UP)})
+        self.assertNotIn(2, tracker.states)
+
+    def test_snmp_request(self):
+        req = get_request('public', 1234)
+        self.assertTrue(req.startswith(b'\x30'))
+        self.assertIn(b'\x06\x08\x2b\x06\x01\x02\x01\x01\x03\x00', req)
+        # response differs from request by tag of pdu
+        self.assertIsNone(response_id(req))
+        self.assertEqual(response_id(req.replace(b'\xa0', b'\xa2', 1)), 1234)
+        self.assertIsNone(response_id(b'\x30\x03garbage'))
+
+
+class TreePathTest(SimpleTestCase):
+    def test_tree_paths(self):
+        paths = tree_paths({1: None, 2: 1, 3: 2, 4: 1, 5: 6, 6: 5})
+        self.assertEqual(paths[3], '1/2/3/')
+        self.assertEqual(paths[4], '1/4/')
+        # loop of parents is cut
+        self.assertEqual(paths[5], '6/5/')
+        self.assertEqual(paths[6], '6/')
+
+    def test_count_in_subtrees(self):
+        counts = (('1/', 1), ('1/2/', 5), ('1/2/3/', 2), ('1/20/', 7))
+        self.assertDictEqual(count_in_subtrees({1: '1/', 2: '1/2/', 3: '1/2/3/'}, counts), {1: 15, 2: 7, 3: 2})
+
+
+class DeviceTreeTest(TestCase):
+    def setUp(self):
+        grp = Group.objects.create(title='Grp1')
+        self.olt = Device.objects.create(comment='olt', devtype='Pn', group=grp)
+        self.switch = Device.objects.create(comment='switch', devtype='Dl', group=grp, parent_dev=self.olt)
+        self.onu = Device.objects.create(comment='onu', devtype='On', group=grp, parent_dev=self.switch)
+        self.other = Device.objects.create(comment='other', devtype='Dl', group=grp)
+        Abon.objects.create(username='abon1', telephone='+79781234561', group=grp, device=self.onu)
+        Abon.objects.create(username='abon2', telephone='+79781234562', group=grp, device=self.switch)
+
+    def test_paths(self):
+        self.onu.refresh_from_db()
+        self.assertEqual(self.onu.tree_path, '%d/%d/%d/' % (self.olt.pk, self.switch.pk, self.onu.pk))
+        self.assertSetEqual(set(self.olt.get_subtree()), {self.olt, self.switch, self.onu})
+
+    def test_move(self):
+        self.switch.parent_dev = self.other
+        self.switch.save()
+        self.onu.refresh_from_db()
+        self.assertEqual(self.onu.tree_path, '%d/%d/%d/' % (self.other.pk, self.switch.pk, self.onu.pk))
+        self.assertDictEqual(affected_counts((self.olt.pk, self.other.pk)), {self.olt.pk: 0, self.other.pk: 2})
+
+    def test_loop(self):
+        self.olt.parent_dev = self.onu
+        with self.assertRaises(DeviceDBException):
+            self.olt.save()
+
+    def test_delete(self):
+        self.switch.delete()
+        self.onu.refresh_from_db()
+        self.assertEqual(self.onu.tree_path, '%d/' % self.onu.pk)
+        self.assertEqual(rebuild_tree_paths(), 0)
@@ -0,0 +1,81 @@
+#
+# Tree of devices by parent_dev. Each device keeps path of ids from root
+# (Device.tree_path), so subtree of device and subscribers attached to
+# it are taken without recursive queries, e.g. for outage of OLT.
+#
+from functools import reduce
+from operator import or_
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.db.models import Count
+
+from abonapp.models import Abon
+from devapp.models import Device, subtree_q
+
+
+def tree_paths(parents: Dict[int, Optional[int]]) -> Dict[int, str]:
+    """
+    :param parents: device id -> id of parent device
+    :return: device id -> path in tree, loops of parents are cut
+    """
+    paths = {}
+    for pk in parents:
+        chain = []
+        node = pk
+        while node is not None and node not in paths and node not in chain:
+            chain.append(node)
+            node = parents.get(node)
+        prefix = paths.get(node, '')
+        for n in reversed(chain):
+            prefix = '%s%d/' % (prefix, n)
+            paths[n] = prefix
+    return paths
+
+
+def rebuild_tree_paths() -> int:
+    """
+    Set paths of all devices from parent_dev, for devices
+    whose parent is changed without Device.save
+    :return: count of fixed devices
+    """
+    devices = list(Device.objects.only('pk', 'parent_dev_id', 'tree_path'))
+    paths = tree_paths({d.pk: d.parent_dev_id for d in devices})
+    changed = [d for d in devices if d.tree_path != paths[d.pk]]
+    for d in changed:
+        d.tree_path = paths[d.pk]
+    Device.objects.bulk_update(changed, ('tree_path',), batch_size=1000)
+    return len(changed)
+
+
+def subtree_abons(device: Device):
+    """
+    Subscribers attached to device and to all devices under it
+    """
+    return Abon.objects.filter(subtree_q(device.tree_path, 'device__tree_path'))
+
+
+def count_in_subtrees(paths: Dict[int, str], counts: Iterable[Tuple[str, int]]) -> Dict[int, int]:
+    """
+    :param paths: device id -> path of device
+    :param counts: path of device -> count of subscribers on it
+    :return: device id -> count of subscribers in subtree of device
+    """
+    counts = tuple(counts)
+    return {
+        pk: sum(n for p, n in counts if p.startswith(path))
+        for pk, path in paths.items()
+    }
+
+
+def affected_counts(device_ids: Iterable[int]) -> Dict[int, int]:
+    """
+    How many active subscribers are behind each of devices
+    """
+    paths = dict(Device.objects.filter(pk__in=device_ids).exclude(tree_path='').values_list('pk', 'tree_path'))
+    if not paths:
+        return {}
+    counts = Abon.objects.filter(
+        reduce(or_, (subtree_q(p, 'device__tree_path') for p in paths.values())),
+        is_active=True
+    ).values_list('device__tree_path').annotate(n=Count('pk')).order_by()
+    return count_in_subtrees(paths, counts)
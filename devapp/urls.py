@@ -11,6 +11,8 @@ urlpatterns = [
     path('<int:group_id>/', views.DevicesListView.as_view(), name='devs'),
     path('<int:group_id>/add/', views.DeviceCreateView.as_view(), name='add'),
     path('<int:group_id>/<int:device_id>/', views.devview, name='view'),
+    path('<int:device_id>/snapshot/', views.snapshot_state, name='snapshot_state'),
+    path('<int:device_id>/subtree/', views.subtree, name='subtree'),
     path('<int:group_id>/<int:device_id>/del/', views.DeviceDeleteView.as_view(), name='del'),
     path('<int:group_id>/<int:device_id>/add/', views.add_single_port, name='add_port'),
     path('<int:group_id>/<int:device_id>/edit/', views.DeviceUpdate.as_view(), name='edit'),
@@ -24,6 +26,7 @@ urlpatterns = [
     path('<int:group_id>/<int:device_id>/<int:port_id>/edit/', views.EditSinglePort.as_view(), name='edit_port'),
     path('fix_device_group/<int:device_id>/', views.fix_device_group, name='fix_device_group'),
     path('search_dev/', views.search_dev),
+    path('snmp_stats/', views.snmp_stats, name='snmp_stats'),
 
     # Monitoring api
     path('on_device_event/', views.OnDeviceMonitoringEvent.as_view()),
@@ -2,6 +2,7 @@ import re
 from ipaddress import ip_address
 
 from kombu.exceptions import OperationalError
+from redis.exceptions import RedisError
 
 from django.conf import settings
 from django.contrib import messages
@@ -30,7 +31,10 @@ from guardian.decorators import permission_required_or_403 as permission_require
 from guardian.shortcuts import get_objects_for_user
 from devapp.forms import DeviceForm, PortForm, DeviceExtraDataForm, DeviceRebootForm
 from devapp.models import Device, Port, DeviceDBException, DeviceMonitoringException
-from devapp.tasks import onu_register
+from devapp.snmp_pool import snmp_pool
+from devapp.snapshots import get_snapshot, get_snapshot_time, is_refreshing
+from devapp.tasks import schedule_macs_conf_update, start_snapshot_refresh
+from devapp.topology import subtree_abons
 from devapp.base_intr import DeviceImplementationError, DeviceConfigurationError
 from devapp import expect_scripts
 
@@ -92,10 +96,8 @@ class DeviceDeleteView(LoginAdminPermissionMixin, DeleteView):
                 self.object.mac_addr or '-',
                 self.object.comment or '-'
             ))
-            onu_register.delay(
-                tuple(dev.pk for dev in Device.objects.exclude(group=None).only('pk').iterator())
-            )
-        except (DeviceDBException, PermissionError, OperationalError) as e:
+            schedule_macs_conf_update()
+        except (DeviceDBException, PermissionError, OperationalError, RedisError) as e:
             messages.error(request, e)
         messages.success(request, _('Device successfully deleted'))
         return res
@@ -150,11 +152,9 @@ class DeviceUpdate(LoginAdminPermissionMixin, UpdateView):
         r = super().form_valid(form)
         # change device info in dhcpd.conf
         try:
-            onu_register.delay(
-                tuple(dev.pk for dev in Device.objects.exclude(group=None).only('pk').iterator())
-            )
+            schedule_macs_conf_update()
             messages.success(self.request, _('Device info has been saved'))
-        except (PermissionError, OperationalError) as e:
+        except (PermissionError, OperationalError, RedisError) as e:
             messages.error(self.request, e)
         return r
 
@@ -224,11 +224,9 @@ class DeviceCreateView(LoginAdminMixin, PermissionRequiredMixin, CreateView):
                     self.object.mac_addr,
                     self.object.comment
                 ))
-            onu_register.delay(
-                tuple(dev.pk for dev in Device.objects.exclude(group=None).only('pk').iterator())
-            )
+            schedule_macs_conf_update()
             messages.success(self.request, _('Device info has been saved'))
-        except (PermissionError, OperationalError) as e:
+        except (PermissionError, OperationalError, RedisError) as e:
             messages.error(self.request, e)
         return r
 
@@ -479,57 +477,82 @@ def add_single_port(request, group_id, device_id):
 @only_admins
 @permission_required('devapp.view_device')
 def devview(request, group_id: int, device_id: int):
-    ports, manager = None, None
     device = get_object_or_404(Device, id=device_id)
 
     if not device.group:
         messages.warning(request, _('Please attach group for device'))
         return redirect('devapp:fix_device_group', device.pk)
 
+    # page is rendered from snapshot, collected by devapp.tasks.refresh_device_snapshot
+    snapshot, refreshing = None, False
     template_name = 'generic_switch.html'
     try:
-        if device.ip_address and not ping(str(device.ip_address)):
-            messages.error(request, _('Dot was not pinged'))
         if device.man_passw:
-            manager = device.get_manager_object()
-            ports = tuple(manager.get_ports())
-            if ports is not None and len(ports) > 0 and isinstance(
-                    ports[0],
-                    Exception
-            ):
-                messages.error(request, ports[0])
-                ports = ports[1]
-            template_name = manager.get_template_name()
+            snapshot = get_snapshot(device.pk)
+            refreshing = is_refreshing(device.pk)
+            if snapshot is None or request.GET.get('refresh'):
+                refreshing = start_snapshot_refresh(device.pk) or refreshing
         else:
             messages.warning(request, _('Not Set snmp device password'))
-
-        # unregistered units
-        unregistered = []
-        if hasattr(manager, 'get_fibers'):
-            for fiber in manager.get_fibers():
-                for onu in manager.get_units_unregistered(int(fiber.get('fb_id'))):
-                    if onu:
-                        unregistered.append(onu)
-        return render(request, 'devapp/custom_dev_page/' + template_name, {
-            'dev': device,
-            'ports': ports,
-            'dev_accs': Abon.objects.filter(device=device),
-            'dev_manager': manager,
-            'unregistered': unregistered,
-            'ports_db': Port.objects.filter(device=device).annotate(
-                num_abons=Count('abon')
-            ),
-        })
-    except EasySNMPError as e:
-        messages.error(request,
-                       "%s: %s" % (gettext('SNMP error on device'), e))
-    except (DeviceDBException, DeviceImplementationError) as e:
+        if snapshot is not None:
+            template_name = snapshot.template
+            if snapshot.error:
+                messages.error(request, snapshot.error)
+        else:
+            template_name = device.get_manager_object().get_template_name()
+    except (RedisError, OperationalError) as e:
+        messages.error(request, e)
+    except DeviceImplementationError as e:
         messages.error(request, e)
     return render(request, 'devapp/custom_dev_page/' + template_name, {
-        'dev': device
+        'dev': device,
+        'ports': snapshot.ports if snapshot is not None else None,
+        'snapshot': snapshot,
+        'refreshing': refreshing,
+        'dev_accs': Abon.objects.filter(device=device),
+        'unregistered': snapshot.unregistered if snapshot is not None else (),
+        'ports_db': Port.objects.filter(device=device).annotate(
+            num_abons=Count('abon')
+        ),
     })
 
 
+@login_required
+@only_admins
+@permission_required('devapp.view_device')
+@json_view
+def snapshot_state(request, device_id: int):
+    """
+    Time of snapshot of device, for reload of page when refresh is done
+    """
+    try:
+        return {
+            'time': get_snapshot_time(device_id),
+            'refreshing': is_refreshing(device_id)
+        }
+    except RedisError as e:
+        return {'text': str(e)}
+
+
+@login_required
+@only_admins
+@permission_required('devapp.view_device')
+@json_view
+def subtree(request, device_id: int):
+    """
+    Devices under device and subscribers attached to them,
+    that is who is affected when device is down
+    """
+    device = get_object_or_404(Device, pk=device_id)
+    devices = device.get_subtree().values('pk', 'ip_address', 'comment', 'status', 'parent_dev_id', 'group_id')
+    abons = list(subtree_abons(device).values('pk', 'username', 'fio', 'is_active', 'device_id', 'group_id'))
+    return {
+        'devices': list(devices),
+        'abons': abons,
+        'affected': sum(1 for a in abons if a['is_active'])
+    }
+
+
 class RebootDevice(LoginAdminPermissionMixin, UpdateView):
     permission_required = 'devapp.change_device'
     template_name = 'devapp/modal_device_reboot.html'
@@ -605,6 +628,19 @@ class GroupsListView(LoginAdminMixin, global_base_views.OrderedFilteredList):
         return groups
 
 
+@login_required
+@only_admins
+@json_view
+def snmp_stats(request):
+    """
+    Requests to devices that were made by this process
+    """
+    return {
+        'idle_sessions': snmp_pool.idle_count(),
+        'hosts': snmp_pool.stats()
+    }
+
+
 @login_required
 @only_admins
 @json_view
@@ -0,0 +1,72 @@
+#!/var/www/djing/venv/bin/python
+import asyncio
+import os
+from argparse import ArgumentParser
+from collections import defaultdict
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "djing.settings")
+django.setup()
+from django.db import close_old_connections, transaction
+from agent.monitor.engine import (
+    Monitor, Target, UNDEFINED, CHECK_INTERVAL, PROBE_TIMEOUT, CONCURRENCY, TCP_PORT, CONFIRM_CHECKS
+)
+from devapp.models import Device
+from devapp.tasks import notify_device_states
+
+
+def load_devices():
+    close_old_connections()
+    targets = []
+    parents = {}
+    states = {}
+    for pk, ip, parent_id, community, status in Device.objects.values_list(
+            'pk', 'ip_address', 'parent_dev_id', 'man_passw', 'status').iterator():
+        # devices without address are only passed through by parents
+        parents[pk] = parent_id
+        if ip:
+            targets.append(Target(pk=pk, host=str(ip), community=community or None))
+            states[pk] = status
+    return targets, parents, states
+
+
+def save_states(changes):
+    close_old_connections()
+    by_state = defaultdict(list)
+    for pk, (old, new) in changes.items():
+        by_state[new].append(pk)
+    with transaction.atomic():
+        for state, pks in by_state.items():
+            Device.objects.filter(pk__in=pks).update(status=state)
+    # first state of device is not an event, else fresh install notifies about whole network
+    notify = {pk: new for pk, (old, new) in changes.items() if old != UNDEFINED}
+    if notify:
+        notify_device_states.delay(notify)
+
+
+def main():
+    parser = ArgumentParser(description='Monitoring of devices for djing')
+    parser.add_argument('-i', '--interval', type=int, default=CHECK_INTERVAL, help='seconds between checks')
+    parser.add_argument('--timeout', type=float, default=PROBE_TIMEOUT, help='seconds to wait for answer')
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help='devices checked at the same time')
+    parser.add_argument('--tcp-port', type=int, default=TCP_PORT, help='port for devices without snmp community')
+    parser.add_argument('--confirm', type=int, default=CONFIRM_CHECKS,
+                        help='failed checks in a row before device is down')
+    args = parser.parse_args()
+    monitor = Monitor(
+        load_devices, save_states,
+        interval=args.interval,
+        timeout=args.timeout,
+        concurrency=args.concurrency,
+        tcp_port=args.tcp_port,
+        confirm=args.confirm
+    )
+    loop = asyncio.get_event_loop()
+    try:
+        loop.run_until_complete(monitor.run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,35 @@
 #!/usr/bin/env python3
+import json
+import os
+import socket
 import sys
+import time
+from collections import deque
+from hashlib import sha256
+from itertools import islice
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
+from threading import Condition, Thread
 from urllib.error import HTTPError
-from urllib.parse import urlencode
+from urllib.parse import urlencode, urlsplit
 from urllib.request import urlopen
-from hashlib import sha256
 
 API_AUTH_SECRET = 'yourapikey'
 SERVER_DOMAIN = 'http://localhost:8000'
 
+# Daemon mode. Dhcp server runs this script that only passes event
+# to daemon through unix socket, daemon sends events to billing.
+SOCKET_PATH = '/run/dhcp_lever/dhcp_lever.sock'
+SOCKET_MODE = 0o666
+# Events that are not delivered yet, so they are not lost on restart
+SPOOL_PATH = '/var/lib/dhcp_lever/events.spool'
+
+# Seconds between tries to send event when billing is not available
+RETRY_MIN_TIMEOUT = 1
+RETRY_MAX_TIMEOUT = 60
+HTTP_TIMEOUT = 10
+# Max count of events in one request to billing
+BATCH_SIZE = 200
+
 
 def die(text):
     print(text)
@@ -53,20 +75,246 @@ def send_to(data, server=SERVER_DOMAIN):
         print('ERROR:', e)
 
 
+def send_to_daemon(data: dict) -> bool:
+    """
+    Pass event to daemon
+    :return: False if daemon is not running
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sk:
+            sk.sendto(json.dumps(data).encode(), SOCKET_PATH)
+        return True
+    except OSError:
+        return False
+
+
+class Spool(object):
+    """
+    Events waiting for delivery, kept on disk until billing accepts
+    them. Events are appended to the end, and position of first event
+    that is not delivered is kept in separate file, so that delivered
+    batch costs one small write. Delivered head of spool is cut off
+    when it becomes larger than the rest of spool.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offset_path = '%s.offset' % path
+        # position of first event that is not delivered, and size of spool
+        self.offset = 0
+        self.size = 0
+
+    def load(self) -> list:
+        """
+        :return: events that are not delivered, as pairs (event, size in spool)
+        """
+        try:
+            with open(self.offset_path) as f:
+                offset = int(f.read())
+        except (FileNotFoundError, ValueError):
+            offset = 0
+        events = []
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    try:
+                        events.append(json.loads(line.decode()))
+                    except ValueError:
+                        # tail of line that was not written to the end
+                        pass
+        except FileNotFoundError:
+            pass
+        if not events:
+            self.clear()
+            return []
+        return self.write(events)
+
+    def write(self, events) -> list:
+        """
+        Replace spool by events
+        :return: pairs (event, size in spool)
+        """
+        lines = [(ev, (json.dumps(ev) + '\n').encode()) for ev in events]
+        tmp_path = '%s.tmp' % self.path
+        with open(tmp_path, 'wb') as f:
+            for ev, line in lines:
+                f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, self.path)
+        self._save_offset(0)
+        self.size = sum(len(line) for ev, line in lines)
+        return [(ev, len(line)) for ev, line in lines]
+
+    def append(self, event: dict) -> int:
+        """
+        :return: size of event in spool
+        """
+        line = (json.dumps(event) + '\n').encode()
+        with open(self.path, 'ab') as f:
+            f.write(line)
+        self.size += len(line)
+        return len(line)
+
+    def advance(self, size: int):
+        """
+        Mark events of passed total size from the head of spool as delivered
+        """
+        offset = self.offset + size
+        if offset >= self.size:
+            self.clear()
+        elif offset > self.size - offset:
+            # rest is copied not more than delivered, so it is linear in total
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                rest = f.read()
+            tmp_path = '%s.tmp' % self.path
+            with open(tmp_path, 'wb') as f:
+                f.write(rest)
+            os.rename(tmp_path, self.path)
+            self._save_offset(0)
+            self.size = len(rest)
+        else:
+            self._save_offset(offset)
+
+    def _save_offset(self, offset: int):
+        self.offset = offset
+        if offset:
+            with open(self.offset_path, 'w') as f:
+                f.write(str(offset))
+        else:
+            self._remove(self.offset_path)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        self._remove(self.path)
+        self._save_offset(0)
+        self.size = 0
+
+
+class LeverDaemon(object):
+    """
+    Accepts events from unix socket and sends them to billing in order
+    of arrival through keep-alive http connection. Events that are
+    accumulated while previous request is running, are sent by one batch.
+    Each event is saved to spool until it is delivered, while billing
+    is not available sending is retried.
+    """
+
+    def __init__(self, server=SERVER_DOMAIN, socket_path=SOCKET_PATH, spool_path=SPOOL_PATH):
+        self.server = urlsplit(server)
+        self.socket_path = socket_path
+        self.spool = Spool(spool_path)
+        self.events = deque(self.spool.load())
+        self.cond = Condition()
+        self.conn = None
+
+    def put(self, event: dict):
+        with self.cond:
+            self.events.append((event, self.spool.append(event)))
+            self.cond.notify()
+
+    def _connect(self):
+        klass = HTTPSConnection if self.server.scheme == 'https' else HTTPConnection
+        self.conn = klass(self.server.netloc, timeout=HTTP_TIMEOUT)
+
+    def _close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def send(self, events: list) -> bool:
+        """
+        Send batch of events
+        :return: False if billing is not available and events should be sent again
+        """
+        body = json.dumps({'events': events}).encode()
+        query = {'body_hash': calc_hash(body)}
+        query['sign'] = make_sign(query)
+        if self.conn is None:
+            self._connect()
+        try:
+            self.conn.request('POST', '%s/abons/api/dhcp_lever/?%s' % (
+                self.server.path.rstrip('/'), urlencode(query)
+            ), body=body, headers={'Content-Type': 'application/json'})
+            resp = self.conn.getresponse()
+            # response must be read before next request on the same connection
+            body = resp.read()
+        except (HTTPException, OSError) as e:
+            print('ERROR:', e)
+            self._close()
+            return False
+        if resp.status >= 500:
+            print('ERROR: %d %s' % (resp.status, body))
+            self._close()
+            return False
+        if resp.status >= 400:
+            # request is rejected, there is no sense to repeat it
+            print('ERROR: %d %s, events dropped: %s' % (resp.status, body, events))
+        else:
+            print(body)
+        return True
+
+    def sender(self):
+        retry_timeout = RETRY_MIN_TIMEOUT
+        while True:
+            with self.cond:
+                while not self.events:
+                    self.cond.wait()
+                batch = list(islice(self.events, BATCH_SIZE))
+            if self.send([ev for ev, size in batch]):
+                retry_timeout = RETRY_MIN_TIMEOUT
+                with self.cond:
+                    for _ in batch:
+                        self.events.popleft()
+                    self.spool.advance(sum(size for ev, size in batch))
+                continue
+            time.sleep(retry_timeout)
+            retry_timeout = min(retry_timeout * 2, RETRY_MAX_TIMEOUT)
+
+    def serve_forever(self):
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        os.makedirs(os.path.dirname(self.spool.path), exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sk:
+            sk.bind(self.socket_path)
+            os.chmod(self.socket_path, SOCKET_MODE)
+            Thread(target=self.sender, daemon=True).start()
+            while True:
+                data = sk.recv(4096)
+                try:
+                    event = json.loads(data.decode())
+                except ValueError:
+                    continue
+                if isinstance(event, dict):
+                    self.put(event)
+
+
 if __name__ == "__main__":
     argv = sys.argv
-    if len(argv) < 3:
+    if len(argv) < 2:
         die(
             'Too few arguments, exiting...\n'
             'Usage:\n'
             'COMMIT: ./dhcp_lever.py commit 192.168.1.100 ff:12:c5:9f:12:56 98:45:28:85:25:1a 3\n'
-            'EXPIRY or RELEASE: ./dhcp_lever.py [release |commit]'
+            'EXPIRY or RELEASE: ./dhcp_lever.py [release |commit]\n'
+            'DAEMON: ./dhcp_lever.py daemon'
         )
     if API_AUTH_SECRET == 'your api key':
         raise NotImplementedError('You must specified secret api key')
 
     action = argv[1]
-    if action == 'commit':
+    if action == 'daemon':
+        LeverDaemon().serve_forever()
+    elif action == 'commit':
         if len(argv) < 6:
             die('Too few arguments, exiting...')
         dat = {
@@ -76,10 +324,14 @@ if __name__ == "__main__":
             'switch_port': int(argv[5]),
             'cmd': 'commit'
         }
-        send_to(dat)
+        if not send_to_daemon(dat):
+            send_to(dat)
     elif action == 'expiry' or action == 'release':
+        if len(argv) < 3:
+            die('Too few arguments, exiting...')
         dat = {
             'client_ip': argv[2],
             'cmd': action
         }
-        send_to(dat)
+        if not send_to_daemon(dat):
+            send_to(dat)
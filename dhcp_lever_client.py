@@ -0,0 +1,53 @@
+#!/usr/bin/python3 -S
+#
+# Tiny client of dhcp_lever daemon, that dhcp server runs on each event.
+# It imports only socket and passes event to daemon through unix socket,
+# full dhcp_lever.py is run only if daemon is not running.
+#
+import os
+import socket
+import sys
+
+SOCKET_PATH = '/run/dhcp_lever/dhcp_lever.sock'
+LEVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dhcp_lever.py')
+
+
+def _json_str(value: str) -> str:
+    return '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def make_event(argv):
+    """
+    Event in json, same as dhcp_lever.py makes
+    :return: None if arguments are wrong
+    """
+    if len(argv) < 2:
+        return
+    action = argv[1]
+    if action == 'commit' and len(argv) >= 6:
+        try:
+            port = int(argv[5])
+        except ValueError:
+            return
+        return '{"client_ip": %s, "client_mac": %s, "switch_mac": %s, "switch_port": %d, "cmd": "commit"}' % (
+            _json_str(argv[2]), _json_str(argv[3]), _json_str(argv[4]), port
+        )
+    elif action in ('expiry', 'release') and len(argv) >= 3:
+        return '{"client_ip": %s, "cmd": %s}' % (_json_str(argv[2]), _json_str(action))
+
+
+def main():
+    event = make_event(sys.argv)
+    if event is not None:
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sk:
+                sk.sendto(event.encode(), SOCKET_PATH)
+            return
+        except OSError:
+            pass
+    # daemon is not running, or arguments are wrong and dhcp_lever.py prints usage
+    os.execv(sys.executable, [sys.executable, LEVER_PATH] + sys.argv[1:])
+
+
+if __name__ == '__main__':
+    main()
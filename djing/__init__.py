@@ -1,5 +1,4 @@
 import importlib
-import os
 import re
 import typing as t
 from urllib.parse import unquote
@@ -9,6 +8,7 @@ from django.shortcuts import _get_queryset
 from django.utils.http import is_safe_url
 from netaddr import mac_unix, mac_eui48
 from djing.celery import app
+from djing.lib.reachability import is_reachable
 
 MAC_ADDR_REGEX = '^([0-9A-Fa-f]{1,2}[:-]){5}([0-9A-Fa-f]{1,2})$'
 
@@ -54,10 +54,9 @@ VERSION = __version__  # synonym
 default_app_config = 'abonapp.apps.AbonappConfig'
 
 
-def ping(ip_addr: str, count=1):
+def ping(ip_addr: str):
     if re.match(IP_ADDR_REGEX, ip_addr):
-        response = os.system("`which ping` -4Anq -c%d -W1 %s > /dev/null" % (count, ip_addr))
-        return response == 0
+        return is_reachable(ip_addr)
     else:
         return False
 
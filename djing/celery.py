@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.schedules import crontab
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "djing.settings")
 app = Celery('djing', broker='redis://localhost:6379/0')
@@ -7,3 +8,31 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
+
+app.conf.beat_schedule = {
+    # heal ip of subscribers when events from dhcp are lost
+    'reconcile-dhcp-leases': {
+        'task': 'abonapp.tasks.reconcile_dhcp_leases',
+        'schedule': 300.0
+    },
+    # lower speed of subscribers that exceeded traffic quota
+    'enforce-traffic-quotas': {
+        'task': 'abonapp.tasks.enforce_traffic_quotas',
+        'schedule': 300.0
+    },
+    # ports and uptime of devices for their pages
+    'poll-device-snapshots': {
+        'task': 'devapp.tasks.poll_device_snapshots',
+        'schedule': 60.0
+    },
+    # partitions for traffic of next days, and drop of old traffic
+    'maintain-traffic-tables': {
+        'task': 'traf_stat.tasks.maintain_traffic_tables',
+        'schedule': 3600.0
+    },
+    # 95th percentile of traffic for billing, for previous month
+    'month-traffic-percentiles': {
+        'task': 'traf_stat.tasks.month_traffic_percentiles',
+        'schedule': crontab(minute=30, hour=3, day_of_month=1)
+    }
+}
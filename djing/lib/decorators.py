@@ -1,6 +1,7 @@
 from functools import wraps
 from django.conf import settings
 from django.http import HttpResponseForbidden, JsonResponse
+from django.http.response import HttpResponseBase
 from django.shortcuts import redirect
 
 from djing.lib import check_sign
@@ -81,6 +82,9 @@ def json_view(fn):
     @wraps(fn)
     def wrapped(request, *args, **kwargs):
         r = fn(request, *args, **kwargs)
+        if isinstance(r, HttpResponseBase):
+            # response with own status is returned as is
+            return r
         if isinstance(r, dict) and not isinstance(r.get('text'), str):
             r['text'] = str(r.get('text'))
         return JsonResponse(r, safe=False, json_dumps_params={
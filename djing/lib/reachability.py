@@ -0,0 +1,143 @@
+#
+# Check if host is alive without spawning processes.
+# Results are cached for a short time and shared by whole process.
+#
+import errno
+import os
+import select
+import socket
+from struct import pack
+from threading import Lock
+from time import monotonic
+from typing import Iterable, Optional
+
+# How long result of probe is actual, in seconds
+REACHABILITY_TTL = 10
+
+# Tcp ports for probe when icmp is not permitted for process.
+# If host reset connection then it is alive too.
+PROBE_TCP_PORTS = (80, 22, 23)
+
+_cache = {}
+_cache_lock = Lock()
+
+
+def _checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b'\x00'
+    s = sum((data[i] << 8) + data[i + 1] for i in range(0, len(data), 2))
+    s = (s >> 16) + (s & 0xffff)
+    s += s >> 16
+    return ~s & 0xffff
+
+
+def icmp_echo(host: str, timeout=1.0) -> Optional[bool]:
+    """
+    Send one icmp echo request via unprivileged icmp socket.
+    On linux it is allowed by sysctl net.ipv4.ping_group_range.
+    :return: None if icmp sockets are not permitted for process
+    """
+    try:
+        sk = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+    except OSError:
+        return
+    with sk:
+        seq = os.getpid() & 0xffff
+        payload = b'djing'
+        # identifier is replaced by kernel
+        header = pack('!BBHHH', 8, 0, 0, 0, seq)
+        packet = pack('!BBHHH', 8, 0, _checksum(header + payload), 0, seq) + payload
+        deadline = monotonic() + timeout
+        try:
+            sk.sendto(packet, (host, 0))
+            while True:
+                left = deadline - monotonic()
+                if left <= 0:
+                    return False
+                sk.settimeout(left)
+                data = sk.recv(1024)
+                # echo reply with our sequence number
+                if len(data) >= 8 and data[0] == 0 and data[6:8] == pack('!H', seq):
+                    return True
+        except (socket.timeout, OSError):
+            return False
+
+
+def tcp_probe(host: str, port: int, timeout=1.0) -> bool:
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except ConnectionRefusedError:
+        # host answered with reset
+        return True
+    except OSError:
+        return False
+
+
+def tcp_probe_any(host: str, ports: Iterable[int], timeout=1.0) -> bool:
+    """
+    Connect to all ports at the same time, so that dead host
+    takes one timeout and not timeout for each port
+    :return: True if any port answered by connection or by reset
+    """
+    socks = {}
+    try:
+        for port in ports:
+            sk = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sk.setblocking(False)
+            code = sk.connect_ex((host, port))
+            if code in (0, errno.ECONNREFUSED):
+                sk.close()
+                return True
+            if code == errno.EINPROGRESS:
+                socks[sk.fileno()] = sk
+            else:
+                sk.close()
+        deadline = monotonic() + timeout
+        while socks:
+            left = deadline - monotonic()
+            if left <= 0:
+                return False
+            _, ready, _ = select.select((), list(socks.values()), (), left)
+            for sk in ready:
+                code = sk.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if code in (0, errno.ECONNREFUSED):
+                    return True
+                socks.pop(sk.fileno()).close()
+        return False
+    except OSError:
+        return False
+    finally:
+        for sk in socks.values():
+            sk.close()
+
+
+def is_reachable(host: str, port: Optional[int] = None, timeout=1.0, ttl=REACHABILITY_TTL) -> bool:
+    """
+    Check if host is alive
+    :param host: ip address of host
+    :param port: tcp port of service on host, for example port of NAS api.
+    If it is not passed then icmp echo is used, or tcp probes of
+    common ports when icmp is not permitted.
+    :param timeout: timeout for one probe in seconds
+    :param ttl: how long to trust previous result in seconds
+    """
+    key = (host, port)
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None and monotonic() - cached[0] < ttl:
+        return cached[1]
+    if port:
+        result = tcp_probe(host, port, timeout)
+    else:
+        result = icmp_echo(host, timeout)
+        if result is None:
+            result = tcp_probe_any(host, PROBE_TCP_PORTS, timeout)
+    with _cache_lock:
+        _cache[key] = monotonic(), result
+    return result
+
+
+def forget(host: str, port: Optional[int] = None):
+    with _cache_lock:
+        _cache.pop((host, port), None)
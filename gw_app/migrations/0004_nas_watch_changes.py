@@ -0,0 +1,35 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gw_app', '0003_nasmodel_enabled'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nasmodel',
+            name='watch_changes',
+            field=models.BooleanField(default=False, verbose_name='Watch changes on gateway'),
+        ),
+        migrations.CreateModel(
+            name='NASDriftEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField(auto_now_add=True, verbose_name='Date')),
+                ('kind', models.CharField(choices=[('queue', 'Queue'), ('ip', 'Address list')], max_length=5, verbose_name='Kind')),
+                ('item_id', models.CharField(blank=True, max_length=32, null=True, verbose_name='Id on gateway')),
+                ('description', models.CharField(max_length=255, verbose_name='Description')),
+                ('corrected', models.BooleanField(default=False, verbose_name='Corrected')),
+                ('nas', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='gw_app.NASModel', verbose_name='Network access server')),
+            ],
+            options={
+                'verbose_name': 'Gateway drift event',
+                'verbose_name_plural': 'Gateway drift events',
+                'db_table': 'nas_drift_event',
+                'ordering': ('-date',),
+            },
+        ),
+    ]
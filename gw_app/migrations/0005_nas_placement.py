@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('group_app', '0003_auto_20180808_1236'),
+        ('gw_app', '0004_nas_watch_changes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nasmodel',
+            name='groups',
+            field=models.ManyToManyField(blank=True, help_text='Subscribers from this groups may be spread between served gateways', to='group_app.Group', verbose_name='Served groups'),
+        ),
+        migrations.AddField(
+            model_name='nasmodel',
+            name='weight',
+            field=models.PositiveSmallIntegerField(blank=True, default=1, verbose_name='Weight'),
+        ),
+        migrations.AddField(
+            model_name='nasmodel',
+            name='max_queues',
+            field=models.PositiveIntegerField(blank=True, default=0, help_text='Zero is unlimited', verbose_name='Max count of queues'),
+        ),
+        migrations.AddField(
+            model_name='nasmodel',
+            name='max_bandwidth',
+            field=models.PositiveIntegerField(blank=True, default=0, help_text='Zero is unlimited', verbose_name='Max total bandwidth of services, Mbit/s'),
+        ),
+    ]
@@ -17,6 +17,20 @@ class NASModel(models.Model):
     nas_type = models.CharField(_('Type'), max_length=4, choices=MyChoicesAdapter(NAS_TYPES), default=NAS_TYPES[0][0])
     default = models.BooleanField(_('Is default'), default=False)
     enabled = models.BooleanField(_('Enabled'), default=True)
+    watch_changes = models.BooleanField(_('Watch changes on gateway'), default=False)
+    groups = models.ManyToManyField(
+        'group_app.Group', verbose_name=_('Served groups'), blank=True,
+        help_text=_('Subscribers from this groups may be spread between served gateways')
+    )
+    weight = models.PositiveSmallIntegerField(_('Weight'), default=1, blank=True)
+    max_queues = models.PositiveIntegerField(
+        _('Max count of queues'), default=0, blank=True,
+        help_text=_('Zero is unlimited')
+    )
+    max_bandwidth = models.PositiveIntegerField(
+        _('Max total bandwidth of services, Mbit/s'), default=0, blank=True,
+        help_text=_('Zero is unlimited')
+    )
 
     def get_nas_manager_klass(self):
         try:
@@ -25,20 +39,26 @@ class NASModel(models.Model):
             raise TypeError(_('One of nas types implementation is not found'))
 
     def get_nas_manager(self):
+        if hasattr(self, '_nas_mngr'):
+            return getattr(self, '_nas_mngr')
+        o = self.create_nas_manager()
+        setattr(self, '_nas_mngr', o)
+        return o
+
+    def create_nas_manager(self):
+        """
+        Makes new connection to gateway, that is not shared
+        with other users of this instance
+        """
         try:
             klass = self.get_nas_manager_klass()
-            if hasattr(self, '_nas_mngr'):
-                o = getattr(self, '_nas_mngr')
-            else:
-                o = klass(
-                    login=self.auth_login,
-                    password=self.auth_passw,
-                    ip=self.ip_address,
-                    port=int(self.ip_port),
-                    enabled=bool(self.enabled)
-                )
-                setattr(self, '_nas_mngr', o)
-            return o
+            return klass(
+                login=self.auth_login,
+                password=self.auth_passw,
+                ip=self.ip_address,
+                port=int(self.ip_port),
+                enabled=bool(self.enabled)
+            )
         except ConnectionResetError:
             raise NasNetworkError('ConnectionResetError')
 
@@ -55,6 +75,28 @@ class NASModel(models.Model):
         ordering = 'ip_address',
 
 
+class NASDriftEvent(models.Model):
+    nas = models.ForeignKey(NASModel, on_delete=models.CASCADE, verbose_name=_('Network access server'))
+    date = models.DateTimeField(_('Date'), auto_now_add=True)
+    DRIFT_KINDS = (
+        ('queue', _('Queue')),
+        ('ip', _('Address list'))
+    )
+    kind = models.CharField(_('Kind'), max_length=5, choices=DRIFT_KINDS)
+    item_id = models.CharField(_('Id on gateway'), max_length=32, null=True, blank=True)
+    description = models.CharField(_('Description'), max_length=255)
+    corrected = models.BooleanField(_('Corrected'), default=False)
+
+    def __str__(self):
+        return "%s: %s" % (self.nas, self.description)
+
+    class Meta:
+        db_table = 'nas_drift_event'
+        verbose_name = _('Gateway drift event')
+        verbose_name_plural = _('Gateway drift events')
+        ordering = '-date',
+
+
 @receiver(pre_delete, sender=NASModel)
 def nas_pre_delete(sender, **kwargs):
     nas = kwargs.get("instance")
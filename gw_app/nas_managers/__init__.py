@@ -1,6 +1,6 @@
 from gw_app.nas_managers.mod_mikrotik import MikrotikTransmitter
 from gw_app.nas_managers.core import NasNetworkError, NasFailedResult
-from gw_app.nas_managers.structs import SubnetQueue
+from gw_app.nas_managers.structs import SubnetQueue, DhcpLease
 
 # Указываем какие реализации шлюзов у нас есть, это будет использоваться в
 # web интерфейсе
@@ -1,7 +1,7 @@
 from abc import ABC, abstractmethod
-from typing import Iterator, Tuple, Optional
-from djing import ping
-from gw_app.nas_managers.structs import SubnetQueue, VectorQueue
+from typing import Iterator, Iterable, Tuple, Optional, Dict
+from djing.lib.reachability import is_reachable
+from gw_app.nas_managers.structs import SubnetQueue, VectorQueue, DhcpLease
 
 
 # Raised if gw has returned failed result
@@ -24,7 +24,7 @@ class BaseTransmitter(ABC):
         """
 
     def __init__(self, ip: str, *args, **kwargs):
-        if not ping(ip):
+        if not is_reachable(ip, port=kwargs.get('port')):
             raise NasNetworkError('NAS %(ip_addr)s does not pinged' % {
                 'ip_addr': ip
             })
@@ -66,6 +66,14 @@ class BaseTransmitter(ABC):
         :param queue: Subscriber instance
         """
 
+    def update_limits(self, queues: Iterable[SubnetQueue]):
+        """
+        Change speed of several subscribers, that are already on gateway
+        :param queues: Subscriber instances with new max_limit
+        """
+        for queue in queues:
+            self.update_user(queue)
+
     @abstractmethod
     def ping(self, host: str, count=10, arp=False) -> Optional[Tuple[int, int]]:
         """
@@ -76,10 +84,39 @@ class BaseTransmitter(ABC):
         for example (received, sent) -> (7, 10).
         """
 
+    def ping_many(self, hosts: Iterable[str], count=2) -> Dict[str, Optional[Tuple[int, int, Optional[float]]]]:
+        """
+        Ping several hosts
+        :param hosts: ip addresses in text view
+        :param count: count of ping queries for each host
+        :return: dict where key is host and value is None if host is not response,
+        else tuple (received, sent, average round trip time in milliseconds)
+        """
+        res = {}
+        for host in hosts:
+            r = self.ping(host, count=count)
+            res[host] = None if r is None else (r[0], r[1], None)
+        return res
+
     @abstractmethod
     def read_users(self) -> VectorQueue:
         pass
 
+    def listen_changes(self) -> Iterator:
+        """
+        Endless stream of changes that are made on gateway.
+        :return: generator of tuples (kind, item_id, obj), where kind is
+        'queue' or 'ip', item_id is an id of entry on gateway and obj is
+        instance of SubnetQueue or ip network, or None if entry was removed
+        """
+        raise NotImplementedError('Gateway does not support listening of changes')
+
+    def read_leases(self) -> Iterator[DhcpLease]:
+        """
+        Bound leases of dhcp server on gateway, read by one request
+        """
+        raise NotImplementedError('Gateway does not support reading of dhcp leases')
+
     @abstractmethod
     def sync_nas(self, users_from_db: Iterator):
         """
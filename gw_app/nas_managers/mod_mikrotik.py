@@ -18,6 +18,67 @@ LIST_USERS_ALLOWED = 'DjingUsersAllowed'
 LIST_DEVICES_ALLOWED = 'DjingDevicesAllowed'
 
 
+def parse_rtt(text_time: Optional[str]) -> Optional[float]:
+    """
+    Convert Mikrotik time, for example '12ms350us', to milliseconds
+    """
+    if not text_time:
+        return
+    mults = {'s': 1000.0, 'ms': 1.0, 'us': 0.001}
+    parts = re.findall(r'(\d+)(ms|us|s)', text_time)
+    if not parts:
+        return
+    return sum(int(num) * mults[unit] for num, unit in parts)
+
+
+MAC_REGEX = re.compile(r'^([0-9a-f]{2}[:-]?){5}[0-9a-f]{2}$', re.IGNORECASE)
+
+
+def _agent_id_bytes(text: str) -> Optional[bytes]:
+    """
+    Option 82 sub option may be shown as hex string
+    '0x00060011223344aa' or as bytes '0:6:0:11:22:33:44:aa'
+    """
+    text = text.strip()
+    if text.lower().startswith('0x'):
+        text = text[2:]
+    try:
+        if ':' in text:
+            return bytes(int(p, 16) for p in text.split(':'))
+        if len(text) % 2 == 0:
+            return bytes.fromhex(text)
+    except ValueError:
+        pass
+
+
+def parse_agent_remote_id(text: Optional[str]) -> Optional[str]:
+    """
+    Get switch mac from remote id of dhcp option 82
+    """
+    if not text:
+        return
+    if MAC_REGEX.match(text):
+        return text
+    b = _agent_id_bytes(text)
+    if b is not None and len(b) >= 6:
+        return ':'.join('%02x' % c for c in b[-6:])
+
+
+def parse_agent_circuit_id(text: Optional[str]) -> Optional[int]:
+    """
+    Get switch port from circuit id of dhcp option 82,
+    port is in the last byte
+    """
+    if not text:
+        return
+    b = _agent_id_bytes(text)
+    if b:
+        return b[-1]
+    m = re.search(r'(\d+)\D*$', text)
+    if m is not None:
+        return int(m.group(1))
+
+
 class ApiRos(object):
     """Routeros api"""
     __sk = None
@@ -48,6 +109,13 @@ class ApiRos(object):
     def talk_iter(self, words: Iterable):
         if self.write_sentence(words) == 0:
             return
+        while 1:
+            reply, attrs = self.read_reply()
+            yield (reply, attrs)
+            if reply == '!done':
+                return
+
+    def read_reply(self) -> Tuple[str, Dict]:
         while 1:
             i = self.read_sentence()
             if len(i) == 0:
@@ -60,9 +128,7 @@ class ApiRos(object):
                     attrs[w] = ''
                 else:
                     attrs[w[:j]] = w[j + 1:]
-            yield (reply, attrs)
-            if reply == '!done':
-                return
+            return reply, attrs
 
     def write_sentence(self, words: Iterable):
         ret = 0
@@ -430,6 +496,48 @@ class MikrotikTransmitter(core.BaseTransmitter, ApiRos,
             if res_ips:
                 self.remove_ip(res_ips.get('=.id'))
 
+    def update_limits(self, queues: Iterable[i_structs.SubnetQueue], window=32):
+        # Queues are changed by name without searching of them,
+        # several commands are running at the same time
+        queues = iter(queues)
+        running = {}
+        failed = []
+        tag_num = 0
+
+        def send_next():
+            nonlocal tag_num
+            queue = next(queues, None)
+            if queue is None:
+                return False
+            tag_num += 1
+            tag = str(tag_num)
+            self.write_sentence((
+                '/queue/simple/set',
+                '=numbers=%s' % queue.name,
+                '=max-limit=%.3fM/%.3fM' % queue.max_limit,
+                '=burst-limit=%.3fM/%.3fM' % tuple(i * 2 for i in queue.max_limit),
+                '=burst-threshold=%.3fM/%.3fM' % tuple(i / 1.2 for i in queue.max_limit),
+                '.tag=%s' % tag
+            ))
+            running[tag] = queue
+            return True
+
+        while len(running) < window and send_next():
+            pass
+        while running:
+            reply, attrs = self.read_reply()
+            tag = attrs.get('.tag')
+            if tag not in running:
+                continue
+            if reply == '!trap':
+                failed.append(running[tag])
+            elif reply == '!done':
+                del running[tag]
+                send_next()
+        # queue is absent on gateway
+        for queue in failed:
+            self.update_user(queue)
+
     def ping(self, host, count=10, arp=False) -> Optional[Tuple[int, int]]:
         params = [
             '/ping', '=address=%s' % host,
@@ -453,9 +561,97 @@ class MikrotikTransmitter(core.BaseTransmitter, ApiRos,
             received, sent = int(res.get('=received')), int(res.get('=sent'))
             return received, sent
 
+    def ping_many(self, hosts: Iterable[str], count=2, window=32) -> Dict[str, Optional[Tuple[int, int, Optional[float]]]]:
+        # Several pings are running on gateway at the same time,
+        # replies are separated by tags
+        hosts = iter(hosts)
+        running = {}
+        results = {}
+        tag_num = 0
+
+        def send_next():
+            nonlocal tag_num
+            host = next(hosts, None)
+            if host is None:
+                return False
+            tag_num += 1
+            tag = str(tag_num)
+            self.write_sentence((
+                '/ping', '=address=%s' % host,
+                '=interval=100ms', '=count=%d' % count,
+                '.tag=%s' % tag
+            ))
+            running[tag] = host, {}
+            return True
+
+        while len(running) < window and send_next():
+            pass
+        while running:
+            reply, attrs = self.read_reply()
+            tag = attrs.get('.tag')
+            if tag not in running:
+                continue
+            host, last_attrs = running[tag]
+            if reply == '!re':
+                last_attrs.update(attrs)
+            elif reply == '!trap':
+                last_attrs.clear()
+                last_attrs['=trap'] = attrs.get('=message')
+            elif reply == '!done':
+                del running[tag]
+                if '=trap' in last_attrs or '=received' not in last_attrs:
+                    results[host] = None
+                else:
+                    results[host] = (
+                        int(last_attrs.get('=received')),
+                        int(last_attrs.get('=sent')),
+                        parse_rtt(last_attrs.get('=avg-rtt'))
+                    )
+                send_next()
+        return results
+
+    def read_leases(self) -> Generator:
+        leases = self._exec_cmd_iter((
+            '/ip/dhcp-server/lease/print',
+            '=.proplist=active-address,active-mac-address,agent-remote-id,agent-circuit-id',
+            '?status=bound'
+        ))
+        for dat in leases:
+            ip = dat.get('=active-address')
+            if not ip:
+                continue
+            yield i_structs.DhcpLease(
+                ip=ip, mac=dat.get('=active-mac-address'),
+                switch_mac=parse_agent_remote_id(dat.get('=agent-remote-id')),
+                switch_port=parse_agent_circuit_id(dat.get('=agent-circuit-id'))
+            )
+
     def read_users(self) -> i_structs.VectorQueue:
         return self.read_queue_iter()
 
+    def listen_changes(self) -> Generator:
+        # Command 'listen' never finishes, so that connection
+        # can not be used for anything else after it
+        self.write_sentence(('/queue/simple/listen', '.tag=queue'))
+        self.write_sentence(('/ip/firewall/address-list/listen', '.tag=ip'))
+        while 1:
+            reply, attrs = self.read_reply()
+            if reply == '!trap':
+                raise core.NasFailedResult(attrs.get('=message'))
+            elif reply != '!re':
+                continue
+            tag = attrs.get('.tag')
+            item_id = attrs.get('=.id')
+            is_dead = attrs.get('=.dead') == 'true'
+            if tag == 'queue':
+                yield 'queue', item_id, None if is_dead else self._build_shape_obj(attrs)
+            elif tag == 'ip':
+                if is_dead or attrs.get('=list') != LIST_USERS_ALLOWED or attrs.get('=dynamic') == 'true':
+                    # entry is not in our list any more
+                    yield 'ip', item_id, None
+                else:
+                    yield 'ip', item_id, ip_network(attrs.get('=address'), strict=False)
+
     def sync_nas(self, users_from_db: Iterator):
         queues_from_db = (
             ab.build_agent_struct() for ab in users_from_db
@@ -1,6 +1,6 @@
 from abc import ABCMeta
 from ipaddress import ip_network, _BaseNetwork
-from typing import Iterable
+from typing import Iterable, Optional
 
 
 class BaseStruct(object, metaclass=ABCMeta):
@@ -60,3 +60,22 @@ class SubnetQueue(BaseStruct):
 
 
 VectorQueue = Iterable[SubnetQueue]
+
+
+class DhcpLease(BaseStruct):
+    """
+    Bound lease from dhcp server on gateway, switch_mac and
+    switch_port are taken from dhcp option 82
+    """
+    __slots__ = ('ip', 'mac', 'switch_mac', 'switch_port')
+
+    def __init__(self, ip: str, mac: Optional[str] = None,
+                 switch_mac: Optional[str] = None, switch_port: Optional[int] = None):
+        super().__init__()
+        self.ip = ip
+        self.mac = mac
+        self.switch_mac = switch_mac
+        self.switch_port = switch_port
+
+    def __repr__(self):
+        return "lease %s on %s port %s" % (self.ip, self.switch_mac, self.switch_port)
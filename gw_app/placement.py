@@ -0,0 +1,318 @@
+from collections import defaultdict
+from typing import Iterable, List, Optional, Tuple, Dict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Sum, F
+
+from abonapp.models import Abon
+from gw_app.models import NASModel
+from gw_app.nas_managers import NasNetworkError, NasFailedResult
+
+# How many subscribers may be moved between gateways by one run
+MAX_MOVES_PER_RUN = 50
+
+# How many subscribers are moved with one connection to gateways
+MOVES_BATCH_SIZE = 10
+
+
+class NasLoad(object):
+    """
+    Current load of gateway: count of queues and total
+    bandwidth of services of subscribers on it
+    """
+    __slots__ = ('nas', 'queues', 'bandwidth', 'weight', 'max_queues', 'max_bandwidth')
+
+    def __init__(self, nas, queues=0, bandwidth=0.0, weight=1,
+                 max_queues=0, max_bandwidth=0):
+        self.nas = nas
+        self.queues = queues
+        self.bandwidth = bandwidth
+        self.weight = weight
+        self.max_queues = max_queues
+        self.max_bandwidth = max_bandwidth
+
+    def has_room(self, bandwidth: float) -> bool:
+        if self.max_queues and self.queues + 1 > self.max_queues:
+            return False
+        if self.max_bandwidth and self.bandwidth + bandwidth > self.max_bandwidth:
+            return False
+        return True
+
+    def add(self, bandwidth: float):
+        self.queues += 1
+        self.bandwidth += bandwidth
+
+    def remove(self, bandwidth: float):
+        self.queues -= 1
+        self.bandwidth -= bandwidth
+
+    def score(self, total_queues: int, total_bandwidth: float, total_weight: int,
+              queues=0, bandwidth=0.0) -> float:
+        """
+        How much gateway is loaded relative to its weight. 1.0 means
+        that gateway has exactly its share of load.
+        :param queues: count of queues that would be added to gateway
+        :param bandwidth: bandwidth that would be added to gateway
+        """
+        if not self.weight or not total_weight:
+            return float('inf')
+        share = self.weight / total_weight
+        q = (self.queues + queues) / total_queues if total_queues else 0.0
+        b = (self.bandwidth + bandwidth) / total_bandwidth if total_bandwidth else 0.0
+        return max(q, b) / share
+
+    def __repr__(self):
+        return "%s: %d queues, %.2f Mbit/s" % (self.nas, self.queues, self.bandwidth)
+
+
+def _totals(loads: Iterable[NasLoad]) -> Tuple[int, float, int]:
+    loads = tuple(loads)
+    return (
+        sum(l.queues for l in loads),
+        sum(l.bandwidth for l in loads),
+        sum(l.weight for l in loads)
+    )
+
+
+def pick_nas(loads: List[NasLoad], bandwidth: float) -> Optional[NasLoad]:
+    """
+    Choose gateway for new subscriber with service of passed bandwidth
+    :return: None if all gateways are full
+    """
+    total_queues, total_bandwidth, total_weight = _totals(loads)
+    total_queues += 1
+    total_bandwidth += bandwidth
+    candidates = [l for l in loads if l.weight and l.has_room(bandwidth)]
+    if not candidates:
+        return
+    return min(candidates, key=lambda l: l.score(
+        total_queues, total_bandwidth, total_weight, 1, bandwidth
+    ))
+
+
+def plan_moves(loads: List[NasLoad], customers: Dict[int, List[Tuple[int, float]]],
+               max_moves: int) -> List[Tuple[int, NasLoad, NasLoad]]:
+    """
+    Plan moving of subscribers from most loaded gateways to least loaded
+    :param loads: loads of gateways
+    :param customers: movable subscribers by nas id, list of pairs (uid, bandwidth)
+    :param max_moves: max count of moves
+    :return: list of (uid, from, to)
+    """
+    moves = []
+    total_queues, total_bandwidth, total_weight = _totals(loads)
+    if len(loads) < 2 or not total_queues:
+        return moves
+
+    def score(l: NasLoad, queues=0, bandwidth=0.0):
+        return l.score(total_queues, total_bandwidth, total_weight, queues, bandwidth)
+
+    while len(moves) < max_moves:
+        src = max(loads, key=score)
+        src_score = score(src)
+        best = None
+        for dst in loads:
+            if dst is src:
+                continue
+            for uid, bw in customers.get(src.nas.pk, ()):
+                if not dst.has_room(bw):
+                    continue
+                worst = max(score(src, -1, -bw), score(dst, 1, bw))
+                if worst < src_score and (best is None or worst < best[0]):
+                    best = worst, uid, bw, dst
+        if best is None:
+            break
+        _, uid, bw, dst = best
+        src.remove(bw)
+        dst.add(bw)
+        customers[src.nas.pk].remove((uid, bw))
+        customers.setdefault(dst.nas.pk, []).append((uid, bw))
+        moves.append((uid, src, dst))
+    return moves
+
+
+class NasPlacement(object):
+    """
+    Spreads subscribers of group between enabled gateways that serve it
+    """
+
+    def __init__(self, group, max_moves=MAX_MOVES_PER_RUN, batch_size=MOVES_BATCH_SIZE):
+        self.group = group
+        self.max_moves = max_moves
+        self.batch_size = batch_size
+        self.nas_list = tuple(NASModel.objects.filter(groups=group, enabled=True))
+
+    def _customers(self):
+        return Abon.objects.filter(group=self.group).exclude(current_tariff=None)
+
+    def get_loads(self) -> List[NasLoad]:
+        stats = Abon.objects.filter(nas__in=self.nas_list).exclude(
+            current_tariff=None
+        ).values('nas').annotate(
+            queues=Count('pk'),
+            bandwidth=Sum(
+                F('current_tariff__tariff__speedIn') + F('current_tariff__tariff__speedOut')
+            )
+        )
+        stats = {s['nas']: s for s in stats}
+        loads = []
+        for nas in self.nas_list:
+            s = stats.get(nas.pk, {})
+            loads.append(NasLoad(
+                nas, queues=s.get('queues') or 0, bandwidth=s.get('bandwidth') or 0.0,
+                weight=nas.weight, max_queues=nas.max_queues,
+                max_bandwidth=nas.max_bandwidth
+            ))
+        return loads
+
+    def place(self) -> int:
+        """
+        Attach gateway to subscribers from group that have not it.
+        Queues of subscribers that were on other gateway are removed from it
+        :return: count of placed subscribers
+        """
+        if not self.nas_list:
+            return 0
+        loads = self.get_loads()
+        unplaced = self._customers().exclude(nas__in=self.nas_list).annotate(
+            bandwidth=F('current_tariff__tariff__speedIn') + F('current_tariff__tariff__speedOut')
+        ).values_list('pk', 'nas', 'bandwidth')
+        placed = defaultdict(list)
+        previous = {}
+        for uid, old_nas_id, bw in unplaced.iterator():
+            load = pick_nas(loads, bw or 0.0)
+            if load is None:
+                print('NasPlacement: all gateways for group %s are full' % self.group)
+                break
+            load.add(bw or 0.0)
+            placed[load.nas].append(uid)
+            if old_nas_id is not None:
+                previous[uid] = old_nas_id
+        count = 0
+        moved = defaultdict(list)
+        for nas, uids in placed.items():
+            uids = self._attach(nas, uids)
+            self._push(nas, uids)
+            count += len(uids)
+            for uid in uids:
+                if uid in previous:
+                    moved[previous[uid]].append(uid)
+        for old_nas in NASModel.objects.filter(pk__in=moved.keys()):
+            self._pull(old_nas, moved[old_nas.pk])
+        return count
+
+    @staticmethod
+    def _attach(nas: NASModel, uids: List[int]) -> List[int]:
+        """
+        Set gateway of subscribers by one query, or one by one if address
+        of some subscriber is already busy on gateway, those are skipped
+        :return: ids of subscribers that are attached
+        """
+        try:
+            with transaction.atomic():
+                Abon.objects.filter(pk__in=uids).update(nas=nas)
+            return uids
+        except IntegrityError:
+            pass
+        attached = []
+        for uid in uids:
+            try:
+                with transaction.atomic():
+                    Abon.objects.filter(pk=uid).update(nas=nas)
+                attached.append(uid)
+            except IntegrityError as e:
+                print('NasPlacement:', e)
+        return attached
+
+    def _push(self, nas: NASModel, uids: Iterable[int]):
+        try:
+            mngr = nas.get_nas_manager()
+            for abon in Abon.objects.filter(pk__in=uids).select_related('current_tariff__tariff').iterator():
+                queue = abon.build_agent_struct()
+                if queue is not None and queue.is_access:
+                    mngr.add_user(queue)
+        except (NasNetworkError, NasFailedResult, ConnectionResetError) as e:
+            # periodic sync will add them later
+            print('NasPlacement:', e)
+
+    @staticmethod
+    def _pull(nas: NASModel, uids: Iterable[int]):
+        """
+        Remove queues of subscribers that are moved from gateway
+        """
+        try:
+            mngr = nas.get_nas_manager()
+            for abon in Abon.objects.filter(pk__in=uids).select_related('current_tariff__tariff').iterator():
+                queue = abon.build_agent_struct()
+                if queue is not None:
+                    mngr.remove_user(queue)
+        except (NasNetworkError, NasFailedResult, ConnectionResetError) as e:
+            print('NasPlacement:', e)
+
+    def rebalance(self) -> int:
+        """
+        Move subscribers from overloaded gateways to others, no more
+        than max_moves subscribers per run
+        :return: count of moved subscribers
+        """
+        loads = self.get_loads()
+        customers = defaultdict(list)
+        movable = self._customers().filter(nas__in=self.nas_list).exclude(
+            ip_address=None
+        ).annotate(
+            bandwidth=F('current_tariff__tariff__speedIn') + F('current_tariff__tariff__speedOut')
+        ).values_list('pk', 'nas', 'bandwidth')
+        for uid, nas_id, bw in movable.iterator():
+            customers[nas_id].append((uid, bw or 0.0))
+        moves = plan_moves(loads, customers, self.max_moves)
+
+        by_direction = defaultdict(list)
+        for uid, src, dst in moves:
+            by_direction[(src.nas, dst.nas)].append(uid)
+        count = 0
+        for (src, dst), uids in by_direction.items():
+            for i in range(0, len(uids), self.batch_size):
+                count += self.migrate(src, dst, uids[i:i + self.batch_size])
+        return count
+
+    @staticmethod
+    def migrate(src: NASModel, dst: NASModel, uids: List[int]) -> int:
+        """
+        Move subscribers from one gateway to another. Queue of each subscriber
+        is added to new gateway before it is removed from old one, and gateway
+        of subscriber is changed in the same transaction, so that subscriber
+        that fails to move stays on old gateway
+        :return: count of moved subscribers
+        """
+        abons = Abon.objects.filter(pk__in=uids, nas=src).select_related('current_tariff__tariff')
+        count = 0
+        try:
+            src_mngr = src.get_nas_manager()
+            dst_mngr = dst.get_nas_manager()
+        except (NasNetworkError, NasFailedResult, ConnectionResetError) as e:
+            print('NasPlacement:', e)
+            return 0
+        for abon in abons:
+            queue = abon.build_agent_struct()
+            added = False
+            try:
+                with transaction.atomic():
+                    Abon.objects.filter(pk=abon.pk).update(nas=dst)
+                    if queue is not None:
+                        if queue.is_access:
+                            dst_mngr.add_user(queue)
+                            added = True
+                        src_mngr.remove_user(queue)
+                count += 1
+            except IntegrityError as e:
+                # address of subscriber is busy on new gateway
+                print('NasPlacement:', e)
+            except (NasNetworkError, NasFailedResult, ConnectionResetError) as e:
+                print('NasPlacement:', e)
+                if added:
+                    try:
+                        dst_mngr.remove_user(queue)
+                    except (NasNetworkError, NasFailedResult, ConnectionResetError) as e:
+                        print('NasPlacement:', e)
+                break
+        return count
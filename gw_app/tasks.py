@@ -0,0 +1,16 @@
+from celery import shared_task
+
+from group_app.models import Group
+from gw_app.placement import NasPlacement
+
+
+@shared_task
+def rebalance_group_nas(group_id: int):
+    try:
+        group = Group.objects.get(pk=group_id)
+        placement = NasPlacement(group)
+        placed = placement.place()
+        moved = placement.rebalance()
+        return 'Group "%s": placed %d, moved %d subscribers' % (group, placed, moved)
+    except Group.DoesNotExist:
+        return 'Group with pk=%d does not exist' % group_id
@@ -4,10 +4,12 @@ from abonapp.models import Abon
 from accounts_app.models import UserProfile
 from django.conf import settings
 from django.shortcuts import resolve_url
-from django.test import TestCase, override_settings
+from django.test import TestCase, SimpleTestCase, override_settings
 from group_app.models import Group
 from gw_app.models import NASModel
 from gw_app.nas_managers import MikrotikTransmitter
+from gw_app.nas_managers.mod_mikrotik import parse_rtt, parse_agent_remote_id, parse_agent_circuit_id
+from gw_app.placement import NasLoad, NasPlacement, pick_nas, plan_moves
 
 
 class MyBaseTestCase(metaclass=ABCMeta):
@@ -226,3 +228,91 @@ class NASModelTestCase(MyBaseTestCase, TestCase):
         self.assertIs(r, MikrotikTransmitter)
         r = self.nas.get_nas_manager()
         self.assertIsInstance(r, MikrotikTransmitter)
+
+
+class NasPlacementTestCase(SimpleTestCase):
+    class FakeNas(object):
+        def __init__(self, pk):
+            self.pk = pk
+
+    def test_pick_nas(self):
+        loads = [
+            NasLoad(self.FakeNas(1), queues=10, bandwidth=100.0),
+            NasLoad(self.FakeNas(2), queues=2, bandwidth=20.0)
+        ]
+        self.assertIs(pick_nas(loads, 10.0), loads[1])
+
+        # first nas with greater weight takes more load
+        loads[0].weight = 8
+        self.assertIs(pick_nas(loads, 10.0), loads[0])
+
+        # full gateway is not used
+        loads[0].max_queues = 10
+        self.assertIs(pick_nas(loads, 10.0), loads[1])
+        loads[1].max_bandwidth = 25
+        self.assertIsNone(pick_nas(loads, 10.0))
+
+    def test_plan_moves(self):
+        loads = [
+            NasLoad(self.FakeNas(1), queues=6, bandwidth=60.0),
+            NasLoad(self.FakeNas(2), queues=0, bandwidth=0.0)
+        ]
+        customers = {1: [(uid, 10.0) for uid in range(6)]}
+        moves = plan_moves(loads, customers, max_moves=10)
+        self.assertEqual(len(moves), 3)
+        self.assertEqual(loads[0].queues, 3)
+        self.assertEqual(loads[1].queues, 3)
+
+        # churn is bounded
+        loads = [
+            NasLoad(self.FakeNas(1), queues=6, bandwidth=60.0),
+            NasLoad(self.FakeNas(2), queues=0, bandwidth=0.0)
+        ]
+        customers = {1: [(uid, 10.0) for uid in range(6)]}
+        moves = plan_moves(loads, customers, max_moves=1)
+        self.assertEqual(len(moves), 1)
+
+
+class NasAttachTestCase(TestCase):
+    def test_busy_address_is_skipped(self):
+        nas = NASModel.objects.create(
+            title='Title', ip_address='192.168.8.12', ip_port=123,
+            auth_login='admin', auth_passw='admin', nas_type='mktk'
+        )
+        a1 = Abon.objects.create_user(telephone='+79781234567', username='abon1', password='passw1')
+        a2 = Abon.objects.create_user(telephone='+79781234568', username='abon2', password='passw2')
+        a3 = Abon.objects.create_user(telephone='+79781234569', username='abon3', password='passw3')
+        a1.ip_address = a2.ip_address = '10.0.0.2'
+        a3.ip_address = '10.0.0.3'
+        a1.nas = nas
+        a1.save(update_fields=('ip_address', 'nas'))
+        a2.save(update_fields=('ip_address',))
+        a3.save(update_fields=('ip_address',))
+        self.assertListEqual(NasPlacement._attach(nas, [a2.pk, a3.pk]), [a3.pk])
+        self.assertIsNone(Abon.objects.get(pk=a2.pk).nas)
+
+
+class ParseRttTestCase(SimpleTestCase):
+    def test_parse(self):
+        self.assertEqual(parse_rtt('1ms'), 1.0)
+        self.assertAlmostEqual(parse_rtt('12ms350us'), 12.35)
+        self.assertAlmostEqual(parse_rtt('850us'), 0.85)
+        self.assertEqual(parse_rtt('1s'), 1000.0)
+
+    def test_empty(self):
+        self.assertIsNone(parse_rtt(None))
+        self.assertIsNone(parse_rtt(''))
+        self.assertIsNone(parse_rtt('timeout'))
+
+
+class ParseAgentIdTestCase(SimpleTestCase):
+    def test_remote_id(self):
+        self.assertEqual(parse_agent_remote_id('0x0006001122334455'), '00:11:22:33:44:55')
+        self.assertEqual(parse_agent_remote_id('0:6:0:11:22:33:44:55'), '00:11:22:33:44:55')
+        self.assertEqual(parse_agent_remote_id('00:11:22:33:44:55'), '00:11:22:33:44:55')
+        self.assertIsNone(parse_agent_remote_id(''))
+
+    def test_circuit_id(self):
+        self.assertEqual(parse_agent_circuit_id('0x000400010003'), 3)
+        self.assertEqual(parse_agent_circuit_id('eth1/0/7'), 7)
+        self.assertIsNone(parse_agent_circuit_id(None))
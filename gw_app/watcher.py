@@ -0,0 +1,154 @@
+import re
+from threading import Thread, Event
+from typing import Optional
+
+from django.db import connection
+
+from abonapp.models import Abon
+from gw_app.models import NASModel, NASDriftEvent
+from gw_app.nas_managers import NasNetworkError, NasFailedResult, SubnetQueue
+from gw_app.nas_managers.mod_mikrotik import LIST_USERS_ALLOWED
+
+QUEUE_NAME_REGEX = re.compile(r'^uid(\d+)$')
+
+# Seconds to wait before reconnect to gateway after network failure
+RECONNECT_TIMEOUT = 30
+
+
+class NasWatcher(Thread):
+    """
+    Listens changes on gateway, and corrects only entries that
+    has been changed by someone instead of reading all
+    entries on every sync.
+    """
+
+    def __init__(self, nas: NASModel):
+        super(NasWatcher, self).__init__(daemon=True)
+        self.nas = nas
+        self.stop_event = Event()
+        # local view of gateway state, id on gateway -> entry
+        self.queues = {}
+        self.nets = {}
+        self.mngr = None
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.watch()
+            except (NasNetworkError, NasFailedResult, ConnectionError, OSError) as e:
+                print('NasWatcher %s:' % self.nas, e)
+            finally:
+                # thread has own db connection, do not keep it while waiting
+                connection.close()
+            self.stop_event.wait(RECONNECT_TIMEOUT)
+
+    def watch(self):
+        # one connection streams changes, other makes corrections
+        listener = self.nas.create_nas_manager()
+        self.mngr = self.nas.create_nas_manager()
+        self.load_state()
+        for kind, item_id, obj in listener.listen_changes():
+            if self.stop_event.is_set():
+                return
+            if kind == 'queue':
+                self.on_queue_changed(item_id, obj)
+            elif kind == 'ip':
+                self.on_ip_changed(item_id, obj)
+
+    def load_state(self):
+        self.queues = {q.queue_id: q for q in self.mngr.read_queue_iter()}
+        self.nets = {n.queue_id: n for n in self.mngr.read_nets_iter(LIST_USERS_ALLOWED)}
+
+    def record(self, kind: str, item_id: Optional[str], description: str, corrected: bool):
+        NASDriftEvent.objects.create(
+            nas=self.nas, kind=kind, item_id=item_id,
+            description=description[:255], corrected=corrected
+        )
+
+    def _expected_queue(self, uid: int) -> Optional[SubnetQueue]:
+        abon = Abon.objects.filter(pk=uid, nas=self.nas).select_related(
+            'current_tariff__tariff'
+        ).first()
+        if abon is None or not abon.is_access():
+            return
+        return abon.build_agent_struct()
+
+    #################################################
+    #                    QUEUES
+    #################################################
+
+    def on_queue_changed(self, item_id: str, queue: Optional[SubnetQueue]):
+        if queue is None:
+            old_queue = self.queues.pop(item_id, None)
+            if old_queue is not None:
+                self.correct_queue(old_queue.name)
+            return
+        old_queue = self.queues.get(item_id)
+        if old_queue is not None and old_queue == queue and old_queue.is_access == queue.is_access:
+            # nothing interesting has been changed, counters for example
+            return
+        self.queues[item_id] = queue
+        self.correct_queue(queue.name)
+
+    def correct_queue(self, name: str):
+        m = QUEUE_NAME_REGEX.match(name)
+        if m is None:
+            # queue is not made by billing
+            return
+        expected = self._expected_queue(int(m.group(1)))
+        on_gw = [q for q in self.queues.values() if q.name == name]
+        if expected is None:
+            if on_gw:
+                self.mngr.remove_queue_range(q.queue_id for q in on_gw)
+                for q in on_gw:
+                    self.queues.pop(q.queue_id, None)
+                self.record('queue', on_gw[0].queue_id, 'Excess queue %s' % name, True)
+        elif not on_gw:
+            self.mngr.add_queue(expected)
+            self.record('queue', None, 'Queue %s is lost' % name, True)
+        else:
+            actual, duplicates = on_gw[0], on_gw[1:]
+            if duplicates:
+                self.mngr.remove_queue_range(q.queue_id for q in duplicates)
+                for q in duplicates:
+                    self.queues.pop(q.queue_id, None)
+                self.record('queue', duplicates[0].queue_id, 'Duplicate queue %s' % name, True)
+            if actual != expected or not actual.is_access:
+                self.mngr.update_queue(expected)
+                self.record('queue', actual.queue_id, 'Queue %s has been changed' % name, True)
+
+    #################################################
+    #         Ip->firewall->address list
+    #################################################
+
+    def on_ip_changed(self, item_id: str, net):
+        if net is None:
+            old_net = self.nets.pop(item_id, None)
+            if old_net is not None:
+                self.correct_ip(old_net)
+            return
+        net.queue_id = item_id
+        self.nets[item_id] = net
+        self.correct_ip(net)
+
+    def correct_ip(self, net):
+        if net.prefixlen == net.max_prefixlen:
+            ip = str(net.network_address)
+        else:
+            ip = net.with_prefixlen
+        abon = Abon.objects.filter(ip_address=ip, nas=self.nas).select_related(
+            'current_tariff__tariff'
+        ).first()
+        is_expected = abon is not None and abon.is_access()
+        on_gw = [n for n in self.nets.values() if n == net]
+        if is_expected and not on_gw:
+            self.mngr.add_ip(LIST_USERS_ALLOWED, net)
+            self.record('ip', None, 'Address %s is lost' % net, True)
+        elif not is_expected and on_gw:
+            self.mngr.remove_ip_range(n.queue_id for n in on_gw)
+            for n in on_gw:
+                self.nets.pop(n.queue_id, None)
+            self.record('ip', on_gw[0].queue_id, 'Excess address %s' % net, True)
@@ -87,7 +87,7 @@ find . -type d \( -path ./venv -o -path ./src -o -path ./.git \) -prune -o -type
 # files
 find . -type d \( -path ./venv -o -path ./src -o -path ./.git \) -prune -o -type f -exec chmod 640 {} \;
 # exec scripts
-chmod 750 dhcp_lever.py manage.py periodic.py devapp/expect_scripts/dlink_DGS1100_reboot.exp agent/netflow/netflow_handler.py
+chmod 750 dhcp_lever.py dhcp_lever_client.py manage.py periodic.py devapp/expect_scripts/dlink_DGS1100_reboot.exp agent/netflow/netflow_handler.py
 chmod 750 agent/netflow/netflow_handler_slave.sh
 chmod 400 djing/settings.py
 
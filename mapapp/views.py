@@ -8,6 +8,7 @@ from django.utils.decorators import method_decorator
 from django.db.models import Count
 from django.views.generic import ListView
 from django.conf import settings
+from redis.exceptions import RedisError
 
 from group_app.models import Group
 from .models import Dot
@@ -15,6 +16,8 @@ from .forms import DotForm
 from djing.lib import safe_int
 from djing.lib.decorators import only_admins, json_view
 from devapp.models import Device
+from devapp.topology import affected_counts
+from traf_stat.online import get_online_counts
 from guardian.decorators import permission_required
 
 
@@ -32,10 +35,16 @@ def home(request):
     if not request.user.is_superuser:
         return redirect('/')
     dots = Dot.objects.all()
-    groups = Group.objects.all()
+    groups = tuple(Group.objects.all())
+    try:
+        online = get_online_counts()
+    except RedisError:
+        online = None
+    for grp in groups:
+        grp.online_count = None if online is None else online.get(grp.pk, 0)
     return render(request, 'maps/ya_index.html', {
         'dots': dots.iterator(),
-        'groups': groups.iterator()
+        'groups': groups
     })
 
 
@@ -107,26 +116,30 @@ def remove(request, did):
 def get_dots(request):
     if not request.user.is_superuser:
         return HttpResponseForbidden('you have not super user')
-    dots = Dot.objects.prefetch_related('devices').annotate(devcount=Count('devices')).defer('attachment').iterator()
+    dots = Dot.objects.prefetch_related('devices').annotate(devcount=Count('devices')).defer('attachment')
+    dots = [(e, next(iter(e.devices.all()), None)) for e in dots]
+    # subscribers behind devices that are down, by one query
+    affected = affected_counts([dev.pk for e, dev in dots if dev is not None and dev.status in ('dwn', 'unr')])
 
     def fill_dev(dev: Device):
         return {
             'status': dev.status,
-            'comment': dev.comment
+            'comment': dev.comment,
+            'affected': affected.get(dev.pk, 0)
         } if dev is not None else None
 
     is_obtain_pk = request.GET.get('is_obtain_pk')
 
     if is_obtain_pk == 'on':
         res = dict()
-        for e in dots:
+        for e, dev in dots:
             res[str(e.pk)] = {
                 'devcount': e.devcount,
                 'latitude': e.latitude,
                 'longitude': e.longitude,
                 'title': e.title,
                 'pk': e.pk,
-                'device': fill_dev(e.devices.first())
+                'device': fill_dev(dev)
             }
     else:
         res = [{
@@ -135,8 +148,8 @@ def get_dots(request):
             'longitude': e.longitude,
             'title': e.title,
             'pk': e.pk,
-            'device': fill_dev(e.devices.first())
-        } for e in dots]
+            'device': fill_dev(dev)
+        } for e, dev in dots]
 
     return res
 
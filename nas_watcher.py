@@ -0,0 +1,25 @@
+#!/var/www/djing/venv/bin/python
+import os
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "djing.settings")
+django.setup()
+from gw_app.models import NASModel
+from gw_app.watcher import NasWatcher
+
+
+def main():
+    watchers = tuple(NasWatcher(nas) for nas in NASModel.objects.filter(
+        enabled=True, watch_changes=True
+    ))
+    if not watchers:
+        print('There are no gateways for watching')
+        return
+    for w in watchers:
+        w.start()
+    for w in watchers:
+        w.join()
+
+
+if __name__ == "__main__":
+    main()
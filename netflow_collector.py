@@ -0,0 +1,62 @@
+#!/var/www/djing/venv/bin/python
+import asyncio
+import os
+from argparse import ArgumentParser
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "djing.settings")
+django.setup()
+from django.db import close_old_connections
+from abonapp.models import Abon
+from agent.netflow.collector import Collector, FLUSH_INTERVAL
+from traf_stat.models import save_flows, maintain_partitions, StatCache
+from traf_stat.online import save_online
+from traf_stat.talkers import save_top_talkers
+
+
+def load_subscribers():
+    close_old_connections()
+    return list(Abon.objects.exclude(ip_address=None).values_list(
+        'ip_address', 'pk', 'group_id', 'nas_id'
+    ).iterator())
+
+
+def load_seen():
+    close_old_connections()
+    return [
+        (uid, int(last_time.timestamp()))
+        for uid, last_time in StatCache.objects.values_list('abon_id', 'last_time').iterator()
+    ]
+
+
+def save(cur_time, counters):
+    close_old_connections()
+    save_flows(cur_time, counters)
+
+
+def main():
+    parser = ArgumentParser(description='NetFlow v5/v9 collector for djing')
+    parser.add_argument('ports', type=int, nargs='+', help='udp ports for listening')
+    parser.add_argument('-i', '--interval', type=int, default=FLUSH_INTERVAL, help='seconds between saves')
+    parser.add_argument('--dry-run', action='store_true', help='do not save traffic, for load tests')
+    args = parser.parse_args()
+    if not args.dry_run:
+        maintain_partitions()
+    collector = Collector(
+        args.ports,
+        sink=(lambda cur_time, counters: None) if args.dry_run else save,
+        load_subscribers=load_subscribers,
+        publish_talkers=None if args.dry_run else save_top_talkers,
+        load_seen=load_seen,
+        publish_online=None if args.dry_run else save_online,
+        interval=args.interval
+    )
+    loop = asyncio.get_event_loop()
+    try:
+        loop.run_until_complete(collector.run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
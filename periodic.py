@@ -11,6 +11,8 @@ from django.db.models import Count
 from abonapp.models import Abon, AbonTariff, PeriodicPayForId, AbonLog
 from gw_app.nas_managers import NasNetworkError, NasFailedResult
 from gw_app.models import NASModel
+from gw_app.placement import NasPlacement
+from group_app.models import Group
 from djing.lib import LogicError
 
 
@@ -119,6 +121,12 @@ def main():
     for pay in ppays:
         pay.payment_for_service(now=now)
 
+    # spread subscribers between gateways that serve their group
+    for grp in Group.objects.annotate(nascount=Count('nasmodel')).filter(nascount__gt=1).iterator():
+        placement = NasPlacement(grp)
+        placement.place()
+        placement.rebalance()
+
     # sync subscribers on GW
     threads = tuple(NasSyncThread(nas) for nas in NASModel.objects.
                     annotate(usercount=Count('abon')).
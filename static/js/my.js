@@ -233,7 +233,16 @@ $(document).ready(function () {
         self.removeClass('btn-success');
 		self.addClass('btn-info');
 		self.html('<span class="glyphicon glyphicon-refresh"></span> Подождите...');
-		$.getJSON(this.href, {cmd_param: cmd_param}, function(r){
+		var on_result = function(r){
+			if(r.job_id){
+				// command is running in background, wait for result
+				var status_url = r.status_url || self.attr('data-status-url');
+				self.attr('data-status-url', status_url);
+				setTimeout(function(){
+					$.getJSON(status_url, {job_id: r.job_id}, on_result);
+				}, 700);
+				return;
+			}
             self.removeClass('btn-info');
 			if(r.status == 0)
 				self.addClass('btn-success');
@@ -243,7 +252,8 @@ $(document).ready(function () {
             if(form_val){
             	$(form_val).val(r.extra_form_val);
 			}
-		});
+		};
+		$.getJSON(this.href, {cmd_param: cmd_param}, on_result);
 		return false;
 	});
 
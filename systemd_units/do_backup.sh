@@ -9,7 +9,7 @@ file="djing`date "+%Y-%m-%d_%H.%M.%S"`.sql.gz"
 mysql_passw=MYSQL ROOT PASSWORD
 
 echo show tables | mysql -uroot -p$mysql_passw djingdb | \
-	grep -v '^flowstat' | grep -v 'traflost' | grep -v '^Tables' | \
+	grep -v '^flowstat' | grep -vx 'traffic\|traffic_5m\|traffic_1h' | grep -v 'traflost' | grep -v '^Tables' | \
 	xargs mysqldump -R -Q --add-locks -uroot --password=$mysql_passw djingdb $1 | gzip > $file
 
 chmod 400 $file
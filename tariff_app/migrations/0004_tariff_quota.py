@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tariff_app', '0003_auto_20181115_1206'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tariff',
+            name='quota',
+            field=models.PositiveIntegerField(blank=True, default=None, help_text='Gb per month, speed is lowered when it is exceeded', null=True, verbose_name='Traffic quota'),
+        ),
+        migrations.AddField(
+            model_name='tariff',
+            name='quota_speed',
+            field=models.FloatField(default=1.0, verbose_name='Speed after quota'),
+        ),
+    ]
@@ -24,6 +24,11 @@ class Tariff(models.Model):
     calc_type = models.CharField(_('Script'), max_length=2, default=TARIFF_CHOICES[0][0],
                                  choices=MyChoicesAdapter(TARIFF_CHOICES))
     is_admin = models.BooleanField(_('Tech service'), default=False)
+    quota = models.PositiveIntegerField(
+        _('Traffic quota'), null=True, blank=True, default=None,
+        help_text=_('Gb per month, speed is lowered when it is exceeded')
+    )
+    quota_speed = models.FloatField(_('Speed after quota'), default=1.0)
 
     groups = models.ManyToManyField(Group, blank=True)
 
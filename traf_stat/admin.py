@@ -1,3 +1,9 @@
 from django.contrib import admin
+from traf_stat import models
 
-# Register your models here.
+
+@admin.register(models.TrafficPercentile)
+class TrafficPercentileAdmin(admin.ModelAdmin):
+    list_display = ('month', 'abon', 'group', 'nas', 'p95', 'peak', 'octets')
+    list_filter = ('month', 'group', 'nas')
+    search_fields = ('abon__username',)
@@ -0,0 +1,229 @@
+#
+# Archive of minute traffic. Each day is a file of columns, rows are
+# sorted by subscriber, and index of subscribers points to their rows.
+# Files are memory mapped, so reading history of one subscriber
+# does not read the whole file.
+#
+# File layout, little endian:
+#   header: magic, count of rows, count of subscribers
+#   offsets uint64[subscribers + 1] - start of rows of each subscriber
+#   octets  uint64[rows]
+#   uids    uint32[subscribers]      - sorted
+#   times   uint32[rows]
+#   packets uint32[rows]
+#
+import mmap
+import os
+import shutil
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from struct import Struct
+from tempfile import TemporaryFile
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from traf_stat.models import RESOLUTIONS
+
+ARCHIVE_DIR = getattr(settings, 'TRAFFIC_ARCHIVE_DIR', '/var/lib/djing/traffic')
+
+HEADER = Struct('<8sQQ')
+MAGIC = b'DJTRAF01'
+
+# Subscribers are read from database by chunks of this size
+ARCHIVE_CHUNK = 500
+
+# How many days are kept opened
+OPEN_DAYS = 64
+
+# (unix times, octets, packets)
+History = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+def day_path(day: date, archive_dir: Optional[str] = None) -> str:
+    return os.path.join(archive_dir or ARCHIVE_DIR, day.strftime('%Y'), day.strftime('%Y%m%d.traf'))
+
+
+def write_day(path: str, chunks: Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]):
+    """
+    Write file of day atomically
+    :param chunks: arrays (uids, times, octets, packets) sorted by uid and time,
+    uids of chunks must go in ascending order
+    """
+    uids, counts = [], []
+    columns = {name: TemporaryFile() for name in ('octets', 'times', 'packets')}
+    try:
+        for chunk_uids, times, octets, packets in chunks:
+            if not len(chunk_uids):
+                continue
+            starts = np.flatnonzero(np.r_[True, chunk_uids[1:] != chunk_uids[:-1]])
+            uids.append(chunk_uids[starts])
+            counts.append(np.diff(np.r_[starts, len(chunk_uids)]))
+            columns['octets'].write(np.asarray(octets, dtype='<u8').tobytes())
+            columns['times'].write(np.asarray(times, dtype='<u4').tobytes())
+            columns['packets'].write(np.asarray(packets, dtype='<u4').tobytes())
+        uids = np.concatenate(uids) if uids else np.empty(0, dtype=np.int64)
+        counts = np.concatenate(counts) if counts else np.empty(0, dtype=np.int64)
+        offsets = np.r_[0, np.cumsum(counts)].astype('<u8')
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '%s.tmp' % path
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, int(offsets[-1]), len(uids)))
+            f.write(offsets.tobytes())
+            columns['octets'].seek(0)
+            shutil.copyfileobj(columns['octets'], f)
+            f.write(uids.astype('<u4').tobytes())
+            for name in ('times', 'packets'):
+                columns[name].seek(0)
+                shutil.copyfileobj(columns[name], f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        for c in columns.values():
+            c.close()
+
+
+class DayArchive(object):
+    """
+    Columns of one day, as arrays that are views of mapped file
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < HEADER.size:
+            raise ArchiveError('%s is too short' % path)
+        magic, rows, subscribers = HEADER.unpack_from(self._mm)
+        if magic != MAGIC:
+            raise ArchiveError('%s is not archive of traffic' % path)
+        pos = HEADER.size
+
+        def column(dtype, count):
+            nonlocal pos
+            arr = np.frombuffer(self._mm, dtype=dtype, count=count, offset=pos)
+            pos += arr.nbytes
+            return arr
+
+        try:
+            self.offsets = column('<u8', subscribers + 1)
+            self.octets = column('<u8', rows)
+            self.uids = column('<u4', subscribers)
+            self.times = column('<u4', rows)
+            self.packets = column('<u4', rows)
+        except ValueError:
+            raise ArchiveError('%s is broken' % path)
+
+    def abon(self, uid: int) -> History:
+        i = int(np.searchsorted(self.uids, uid))
+        if i >= len(self.uids) or self.uids[i] != uid:
+            i = j = 0
+        else:
+            i, j = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self.times[i:j], self.octets[i:j], self.packets[i:j]
+
+
+class TrafficArchive(object):
+    def __init__(self, archive_dir: Optional[str] = None):
+        self.archive_dir = archive_dir or ARCHIVE_DIR
+        self._days = OrderedDict()
+
+    def day(self, day: date) -> Optional[DayArchive]:
+        d = self._days.get(day)
+        if d is not None:
+            self._days.move_to_end(day)
+            return d
+        path = day_path(day, self.archive_dir)
+        if not os.path.isfile(path):
+            return
+        d = self._days[day] = DayArchive(path)
+        if len(self._days) > OPEN_DAYS:
+            self._days.popitem(last=False)
+        return d
+
+    def has_day(self, day: date) -> bool:
+        return day in self._days or os.path.isfile(day_path(day, self.archive_dir))
+
+    def iter_abon(self, uid: int, start: date, end: date) -> Iterator[Tuple[date, History]]:
+        """
+        Traffic of subscriber by days, arrays are views of files
+        :param end: last day, included
+        """
+        day = start
+        while day <= end:
+            d = self.day(day)
+            if d is not None:
+                yield day, d.abon(uid)
+            day += timedelta(days=1)
+
+    def abon_history(self, uid: int, start: date, end: date) -> History:
+        """
+        Traffic of subscriber for days, joined to single arrays
+        """
+        parts = [h for day, h in self.iter_abon(uid, start, end)]
+        if not parts:
+            return np.empty(0, '<u4'), np.empty(0, '<u8'), np.empty(0, '<u4')
+        return tuple(np.concatenate(col) for col in zip(*parts))
+
+
+def archive_day(day: date, archive_dir: Optional[str] = None) -> bool:
+    """
+    Write minute traffic of day from database to file
+    :return: False if there is no traffic for day
+    """
+    raw = RESOLUTIONS[0]
+    start = int(datetime.combine(day, time.min).timestamp())
+    end = int(datetime.combine(day + timedelta(days=1), time.min).timestamp())
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT DISTINCT abon_id FROM %s WHERE cur_time >= %%s AND cur_time < %%s ORDER BY abon_id" % raw.table,
+            (start, end)
+        )
+        uids = [r[0] for r in cur.fetchall()]
+    if not uids:
+        return False
+
+    def chunks():
+        with connection.cursor() as cur:
+            for i in range(0, len(uids), ARCHIVE_CHUNK):
+                chunk = uids[i:i + ARCHIVE_CHUNK]
+                cur.execute(
+                    "SELECT abon_id, cur_time, octets, packets FROM %s WHERE cur_time >= %%s "
+                    "AND cur_time < %%s AND abon_id IN (%s) ORDER BY abon_id, cur_time" % (
+                        raw.table, ', '.join(('%s',) * len(chunk))
+                    ), [start, end] + chunk
+                )
+                rows = np.array(cur.fetchall(), dtype=np.int64).reshape(-1, 4)
+                yield rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3]
+
+    write_day(day_path(day, archive_dir), chunks())
+    return True
+
+
+def archive_old_days(today: Optional[date] = None) -> int:
+    """
+    Archive days of minute traffic that are finished and not archived yet.
+    It must be done before partitions of those days are dropped.
+    :return: count of archived days
+    """
+    if today is None:
+        today = date.today()
+    with connection.cursor() as cur:
+        cur.execute("SELECT MIN(cur_time) FROM %s" % RESOLUTIONS[0].table)
+        first = cur.fetchone()[0]
+    if first is None:
+        return 0
+    day = datetime.fromtimestamp(first).date()
+    count = 0
+    while day < today:
+        if not os.path.isfile(day_path(day)) and archive_day(day):
+            count += 1
+        day += timedelta(days=1)
+    return count
@@ -0,0 +1,98 @@
+#
+# Charts of traffic. Rows are taken from table of suitable resolution,
+# or from archive for minute traffic that is not in database,
+# put to grid of time by NumPy and downsampled by
+# largest triangle three buckets, so that shape of peaks is kept.
+#
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+import numpy as np
+
+from traf_stat.archive import TrafficArchive
+from traf_stat.models import get_traffic, floor_time, RESOLUTIONS
+
+# Files of archive stay mapped between requests
+archive = TrafficArchive()
+
+# Count of points of chart
+DEFAULT_POINTS = 400
+
+# Rows are taken from resolution that has not more points than
+# this times of points of chart, the rest is done by downsampling
+OVERSAMPLING = 8
+
+
+def to_grid(times: np.ndarray, values: np.ndarray, start: int, step: int, count: int) -> np.ndarray:
+    """
+    Sum values to steps of time, steps without values are zeros
+    :param times: unix times of values
+    :param start: time of first step
+    :return: array with count of steps
+    """
+    idx = (times - start) // step
+    inside = (idx >= 0) & (idx < count)
+    return np.bincount(idx[inside], weights=values[inside], minlength=count)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Largest triangle three buckets. First and last points are kept, and from
+    each bucket between them the point that makes largest triangle with
+    chosen point of previous bucket and average of next bucket is taken.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+    # bounds of buckets for points between first and last
+    bounds = (np.arange(threshold - 1) * (n - 2) / (threshold - 2)).astype(np.int64) + 1
+    bounds[-1] = n - 1
+    out = np.empty(threshold, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    sums_x = np.add.reduceat(x[1:n - 1], bounds[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], bounds[:-1] - 1)
+    sizes = np.diff(bounds)
+    avg_x = np.append(sums_x / sizes, x[-1])
+    avg_y = np.append(sums_y / sizes, y[-1])
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = bounds[i], bounds[i + 1]
+        # doubled area of triangles, sign does not matter
+        area = np.abs(
+            (x[a] - avg_x[i + 1]) * (y[lo:hi] - y[a]) -
+            (x[a] - x[lo:hi]) * (avg_y[i + 1] - y[a])
+        )
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return x[out], y[out]
+
+
+def traffic_chart(abon_id: int, start: datetime, end: datetime,
+                  points=DEFAULT_POINTS) -> Optional[dict]:
+    """
+    Speed of subscriber traffic for time range
+    :return: dict with unix times in 'x' and Mbit/s in 'y',
+    or None if there is no traffic
+    """
+    res = RESOLUTIONS[0]
+    if (end - start).total_seconds() / res.step <= points * OVERSAMPLING and \
+            start < datetime.now() - timedelta(days=res.retention) and archive.has_day(start.date()):
+        # minute traffic of this time is dropped from database, but it is in archive
+        times, octets, packets = archive.abon_history(abon_id, start.date(), end.date())
+    else:
+        res, rows = get_traffic(start, end, abons=(abon_id,), max_points=points * OVERSAMPLING)
+        rows = np.array(rows, dtype=np.int64).reshape(-1, 4)
+        times, octets = rows[:, 0], rows[:, 2]
+    if not len(times):
+        return
+    first = floor_time(int(start.timestamp()), res.step)
+    count = max(-(-(int(end.timestamp()) - first) // res.step), 1)
+    octets = to_grid(times.astype(np.int64), octets.astype(np.float64), first, res.step, count)
+    x = first + np.arange(count, dtype=np.int64) * res.step
+    y = octets * 8 / res.step / 2 ** 20
+    x, y = lttb(x, y, points)
+    return {
+        'step': res.step,
+        'x': x.tolist(),
+        'y': np.round(y, 3).tolist()
+    }
@@ -0,0 +1,51 @@
+from django.db import migrations
+
+RAW_TABLE_SQL = (
+    "CREATE TABLE IF NOT EXISTS traffic ("
+    "`cur_time` INT(10) UNSIGNED NOT NULL,"
+    "`abon_id` INT(11) UNSIGNED NOT NULL,"
+    "`ip` INT(10) UNSIGNED NOT NULL,"
+    "`octets` BIGINT UNSIGNED NOT NULL DEFAULT 0,"
+    "`packets` BIGINT UNSIGNED NOT NULL DEFAULT 0,"
+    "PRIMARY KEY (`cur_time`, `abon_id`),"
+    "KEY `abon_time` (`abon_id`, `cur_time`)"
+    ") ENGINE=InnoDB DEFAULT CHARSET=utf8 "
+    "PARTITION BY RANGE (`cur_time`) (PARTITION pmax VALUES LESS THAN MAXVALUE);"
+)
+
+ROLLUP_TABLE_SQL = (
+    "CREATE TABLE IF NOT EXISTS %s ("
+    "`cur_time` INT(10) UNSIGNED NOT NULL,"
+    "`abon_id` INT(11) UNSIGNED NOT NULL,"
+    "`octets` BIGINT UNSIGNED NOT NULL DEFAULT 0,"
+    "`packets` BIGINT UNSIGNED NOT NULL DEFAULT 0,"
+    "PRIMARY KEY (`cur_time`, `abon_id`),"
+    "KEY `abon_time` (`abon_id`, `cur_time`)"
+    ") ENGINE=InnoDB DEFAULT CHARSET=utf8%s;"
+)
+
+PARTITIONS_SQL = " PARTITION BY RANGE (`cur_time`) (PARTITION pmax VALUES LESS THAN MAXVALUE)"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traf_stat', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=(
+                RAW_TABLE_SQL,
+                ROLLUP_TABLE_SQL % ('traffic_5m', PARTITIONS_SQL),
+                ROLLUP_TABLE_SQL % ('traffic_1h', PARTITIONS_SQL),
+                ROLLUP_TABLE_SQL % ('traffic_1d', ''),
+            ),
+            reverse_sql=(
+                'DROP TABLE traffic;',
+                'DROP TABLE traffic_5m;',
+                'DROP TABLE traffic_1h;',
+                'DROP TABLE traffic_1d;',
+            )
+        )
+    ]
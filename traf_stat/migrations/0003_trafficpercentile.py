@@ -0,0 +1,35 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('abonapp', '0010_abonreachability'),
+        ('group_app', '0003_auto_20180808_1236'),
+        ('gw_app', '0005_nas_placement'),
+        ('traf_stat', '0002_traffic_tables'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrafficPercentile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Month')),
+                ('p95', models.BigIntegerField(default=0, verbose_name='95th percentile, bit/s')),
+                ('peak', models.BigIntegerField(default=0, verbose_name='Peak, bit/s')),
+                ('octets', models.BigIntegerField(default=0, verbose_name='Octets')),
+                ('abon', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='abonapp.Abon')),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='group_app.Group')),
+                ('nas', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='gw_app.NASModel')),
+            ],
+            options={
+                'verbose_name': 'Traffic percentile',
+                'verbose_name_plural': 'Traffic percentiles',
+                'db_table': 'traffic_percentile',
+                'ordering': ('-month',),
+                'unique_together': {('month', 'abon'), ('month', 'group'), ('month', 'nas')},
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traf_stat', '0003_trafficpercentile'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=(
+                "CREATE TABLE IF NOT EXISTS traffic_month ("
+                "`cur_time` INT(10) UNSIGNED NOT NULL,"
+                "`abon_id` INT(11) UNSIGNED NOT NULL,"
+                "`octets` BIGINT UNSIGNED NOT NULL DEFAULT 0,"
+                "`packets` BIGINT UNSIGNED NOT NULL DEFAULT 0,"
+                "PRIMARY KEY (`cur_time`, `abon_id`)"
+                ") ENGINE=InnoDB DEFAULT CHARSET=utf8;",
+                # counters of current month from daily sums
+                "INSERT INTO traffic_month(cur_time, abon_id, octets, packets) "
+                "SELECT UNIX_TIMESTAMP(DATE_FORMAT(FROM_UNIXTIME(cur_time), '%Y-%m-01')), abon_id, "
+                "SUM(octets), SUM(packets) FROM traffic_1d GROUP BY 1, abon_id;",
+            ),
+            reverse_sql=('DROP TABLE traffic_month;',)
+        )
+    ]
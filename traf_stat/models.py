@@ -1,115 +1,337 @@
+from collections import namedtuple
 from datetime import datetime, timedelta, date, time
-import math
+from typing import Callable, Dict, List, Iterable, Optional, Tuple
 
-from django.db import models, connection, ProgrammingError
+from django.db import models, connection, transaction
 from django.utils.timezone import now
+from django.utils.translation import gettext_lazy as _
+from agent.netflow.online import ONLINE_TIMEOUT
 from .fields import UnixDateTimeField
 
 
-def get_dates():
-    tables = connection.introspection.table_names()
-    tables = (t.replace('flowstat_', '') for t in tables if t.startswith('flowstat_'))
-    return tuple(datetime.strptime(t, '%d%m%Y').date() for t in tables)
+class Resolution(namedtuple('Resolution', 'name table step partition retention')):
+    """
+    Table of traffic with one row per subscriber for each step of time.
+    :param step: seconds of one row
+    :param partition: size of partition, DAY or MONTH, None if table is not partitioned
+    :param retention: days after which partitions are dropped, None for keep forever
+    """
+    __slots__ = ()
 
 
-class StatManager(models.Manager):
-    def chart(self, user, count_of_parts=12, want_date=date.today()):
-        def byte_to_mbit(x):
-            return ((x / 60) * 8) / 2 ** 20
+DAY = 'day'
+MONTH = 'month'
 
-        def split_list(lst, chunk_count):
-            chunk_size = len(lst) // chunk_count
-            if chunk_size == 0:
-                chunk_size = 1
-            return tuple(lst[i:i + chunk_size] for i in range(0, len(lst), chunk_size))
+# From fine to coarse. Collector saves rows to first table,
+# others are summed on saving
+RESOLUTIONS = (
+    Resolution('minute', 'traffic', 60, DAY, 7),
+    Resolution('5min', 'traffic_5m', 300, DAY, 35),
+    Resolution('hour', 'traffic_1h', 3600, MONTH, 400),
+    Resolution('day', 'traffic_1d', 86400, None, None),
+)
+RESOLUTIONS_BY_NAME = {r.name: r for r in RESOLUTIONS}
 
-        def avarage(elements):
-            return sum(elements) / len(elements)
+# Counters of subscribers for each month, they are kept forever
+MONTH_TABLE = 'traffic_month'
 
-        try:
-            charts_data = self.filter(abon=user)
-            charts_times = tuple(cd.cur_time.timestamp() * 1000 for cd in charts_data)
-            charts_octets = tuple(cd.octets for cd in charts_data)
-            if len(charts_octets) > 0 and len(charts_octets) == len(charts_times):
-                charts_octets = split_list(charts_octets, count_of_parts)
-                charts_octets = (byte_to_mbit(avarage(c)) for c in charts_octets)
-
-                charts_times = split_list(charts_times, count_of_parts)
-                charts_times = tuple(avarage(t) for t in charts_times)
-
-                charts_data = zip(charts_times, charts_octets)
-                charts_data = ["{x: new Date(%d), y: %.2f}" % (cd[0], cd[1]) for cd in charts_data]
-                midnight = datetime.combine(want_date, time.min)
-                charts_data.append("{x:new Date(%d),y:0}" % (int(charts_times[-1:][0]) + 1))
-                charts_data.append("{x:new Date(%d),y:0}" % (int((midnight + timedelta(days=1)).timestamp()) * 1000))
-                return charts_data
-            else:
-                return
-        except ProgrammingError as e:
-            if "flowstat" in str(e):
-                return
-
-
-class StatElem(models.Model):
-    cur_time = UnixDateTimeField(primary_key=True)
-    abon = models.ForeignKey('abonapp.Abon', on_delete=models.CASCADE, null=True, default=None, blank=True)
-    ip = models.PositiveIntegerField()
-    octets = models.PositiveIntegerField(default=0)
-    packets = models.PositiveIntegerField(default=0)
+# How many partitions are made ahead of current
+PARTITIONS_AHEAD = 3
 
-    objects = StatManager()
+# Resolution of query is chosen so that result has no more points than this
+DEFAULT_MAX_POINTS = 1500
 
-    # ReadOnly
-    def save(self, *args, **kwargs):
-        pass
+MAX_UINT = 2 ** 32 - 1
 
-    # ReadOnly
-    def delete(self, *args, **kwargs):
-        pass
+# (unix time, subscriber id, ip, octets, packets)
+TrafficRow = Tuple[int, int, int, int, int]
 
-    @property
-    def table_name(self):
-        return self._meta.db_table
 
-    def delete_month(self):
-        cursor = connection.cursor()
-        table_name = self._meta.db_table
-        sql = "DROP TABLE %s;" % table_name
-        cursor.execute(sql)
+def floor_time(timestamp: int, step: int) -> int:
+    """
+    Start of local time step, that contains timestamp
+    """
+    dt = datetime.fromtimestamp(timestamp)
+    midnight = datetime.combine(dt.date(), time.min)
+    if step >= 86400:
+        return int(midnight.timestamp())
+    seconds = int(timestamp - midnight.timestamp())
+    return int(midnight.timestamp()) + seconds - seconds % step
 
-    @staticmethod
-    def percentile(N, percent, key=lambda x: x):
-        """
-        Find the percentile of a list of values.
 
-        @parameter N - is a list of values. Note N MUST BE already sorted.
-        @parameter percent - a float value from 0.0 to 1.0.
-        @parameter key - optional key function to compute value from each element of N.
+def floor_month(timestamp: int) -> int:
+    """
+    Start of local month, that contains timestamp
+    """
+    d = datetime.fromtimestamp(timestamp).date().replace(day=1)
+    return int(datetime.combine(d, time.min).timestamp())
 
-        @return - the percentile of the values
-        """
-        if not N:
-            return None
-        k = (len(N) - 1) * percent
-        f = math.floor(k)
-        c = math.ceil(k)
-        if f == c:
-            return key(N[int(k)])
-        d0 = key(N[int(f)]) * (c - k)
-        d1 = key(N[int(c)]) * (k - f)
-        return d0 + d1
 
-    class Meta:
-        abstract = True
+def _rollup(rows: Iterable[TrafficRow], floor: Callable[[int], int]) -> List[Tuple[int, int, int, int]]:
+    sums = {}
+    for timestamp, uid, ip, octets, packets in rows:
+        key = (floor(timestamp - 1), uid)
+        s = sums.get(key)
+        if s is None:
+            sums[key] = [octets, packets]
+        else:
+            s[0] += octets
+            s[1] += packets
+    return [(t, uid, o, p) for (t, uid), (o, p) in sums.items()]
+
+
+def rollup_rows(rows: Iterable[TrafficRow], step: int) -> List[Tuple[int, int, int, int]]:
+    """
+    Sum rows by steps of time. Time of row is end of its interval, so
+    that row is summed to step where its interval is.
+    :return: list of (start of step, subscriber id, octets, packets)
+    """
+    return _rollup(rows, lambda t: floor_time(t, step))
+
+
+def month_rows(rows: Iterable[TrafficRow]) -> List[Tuple[int, int, int, int]]:
+    """
+    Sum rows by months, same as rollup_rows
+    """
+    return _rollup(rows, floor_month)
+
+
+def _ingest(cur, rows: List[TrafficRow]):
+    if not rows:
+        return
+    raw = RESOLUTIONS[0]
+    cur.executemany(
+        "INSERT INTO %s(`cur_time`,`abon_id`,`ip`,`octets`,`packets`) "
+        "VALUES (%%s, %%s, %%s, %%s, %%s) "
+        "ON DUPLICATE KEY UPDATE octets=octets+VALUES(octets), "
+        "packets=packets+VALUES(packets)" % raw.table, rows
+    )
+    for res in RESOLUTIONS[1:]:
+        cur.executemany(
+            "INSERT INTO %s(`cur_time`,`abon_id`,`octets`,`packets`) "
+            "VALUES (%%s, %%s, %%s, %%s) "
+            "ON DUPLICATE KEY UPDATE octets=octets+VALUES(octets), "
+            "packets=packets+VALUES(packets)" % res.table, rollup_rows(rows, res.step)
+        )
+    cur.executemany(
+        "INSERT INTO %s(`cur_time`,`abon_id`,`octets`,`packets`) "
+        "VALUES (%%s, %%s, %%s, %%s) "
+        "ON DUPLICATE KEY UPDATE octets=octets+VALUES(octets), "
+        "packets=packets+VALUES(packets)" % MONTH_TABLE, month_rows(rows)
+    )
+
+
+def save_flows(cur_time: datetime, counters: Dict[int, List[int]]):
+    """
+    Save traffic of subscribers by bulk inserts, rollup
+    tables are updated in the same transaction
+    :param cur_time: time of the end of interval
+    :param counters: subscriber id -> [ip, octets, packets]
+    """
+    timestamp = int(cur_time.timestamp())
+    rows = [
+        (timestamp, uid, ip, octets, packets)
+        for uid, (ip, octets, packets) in counters.items()
+    ]
+    with transaction.atomic(), connection.cursor() as cur:
+        _ingest(cur, rows)
+        cur.executemany(
+            "INSERT INTO flowcache(abon_id, last_time, octets, packets) VALUES (%s, %s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE last_time=VALUES(last_time), "
+            "octets=VALUES(octets), packets=VALUES(packets)",
+            tuple(
+                (uid, timestamp, min(octets, MAX_UINT), min(packets, MAX_UINT))
+                for timestamp, uid, ip, octets, packets in rows
+            )
+        )
+
+
+def pick_resolution(start: datetime, end: datetime, max_points=DEFAULT_MAX_POINTS) -> Resolution:
+    """
+    Finest resolution that still keeps data of start time,
+    and gives not more than max_points of time
+    """
+    seconds = (end - start).total_seconds()
+    for res in RESOLUTIONS:
+        if res.retention is not None and start < datetime.now() - timedelta(days=res.retention):
+            continue
+        if seconds / res.step <= max_points:
+            return res
+    return RESOLUTIONS[-1]
+
+
+def get_traffic(start: datetime, end: datetime, abons: Optional[Iterable[int]] = None,
+                resolution: Optional[Resolution] = None, max_points=DEFAULT_MAX_POINTS,
+                total=False) -> Tuple[Resolution, List[tuple]]:
+    """
+    Traffic of subscribers for time range.
+    :param abons: ids of subscribers, all if None
+    :param resolution: chosen by pick_resolution if not passed
+    :param total: sum traffic of all subscribers for each time
+    :return: resolution and list of (unix time, subscriber id, octets, packets)
+    ordered by time, or (unix time, octets, packets) if total
+    """
+    if resolution is None:
+        resolution = pick_resolution(start, end, max_points)
+    params = [
+        floor_time(int(start.timestamp()), resolution.step),
+        int(end.timestamp())
+    ]
+    where = ''
+    if abons is not None:
+        abons = tuple(abons)
+        if not abons:
+            return resolution, []
+        where = ' AND abon_id IN (%s)' % ', '.join(('%s',) * len(abons))
+        params.extend(abons)
+    if total:
+        sql = "SELECT cur_time, SUM(octets), SUM(packets) FROM %s " \
+              "WHERE cur_time >= %%s AND cur_time < %%s%s GROUP BY cur_time ORDER BY cur_time"
+    else:
+        sql = "SELECT cur_time, abon_id, octets, packets FROM %s " \
+              "WHERE cur_time >= %%s AND cur_time < %%s%s ORDER BY cur_time, abon_id"
+    with connection.cursor() as cur:
+        cur.execute(sql % (resolution.table, where), params)
+        return resolution, [tuple(int(v) for v in r) for r in cur.fetchall()]
+
+
+def get_traffic_days() -> Tuple[date, ...]:
+    """
+    Days on which there is any traffic
+    """
+    with connection.cursor() as cur:
+        cur.execute("SELECT DISTINCT cur_time FROM %s ORDER BY cur_time" % RESOLUTIONS[-1].table)
+        return tuple(datetime.fromtimestamp(r[0]).date() for r in cur.fetchall())
+
 
+def _counters(table: str, cur_time: int, abons: Optional[Iterable[int]]) -> Dict[int, int]:
+    params = [cur_time]
+    where = ''
+    if abons is not None:
+        abons = tuple(abons)
+        if not abons:
+            return {}
+        where = ' AND abon_id IN (%s)' % ', '.join(('%s',) * len(abons))
+        params.extend(abons)
+    with connection.cursor() as cur:
+        cur.execute("SELECT abon_id, octets FROM %s WHERE cur_time = %%s%s" % (table, where), params)
+        return {uid: int(octets) for uid, octets in cur.fetchall()}
 
-def getModel(want_date=None):
-    if want_date is None:
-        want_date = now()
-    se = StatElem
-    se.Meta.db_table = 'flowstat_%s' % want_date.strftime("%d%m%Y")
-    se.Meta.abstract = False
-    return se
+
+def get_month_octets(abons: Optional[Iterable[int]] = None, day: Optional[date] = None) -> Dict[int, int]:
+    """
+    Octets of subscribers for month of day, current month by default
+    :param abons: ids of subscribers, all if None
+    :return: subscriber id -> octets, subscribers without traffic are absent
+    """
+    day = day or date.today()
+    return _counters(MONTH_TABLE, int(datetime.combine(day.replace(day=1), time.min).timestamp()), abons)
+
+
+def get_day_octets(abons: Optional[Iterable[int]] = None, day: Optional[date] = None) -> Dict[int, int]:
+    """
+    Octets of subscribers for day, today by default
+    """
+    day = day or date.today()
+    return _counters(RESOLUTIONS_BY_NAME['day'].table, int(datetime.combine(day, time.min).timestamp()), abons)
+
+
+def _next_period(d: date, partition: str) -> date:
+    if partition == MONTH:
+        return (d.replace(day=1) + timedelta(days=32)).replace(day=1)
+    return d + timedelta(days=1)
+
+
+def _period_start(d: date, partition: str) -> date:
+    if partition == MONTH:
+        return d.replace(day=1)
+    return d
+
+
+def _timestamp(d: date) -> int:
+    return int(datetime.combine(d, time.min).timestamp())
+
+
+def maintain_partitions(today: Optional[date] = None):
+    """
+    Make partitions ahead of current time and drop partitions
+    that are older than retention. Data of each partition is
+    the period of time that starts at date in its name.
+    """
+    if today is None:
+        today = date.today()
+    with connection.cursor() as cur:
+        for res in RESOLUTIONS:
+            if res.partition is None:
+                continue
+            cur.execute(
+                "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", (res.table,)
+            )
+            # partition name -> upper bound of time
+            bounds = {name: int(desc) for name, desc in cur.fetchall() if desc != 'MAXVALUE'}
+
+            period = _period_start(today, res.partition)
+            if bounds:
+                period = max(period, datetime.fromtimestamp(max(bounds.values())).date())
+            last = _period_start(today, res.partition)
+            for i in range(PARTITIONS_AHEAD):
+                last = _next_period(last, res.partition)
+            new = []
+            while period <= last:
+                next_period = _next_period(period, res.partition)
+                new.append("PARTITION p%s VALUES LESS THAN (%d)" % (
+                    period.strftime('%Y%m%d'), _timestamp(next_period)
+                ))
+                period = next_period
+            if new:
+                new.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+                cur.execute("ALTER TABLE %s REORGANIZE PARTITION pmax INTO (%s)" % (
+                    res.table, ', '.join(new)
+                ))
+
+            expired = _timestamp(today - timedelta(days=res.retention))
+            expired = [name for name, bound in bounds.items() if bound <= expired]
+            if expired:
+                cur.execute("ALTER TABLE %s DROP PARTITION %s" % (res.table, ', '.join(expired)))
+
+
+def import_flowstat_tables(today: Optional[date] = None, chunk_size=10000) -> int:
+    """
+    Move traffic from tables flowstat_DDMMYYYY, that are made by djing_flow,
+    to partitioned tables. Table of today is not touched, because
+    djing_flow writes there.
+    :return: count of imported tables
+    """
+    if today is None:
+        today = date.today()
+    count = 0
+    for table in connection.introspection.table_names():
+        if not table.startswith('flowstat_'):
+            continue
+        try:
+            day = datetime.strptime(table[9:], '%d%m%Y').date()
+        except ValueError:
+            continue
+        if day >= today:
+            continue
+        with transaction.atomic(), connection.cursor() as cur:
+            cur.execute(
+                "SELECT cur_time, abon_id, MAX(ip), SUM(octets), SUM(packets) FROM %s "
+                "GROUP BY cur_time, abon_id ORDER BY cur_time" % table
+            )
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                with connection.cursor() as ins:
+                    _ingest(ins, [tuple(int(v) for v in r) for r in rows])
+        # DROP TABLE commits implicitly in mysql, so it is done
+        # only after copy of traffic is committed
+        with connection.cursor() as cur:
+            cur.execute("DROP TABLE %s" % table)
+        count += 1
+    return count
 
 
 class StatCache(models.Model):
@@ -119,7 +341,7 @@ class StatCache(models.Model):
     packets = models.PositiveIntegerField(default=0)
 
     def is_online(self):
-        return self.last_time > now() - timedelta(minutes=55)
+        return self.last_time > now() - timedelta(seconds=ONLINE_TIMEOUT)
 
     def is_today(self):
         return date.today() == self.last_time.date()
@@ -143,3 +365,27 @@ class StatCache(models.Model):
     class Meta:
         db_table = 'flowcache'
         ordering = ('-last_time',)
+
+
+class TrafficPercentile(models.Model):
+    """
+    95th percentile of traffic speed for month. Row belongs
+    to one of subscriber, group or gateway.
+    """
+    month = models.DateField(_('Month'))
+    abon = models.ForeignKey('abonapp.Abon', on_delete=models.CASCADE, null=True, blank=True)
+    group = models.ForeignKey('group_app.Group', on_delete=models.CASCADE, null=True, blank=True)
+    nas = models.ForeignKey('gw_app.NASModel', on_delete=models.CASCADE, null=True, blank=True)
+    p95 = models.BigIntegerField(_('95th percentile, bit/s'), default=0)
+    peak = models.BigIntegerField(_('Peak, bit/s'), default=0)
+    octets = models.BigIntegerField(_('Octets'), default=0)
+
+    def __str__(self):
+        return '%s %s' % (self.month.strftime('%m.%Y'), self.abon or self.group or self.nas)
+
+    class Meta:
+        db_table = 'traffic_percentile'
+        verbose_name = _('Traffic percentile')
+        verbose_name_plural = _('Traffic percentiles')
+        unique_together = (('month', 'abon'), ('month', 'group'), ('month', 'nas'))
+        ordering = ('-month',)
@@ -0,0 +1,60 @@
+#
+# Counts of online subscribers are maintained by netflow
+# collector, and passed to web through redis hash
+#
+from typing import Dict, Optional
+
+from django.conf import settings
+from redis import Redis
+
+ONLINE_KEY = 'netflow_online'
+ONLINE_TOTAL_FIELD = 'total'
+
+# Counts are dropped if collector stops updating them, seconds
+ONLINE_TTL = 300
+
+
+def _redis() -> Redis:
+    return Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+
+
+def save_online(total: int, groups: Dict[int, int]):
+    mapping = {str(gid): count for gid, count in groups.items()}
+    mapping[ONLINE_TOTAL_FIELD] = total
+    pipe = _redis().pipeline()
+    pipe.delete(ONLINE_KEY)
+    pipe.hset(ONLINE_KEY, mapping=mapping)
+    pipe.expire(ONLINE_KEY, ONLINE_TTL)
+    pipe.execute()
+
+
+def get_online_counts() -> Optional[Dict[int, int]]:
+    """
+    :return: group id -> count of online subscribers,
+    or None if collector does not count them
+    """
+    data = _redis().hgetall(ONLINE_KEY)
+    if not data:
+        return
+    return {
+        int(gid): int(count) for gid, count in data.items()
+        if gid != ONLINE_TOTAL_FIELD.encode()
+    }
+
+
+def get_group_online(gid: int) -> Optional[int]:
+    count = _redis().hget(ONLINE_KEY, str(gid))
+    if count is None:
+        # group has no online subscribers, or collector does not count them
+        return 0 if _redis().exists(ONLINE_KEY) else None
+    return int(count)
+
+
+def get_online_total() -> Optional[int]:
+    """
+    :return: count of all online subscribers,
+    or None if collector does not count them
+    """
+    total = _redis().hget(ONLINE_KEY, ONLINE_TOTAL_FIELD)
+    if total is not None:
+        return int(total)
@@ -0,0 +1,154 @@
+#
+# 95th percentile of traffic speed for burstable billing. Samples are
+# 5 minute rows, time without traffic is zero speed. Month is read by
+# days, and only largest samples of each series are kept between days,
+# because percentile is the smallest of them.
+#
+from datetime import date, datetime, time, timedelta
+from math import ceil
+from typing import List, Optional, Tuple
+
+import numpy as np
+from django.db import connection, transaction
+
+from abonapp.models import Abon
+from traf_stat.models import RESOLUTIONS_BY_NAME, TrafficPercentile
+
+PERCENT = 95
+
+
+def top_count(samples: int, percent=PERCENT) -> int:
+    """
+    How many largest samples must be kept, so that the smallest of them is
+    the percentile by nearest rank
+    """
+    return samples - ceil(samples * percent / 100) + 1
+
+
+class TopSamples(object):
+    """
+    Keeps k largest samples for each of series
+    """
+
+    def __init__(self, series: int, k: int):
+        self.top = np.zeros((series, k), dtype=np.float64)
+        self.peak = np.zeros(series, dtype=np.float64)
+        self.k = k
+
+    def add(self, samples: np.ndarray):
+        """
+        :param samples: matrix, row for each of series
+        """
+        if not samples.size:
+            return
+        np.maximum(self.peak, samples.max(axis=1), out=self.peak)
+        both = np.concatenate((self.top, samples), axis=1)
+        self.top = -np.partition(-both, self.k - 1, axis=1)[:, :self.k]
+
+    def percentile(self) -> np.ndarray:
+        return self.top.min(axis=1)
+
+
+def _month_bounds(month: date):
+    start = month.replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+def _timestamp(d: date) -> int:
+    return int(datetime.combine(d, time.min).timestamp())
+
+
+def _day_samples(uids: np.ndarray, day: date, step: int) -> np.ndarray:
+    """
+    Matrix of octets, row for each subscriber and column for each step of day
+    :param uids: sorted ids of subscribers
+    """
+    start, end = _timestamp(day), _timestamp(day + timedelta(days=1))
+    samples = np.zeros((len(uids), (end - start) // step), dtype=np.float64)
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT cur_time, abon_id, octets FROM %s WHERE cur_time >= %%s AND cur_time < %%s" %
+            RESOLUTIONS_BY_NAME['5min'].table, (start, end)
+        )
+        rows = np.array(cur.fetchall(), dtype=np.int64).reshape(-1, 3)
+    if len(rows) and len(uids):
+        idx = np.searchsorted(uids, rows[:, 1])
+        np.minimum(idx, len(uids) - 1, out=idx)
+        known = uids[idx] == rows[:, 1]
+        np.add.at(samples, (idx[known], (rows[known, 0] - start) // step), rows[known, 2])
+    return samples
+
+
+def _group_matrix(values: List[Optional[int]]) -> Tuple[List[int], np.ndarray]:
+    """
+    Matrix that sums subscribers into aggregates, subscribers without value are skipped
+    :param values: id of aggregate for each subscriber
+    :return: ids of aggregates and matrix (aggregates x subscribers)
+    """
+    ids = sorted({v for v in values if v is not None})
+    pos = {v: i for i, v in enumerate(ids)}
+    m = np.zeros((len(ids), len(values)), dtype=np.float64)
+    for col, v in enumerate(values):
+        if v is not None:
+            m[pos[v], col] = 1
+    return ids, m
+
+
+def month_percentiles(month: date) -> int:
+    """
+    Calculate percentile of speed of each subscriber, group and gateway
+    for month, and save to TrafficPercentile instead of previous results.
+    Speed of group and gateway is sum of speeds of their subscribers.
+    :return: count of subscribers
+    """
+    start, end = _month_bounds(month)
+    step = RESOLUTIONS_BY_NAME['5min'].step
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT DISTINCT abon_id FROM %s WHERE cur_time >= %%s AND cur_time < %%s" %
+            RESOLUTIONS_BY_NAME['day'].table, (_timestamp(start), _timestamp(end))
+        )
+        uids = [r[0] for r in cur.fetchall()]
+    abons = {
+        pk: (group_id, nas_id) for pk, group_id, nas_id in
+        Abon.objects.filter(pk__in=uids).values_list('pk', 'group_id', 'nas_id').iterator()
+    }
+    # traffic of removed subscribers is not counted
+    uids = sorted(abons.keys())
+    group_ids, groups = _group_matrix([abons[uid][0] for uid in uids])
+    nas_ids, nases = _group_matrix([abons[uid][1] for uid in uids])
+
+    k = top_count((_timestamp(end) - _timestamp(start)) // step)
+    aggregates = (
+        ('abon_id', uids, None),
+        ('group_id', group_ids, groups),
+        ('nas_id', nas_ids, nases),
+    )
+    tops = [TopSamples(len(ids), k) for field, ids, m in aggregates]
+    octets = np.zeros(len(uids), dtype=np.float64)
+    uids_arr = np.array(uids, dtype=np.int64)
+    day = start
+    while day < end:
+        samples = _day_samples(uids_arr, day, step)
+        octets += samples.sum(axis=1)
+        for (field, ids, m), top in zip(aggregates, tops):
+            top.add(samples if m is None else m @ samples)
+        day += timedelta(days=1)
+
+    results = []
+    for (field, ids, m), top in zip(aggregates, tops):
+        totals = octets if m is None else m @ octets
+        for obj_id, p95, peak, total in zip(ids, top.percentile().tolist(),
+                                            top.peak.tolist(), totals.tolist()):
+            results.append(TrafficPercentile(**{
+                'month': start,
+                field: obj_id,
+                'p95': int(p95 * 8 / step),
+                'peak': int(peak * 8 / step),
+                'octets': int(total)
+            }))
+    with transaction.atomic():
+        TrafficPercentile.objects.filter(month=start).delete()
+        TrafficPercentile.objects.bulk_create(results, batch_size=1000)
+    return len(uids)
@@ -0,0 +1,140 @@
+#
+# Queries of traffic for statistics pages. Results are cached in redis by
+# range and resolution. Range that is finished does not change any more,
+# and range that lasts till now changes once per collector interval,
+# so version of result is known without querying of database.
+#
+import json
+from collections import namedtuple
+from datetime import date, datetime
+from hashlib import md5
+from time import time as unix_time
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from redis import Redis
+
+from abonapp.models import Abon
+from traf_stat.models import (
+    get_traffic, get_traffic_days, pick_resolution, floor_time,
+    RESOLUTIONS, RESOLUTIONS_BY_NAME, DEFAULT_MAX_POINTS
+)
+
+# What traffic is summed, subscriber or all subscribers of group or gateway
+KINDS = ('abon', 'group', 'nas')
+
+QUERY_KEY = 'traffic_query'
+DAYS_KEY = 'traffic_days'
+
+# Days are taken from database again after this time, seconds
+DAYS_TTL = 600
+
+# How long results of finished ranges are kept, seconds
+FINISHED_TTL = 24 * 3600
+
+# Rows of last interval may be still not saved by collector, seconds
+SAVE_DELAY = 120
+
+
+def _redis() -> Redis:
+    return Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+
+
+def traffic_days() -> Tuple[date, ...]:
+    """
+    Days on which there is any traffic, cached for DAYS_TTL
+    """
+    redis = _redis()
+    days = redis.get(DAYS_KEY)
+    if days is not None:
+        return tuple(date.fromordinal(d) for d in json.loads(days))
+    days = get_traffic_days()
+    redis.set(DAYS_KEY, json.dumps([d.toordinal() for d in days]), ex=DAYS_TTL)
+    return days
+
+
+def forget_traffic_days():
+    _redis().delete(DAYS_KEY)
+
+
+class TrafficQuery(namedtuple('TrafficQuery', 'kind obj_id start end resolution')):
+    """
+    Range of traffic, start and end are unix times aligned to step of resolution
+    """
+
+    @classmethod
+    def make(cls, kind: str, obj_id: int, start: datetime, end: datetime,
+             resolution: Optional[str] = None, max_points=DEFAULT_MAX_POINTS):
+        if kind not in KINDS:
+            raise ValueError('Unknown kind of traffic query "%s"' % kind)
+        res = pick_resolution(start, end, max_points)
+        if resolution is not None:
+            # passed resolution is made coarser if range has too many points in it
+            res = max(RESOLUTIONS_BY_NAME[resolution], res, key=lambda r: r.step)
+        return cls(
+            kind=kind, obj_id=obj_id,
+            start=floor_time(int(start.timestamp()), res.step),
+            end=floor_time(int(end.timestamp()) - 1, res.step) + res.step,
+            resolution=res.name
+        )
+
+    @property
+    def key(self) -> str:
+        return '%s:%s:%d:%s:%d:%d' % (QUERY_KEY, self.kind, self.obj_id, self.resolution, self.start, self.end)
+
+    def is_finished(self, now: int) -> bool:
+        return self.end <= now - SAVE_DELAY
+
+    def version(self, now: int) -> int:
+        """
+        Result is the same while version is the same
+        """
+        if self.is_finished(now):
+            return self.end
+        return floor_time(now, RESOLUTIONS[0].step)
+
+    def etag(self, now: Optional[int] = None) -> str:
+        now = int(unix_time()) if now is None else now
+        return md5(('%s:%d' % (self.key, self.version(now))).encode()).hexdigest()
+
+    def abons(self) -> List[int]:
+        if self.kind == 'abon':
+            return [self.obj_id]
+        field = 'group_id' if self.kind == 'group' else 'nas_id'
+        return list(Abon.objects.filter(**{field: self.obj_id}).values_list('pk', flat=True))
+
+    def run(self) -> dict:
+        res = RESOLUTIONS_BY_NAME[self.resolution]
+        res, rows = get_traffic(
+            datetime.fromtimestamp(self.start), datetime.fromtimestamp(self.end),
+            abons=self.abons(), resolution=res, total=True
+        )
+        times, octets, packets = (list(col) for col in zip(*rows)) if rows else ([], [], [])
+        return {
+            'kind': self.kind,
+            'id': self.obj_id,
+            'resolution': res.name,
+            'step': res.step,
+            'start': self.start,
+            'end': self.end,
+            'times': times,
+            'octets': octets,
+            'packets': packets,
+            'total_octets': sum(octets)
+        }
+
+
+def query_traffic(query: TrafficQuery) -> dict:
+    """
+    Traffic summed for each step of range, from cache if there is
+    :return: dict with lists of unix times, octets and packets
+    """
+    now = int(unix_time())
+    key = '%s:%d' % (query.key, query.version(now))
+    redis = _redis()
+    data = redis.get(key)
+    if data is not None:
+        return json.loads(data)
+    result = query.run()
+    redis.set(key, json.dumps(result), ex=FINISHED_TTL if query.is_finished(now) else RESOLUTIONS[0].step)
+    return result
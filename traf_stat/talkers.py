@@ -0,0 +1,31 @@
+#
+# Top talkers are counted by netflow collector, and passed
+# to web through redis, as json of last snapshot
+#
+import json
+from typing import Optional
+
+from django.conf import settings
+from redis import Redis
+
+TOP_TALKERS_KEY = 'netflow_top_talkers'
+
+# Snapshot is dropped if collector stops updating it, seconds
+TOP_TALKERS_TTL = 300
+
+
+def save_top_talkers(snapshot: dict):
+    Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT).set(
+        TOP_TALKERS_KEY, json.dumps(snapshot), ex=TOP_TALKERS_TTL
+    )
+
+
+def get_top_talkers() -> Optional[dict]:
+    """
+    :return: windows in seconds -> {'all': talkers, 'groups': {group id: talkers},
+    'nas': {gateway id: talkers}}, keys are strings. Talker is
+    [subscriber id, octets, average Mbit/s].
+    """
+    data = Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT).get(TOP_TALKERS_KEY)
+    if data is not None:
+        return json.loads(data)
@@ -0,0 +1,31 @@
+from datetime import date, timedelta
+
+from celery import shared_task
+
+from traf_stat.archive import archive_old_days
+from traf_stat.models import maintain_partitions, import_flowstat_tables
+from traf_stat.percentile import month_percentiles
+from traf_stat.query import forget_traffic_days
+
+
+@shared_task
+def maintain_traffic_tables():
+    # for those who still collect traffic by flow-tools and djing_flow
+    import_flowstat_tables()
+    # minute traffic must be archived before its partitions are dropped
+    archive_old_days()
+    maintain_partitions()
+    forget_traffic_days()
+
+
+@shared_task
+def month_traffic_percentiles(year: int = None, month: int = None):
+    """
+    Percentiles for passed month, or for previous month by default.
+    5 minute traffic is kept for 35 days, so month must be calculated
+    in first days of the next one.
+    """
+    if year is None or month is None:
+        prev = date.today().replace(day=1) - timedelta(days=1)
+        year, month = prev.year, prev.month
+    return month_percentiles(date(year, month, 1))
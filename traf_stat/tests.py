@@ -1,3 +1,318 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import datetime, timedelta, date
 
-# Create your tests here.
+import numpy as np
+from django.shortcuts import resolve_url
+from django.test import SimpleTestCase, TestCase
+
+from abonapp.models import Abon
+from accounts_app.models import UserProfile
+from agent.netflow.collector import FlowAggregator
+from agent.netflow.decoder import decode, V9Decoder, NetflowDecodeError
+from agent.netflow.flowgen import make_v5_packet, make_v9_packet
+from agent.netflow.online import OnlineState
+from agent.netflow.resolver import IpResolver, UNKNOWN
+from agent.netflow.talkers import TopTalkers
+from traf_stat.archive import TrafficArchive, write_day, day_path
+from traf_stat.charts import lttb, to_grid
+from traf_stat.models import floor_time, floor_month, rollup_rows, month_rows, pick_resolution
+from traf_stat.percentile import TopSamples, top_count
+from group_app.models import Group
+from traf_stat.query import TrafficQuery, SAVE_DELAY
+from traf_stat.views import can_view_traffic
+
+FLOWS = [
+    (0x01020304, 0x0a000001, 1500, 2),
+    (0x0a000002, 0x01020304, 100, 1),
+    (0x01020304, 0x0a000001, 500, 1)
+]
+
+
+class NetflowDecodeTestCase(SimpleTestCase):
+    def test_v5(self):
+        self.assertEqual(decode(make_v5_packet(FLOWS, 1), '127.0.0.1', V9Decoder()), FLOWS)
+
+    def test_v9(self):
+        v9 = V9Decoder()
+        # data before template is skipped
+        self.assertEqual(decode(make_v9_packet(FLOWS, 1), '127.0.0.1', v9), [])
+        self.assertEqual(decode(make_v9_packet(FLOWS, 2, with_template=True), '127.0.0.1', v9), FLOWS)
+        self.assertEqual(decode(make_v9_packet(FLOWS, 3), '127.0.0.1', v9), FLOWS)
+        # templates of other exporter are not used
+        self.assertEqual(decode(make_v9_packet(FLOWS, 1), '127.0.0.2', v9), [])
+
+    def test_broken(self):
+        with self.assertRaises(NetflowDecodeError):
+            decode(make_v5_packet(FLOWS, 1)[:-10], '127.0.0.1', V9Decoder())
+        with self.assertRaises(NetflowDecodeError):
+            decode(b'\x00\x07', '127.0.0.1', V9Decoder())
+
+
+class FlowAggregatorTestCase(SimpleTestCase):
+    def test_sum_per_subscriber(self):
+        resolver = IpResolver()
+        resolver.build([('10.0.0.1', 1), ('10.0.0.2', 2)])
+        aggregator = FlowAggregator(resolver, batch_size=2)
+        aggregator.add(FLOWS)
+        aggregator.add([(0x01020304, 0x01020305, 10, 1)])
+        self.assertEqual(aggregator.swap(), {
+            1: [0x0a000001, 2000, 3],
+            2: [0x0a000002, 100, 1]
+        })
+        self.assertEqual(aggregator.flows, 4)
+        self.assertEqual(aggregator.unknown, 1)
+        self.assertEqual(aggregator.swap(), {})
+
+
+class IpResolverTestCase(SimpleTestCase):
+    def setUp(self):
+        self.resolver = IpResolver()
+        self.resolver.build([
+            ('10.0.0.1', 1), ('10.0.0.3', 2), ('192.168.1.0/24', 3),
+            ('192.168.1.5', 4), ('fde4::1', 5)
+        ])
+
+    def test_resolve(self):
+        uids = self.resolver.resolve([
+            0x0a000001, 0x0a000002, 0x0a000003, 0xc0a80107, 0xc0a80105, 0xc0a80200, 0, 0xffffffff
+        ])
+        self.assertListEqual(uids.tolist(), [1, UNKNOWN, 2, 3, 4, UNKNOWN, UNKNOWN, UNKNOWN])
+        self.assertIsNone(self.resolver.resolve_one(0x0a000002))
+
+    def test_sync(self):
+        changed = self.resolver.sync([
+            ('10.0.0.2', 1), ('10.0.0.3', 2), ('192.168.1.0/24', 3), ('10.0.0.9', 6)
+        ])
+        self.assertEqual(changed, 4)
+        uids = self.resolver.resolve([0x0a000001, 0x0a000002, 0x0a000003, 0xc0a80105, 0x0a000009])
+        self.assertListEqual(uids.tolist(), [UNKNOWN, 1, 2, 3, 6])
+
+    def test_sync_incremental(self):
+        pairs = [('10.1.%d.%d' % (i // 256, i % 256), i) for i in range(100)]
+        self.resolver.build(pairs)
+        self.assertEqual(self.resolver.sync(pairs), 0)
+        # address of 1 is moved to 2, and 3 is removed
+        pairs[1], pairs[2] = ('10.1.0.200', 1), ('10.1.0.1', 2)
+        del pairs[3]
+        self.assertEqual(self.resolver.sync(pairs), 3)
+        self.assertEqual(len(self.resolver), 99)
+        uids = self.resolver.resolve([0x0a010001, 0x0a010002, 0x0a010003, 0x0a0100c8, 0x0a010063])
+        self.assertListEqual(uids.tolist(), [2, UNKNOWN, UNKNOWN, 1, 99])
+
+    def test_same_address_of_gateways(self):
+        pairs = [('10.1.%d.%d' % (i // 256, i % 256), i) for i in range(100)]
+        # subscriber of other gateway has the same private address as 5
+        pairs.append(('10.1.0.5', 100))
+        self.resolver.build(pairs)
+        pairs[5] = ('10.1.0.205', 5)
+        resolver, changed = self.resolver.synced(pairs)
+        self.assertEqual(changed, 1)
+        self.assertEqual(resolver.resolve_one(0x0a010005), 100)
+        self.assertEqual(resolver.resolve_one(0x0a0100cd), 5)
+        # old resolver is not changed
+        self.assertIsNone(self.resolver.resolve_one(0x0a0100cd))
+
+
+class TrafficRollupTestCase(SimpleTestCase):
+    def test_floor_time(self):
+        t = int(datetime(2020, 3, 5, 14, 37, 12).timestamp())
+        self.assertEqual(floor_time(t, 60), int(datetime(2020, 3, 5, 14, 37).timestamp()))
+        self.assertEqual(floor_time(t, 300), int(datetime(2020, 3, 5, 14, 35).timestamp()))
+        self.assertEqual(floor_time(t, 3600), int(datetime(2020, 3, 5, 14).timestamp()))
+        self.assertEqual(floor_time(t, 86400), int(datetime(2020, 3, 5).timestamp()))
+
+    def test_rollup_rows(self):
+        five = int(datetime(2020, 3, 5, 14, 35).timestamp())
+        rows = [
+            # end of interval is still in previous step
+            (five, 1, 0x0a000001, 100, 1),
+            (five + 60, 1, 0x0a000001, 200, 2),
+            (five + 300, 1, 0x0a000001, 300, 3),
+            (five + 60, 2, 0x0a000002, 10, 1),
+        ]
+        self.assertEqual(sorted(rollup_rows(rows, 300)), [
+            (five - 300, 1, 100, 1),
+            (five, 1, 500, 5),
+            (five, 2, 10, 1),
+        ])
+
+    def test_month_rows(self):
+        month = int(datetime(2020, 3, 1).timestamp())
+        rows = [
+            # last minute of february
+            (month, 1, 0x0a000001, 100, 1),
+            (month + 60, 1, 0x0a000001, 200, 2),
+            (int(datetime(2020, 3, 31, 23, 59).timestamp()), 1, 0x0a000001, 300, 3),
+        ]
+        self.assertEqual(floor_month(month + 86400 * 10), month)
+        self.assertEqual(sorted(month_rows(rows)), [
+            (int(datetime(2020, 2, 1).timestamp()), 1, 100, 1),
+            (month, 1, 500, 5),
+        ])
+
+    def test_pick_resolution(self):
+        now = datetime.now()
+        self.assertEqual(pick_resolution(now - timedelta(hours=6), now).name, 'minute')
+        self.assertEqual(pick_resolution(now - timedelta(days=3), now).name, '5min')
+        # raw traffic of this time is dropped already
+        self.assertEqual(pick_resolution(now - timedelta(days=8), now - timedelta(days=7, hours=20)).name, '5min')
+        self.assertEqual(pick_resolution(now - timedelta(days=30), now).name, 'hour')
+        self.assertEqual(pick_resolution(now - timedelta(days=300), now).name, 'day')
+        self.assertEqual(pick_resolution(now - timedelta(days=3), now, max_points=10).name, 'day')
+
+
+class TrafficQueryTestCase(SimpleTestCase):
+    def test_range_is_aligned(self):
+        start = datetime.now().replace(second=17, microsecond=0) - timedelta(hours=3)
+        q = TrafficQuery.make('group', 3, start, start + timedelta(hours=2), resolution='5min')
+        self.assertEqual(q.start % 300, 0)
+        self.assertEqual(q.end - q.start, 2 * 3600 + 300)
+        # same range is the same key of cache
+        self.assertEqual(q, TrafficQuery.make('group', 3, start + timedelta(seconds=10),
+                                              start + timedelta(hours=2), resolution='5min'))
+        with self.assertRaises(ValueError):
+            TrafficQuery.make('device', 3, start, start + timedelta(hours=2))
+
+    def test_resolution_is_limited(self):
+        end = datetime.now()
+        q = TrafficQuery.make('nas', 1, end - timedelta(days=300), end, resolution='minute')
+        self.assertEqual(q.resolution, 'day')
+        q = TrafficQuery.make('nas', 1, end - timedelta(hours=3), end, resolution='hour')
+        self.assertEqual(q.resolution, 'hour')
+
+    def test_etag(self):
+        start = datetime.now() - timedelta(hours=1)
+        q = TrafficQuery.make('abon', 1, start, start + timedelta(minutes=30), resolution='minute')
+        # finished range does not change
+        self.assertEqual(q.etag(q.end + SAVE_DELAY), q.etag(q.end + 86400))
+        q = TrafficQuery.make('abon', 1, start, start + timedelta(hours=2), resolution='minute')
+        now = q.start + 3600
+        self.assertEqual(q.etag(now), q.etag(now + 30 - now % 60))
+        self.assertNotEqual(q.etag(now), q.etag(now + 60))
+
+
+class ChartTestCase(SimpleTestCase):
+    def test_to_grid(self):
+        grid = to_grid(np.array([0, 60, 60, 600, -60]), np.array([1., 2., 3., 4., 5.]), 0, 60, 5)
+        self.assertListEqual(grid.tolist(), [1., 5., 0., 0., 0.])
+
+    def test_lttb_keeps_peaks(self):
+        x = np.arange(1000, dtype=np.float64)
+        y = np.zeros(1000)
+        y[[100, 501, 900]] = (5., 9., 7.)
+        sx, sy = lttb(x, y, 50)
+        self.assertEqual(len(sx), 50)
+        self.assertEqual((sx[0], sx[-1]), (0., 999.))
+        self.assertTrue(set(sx.tolist()) >= {100., 501., 900.})
+        self.assertTrue(np.all(np.diff(sx) > 0))
+
+    def test_lttb_short(self):
+        x, y = np.arange(10), np.arange(10)
+        self.assertIs(lttb(x, y, 20)[0], x)
+
+
+class PercentileTestCase(SimpleTestCase):
+    def test_top_count(self):
+        self.assertEqual(top_count(100), 6)
+        self.assertEqual(top_count(8928), 447)
+
+    def test_by_chunks(self):
+        rng = np.random.RandomState(1)
+        samples = rng.exponential(100, size=(5, 8640))
+        top = TopSamples(5, top_count(8640))
+        for day in range(30):
+            top.add(samples[:, day * 288:(day + 1) * 288])
+        # nearest rank percentile of whole month
+        expected = np.sort(samples, axis=1)[:, int(np.ceil(8640 * 0.95)) - 1]
+        self.assertListEqual(top.percentile().tolist(), expected.tolist())
+        self.assertListEqual(top.peak.tolist(), samples.max(axis=1).tolist())
+
+
+class TrafficArchiveTestCase(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_write_read(self):
+        day = date(2020, 3, 5)
+        chunks = [
+            (np.array([1, 1, 4]), np.array([60, 120, 60]), np.array([2 ** 40, 5, 7]), np.array([1, 2, 3])),
+            (np.array([], dtype=np.int64),) * 4,
+            (np.array([9]), np.array([180]), np.array([11]), np.array([4])),
+        ]
+        write_day(day_path(day, self.dir), iter(chunks))
+        archive = TrafficArchive(self.dir)
+        times, octets, packets = archive.day(day).abon(1)
+        self.assertListEqual(times.tolist(), [60, 120])
+        self.assertListEqual(octets.tolist(), [2 ** 40, 5])
+        self.assertListEqual(packets.tolist(), [1, 2])
+        self.assertListEqual(archive.day(day).abon(9)[1].tolist(), [11])
+        self.assertEqual(len(archive.day(day).abon(5)[0]), 0)
+        self.assertIsNone(archive.day(date(2020, 3, 6)))
+
+        times, octets, packets = archive.abon_history(4, date(2020, 3, 1), date(2020, 3, 31))
+        self.assertListEqual(octets.tolist(), [7])
+
+
+class TopTalkersTestCase(SimpleTestCase):
+    def test_windows(self):
+        talkers = TopTalkers(60, windows=(60, 180), count=2)
+        talkers.set_owners({1: (10, 100), 2: (10, 100), 3: (11, None)})
+        talkers.add({1: [0, 100, 1], 2: [0, 300, 1], 3: [0, 50, 1]})
+        talkers.add({1: [0, 1000, 1], 4: [0, 5, 1]})
+        snapshot = talkers.snapshot()
+        self.assertListEqual([t[:2] for t in snapshot[60]['all']], [[1, 1000], [4, 5]])
+        self.assertEqual(snapshot[60]['groups'].keys(), {10})
+        self.assertListEqual([t[:2] for t in snapshot[180]['all']], [[1, 1100], [2, 300]])
+        self.assertListEqual([t[:2] for t in snapshot[180]['groups'][11]], [[3, 50]])
+        self.assertListEqual([t[:2] for t in snapshot[180]['nas'][100]], [[1, 1100], [2, 300]])
+        # the first interval goes out of window
+        talkers.add({})
+        talkers.add({})
+        self.assertListEqual([t[:2] for t in talkers.snapshot()[180]['all']], [[1, 1000], [4, 5]])
+
+
+class OnlineStateTestCase(SimpleTestCase):
+    def test_counts(self):
+        state = OnlineState(timeout=300)
+        state.load([(1, 1000), (2, 500), (5000, 1100)])
+        state.set_groups({1: 10, 2: 10, 3: 11, 5000: None})
+        state.touch([3], 1200)
+        self.assertListEqual(state.online(1250).tolist(), [1, 3, 5000])
+        self.assertEqual(state.counts(1250), (3, {10: 1, 11: 1}))
+        # group is changed
+        state.set_groups({1: 11, 2: 10, 3: 11})
+        self.assertEqual(state.counts(1250), (3, {11: 2}))
+        self.assertEqual(state.counts(2000), (0, {}))
+
+
+class TrafficPermissionTestCase(TestCase):
+    def setUp(self):
+        self.group = Group.objects.create(title='Grp1')
+        self.abon = Abon.objects.create_user(telephone='+79781234567', username='abon', password='passw1')
+        self.abon.group = self.group
+        self.abon.save(update_fields=('group',))
+        self.admin = UserProfile.objects.create_user('+79781234568', 'admin', 'ps')
+        self.admin.is_admin = True
+        self.admin.save(update_fields=('is_admin',))
+        self.superuser = UserProfile.objects.create_superuser('+79781234569', 'superuser', 'ps')
+
+    def test_abon_chart_forbidden(self):
+        self.client.force_login(self.admin)
+        r = self.client.get(resolve_url('traf_stat:abon_chart', self.abon.pk))
+        self.assertEqual(r.status_code, 403)
+        r = self.client.get(resolve_url('traf_stat:traffic_json', 'group', self.group.pk))
+        self.assertEqual(r.status_code, 403)
+
+    def test_top_talkers_forbidden(self):
+        self.client.force_login(self.admin)
+        r = self.client.get(resolve_url('traf_stat:top_talkers_json'), {'group': self.group.pk})
+        self.assertEqual(r.status_code, 403)
+
+    def test_can_view(self):
+        self.assertTrue(can_view_traffic(self.superuser, 'abon', self.abon.pk))
+        self.assertTrue(can_view_traffic(self.superuser, 'group', self.group.pk))
+        self.assertFalse(can_view_traffic(self.admin, 'abon', self.abon.pk))
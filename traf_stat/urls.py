@@ -1,9 +1,16 @@
 from django.urls import path
 
-from traf_stat.views import home
+from traf_stat.views import (
+    home, abon_chart, top_talkers, top_talkers_json, traffic_json, traffic_days_json
+)
 
 app_name = 'traf_stat'
 
 urlpatterns = [
     path('', home, name='home'),
+    path('chart/<int:uid>/', abon_chart, name='abon_chart'),
+    path('traffic/<str:kind>/<int:obj_id>/', traffic_json, name='traffic_json'),
+    path('days/', traffic_days_json, name='traffic_days'),
+    path('talkers/', top_talkers, name='top_talkers'),
+    path('talkers/json/', top_talkers_json, name='top_talkers_json'),
 ]
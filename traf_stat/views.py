@@ -1,9 +1,249 @@
-from django.shortcuts import render
+from datetime import datetime, timedelta
+from functools import wraps
+
+from django.http import Http404, HttpResponseForbidden
+from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from djing.lib.decorators import only_admins
+from django.core.exceptions import PermissionDenied
+from django.views.decorators.http import condition
+from guardian.shortcuts import get_objects_for_user
+from redis.exceptions import RedisError
+
+from abonapp.models import Abon
+from agent.netflow.talkers import WINDOWS
+from djing import lib
+from djing.lib.decorators import only_admins, json_view
+from group_app.models import Group
+from gw_app.models import NASModel
+from traf_stat.charts import traffic_chart, DEFAULT_POINTS
+from traf_stat.models import RESOLUTIONS_BY_NAME
+from traf_stat.online import get_online_counts, get_online_total
+from traf_stat.query import TrafficQuery, KINDS, query_traffic, traffic_days
+from traf_stat.talkers import get_top_talkers
+
+# Longest time range of one chart
+MAX_CHART_DAYS = 400
 
 
 @login_required
 @only_admins
 def home(request):
-    return render(request, 'statistics/index.html')
+    try:
+        online = get_online_counts()
+        online_total = get_online_total()
+    except RedisError:
+        online = online_total = None
+    groups = ()
+    if online:
+        groups = Group.objects.filter(pk__in=online.keys()).order_by('title')
+        for grp in groups:
+            grp.online_count = online[grp.pk]
+    return render(request, 'statistics/index.html', {
+        'online_total': online_total,
+        'online_groups': groups
+    })
+
+
+def _time_range(request):
+    """
+    Time range from GET in unix time, last day by default
+    :return: (start, end) or None if range is wrong
+    """
+    end = lib.safe_int(request.GET.get('end'))
+    end = datetime.fromtimestamp(end) if end > 0 else datetime.now()
+    start = lib.safe_int(request.GET.get('start'))
+    start = datetime.fromtimestamp(start) if start > 0 else end - timedelta(days=1)
+    if start >= end or end - start > timedelta(days=MAX_CHART_DAYS):
+        return
+    return start, end
+
+
+def can_view_traffic(user, kind: str, obj_id: int) -> bool:
+    """
+    Traffic of subscriber or group is seen by those who see subscriber or group
+    """
+    if kind == 'abon':
+        abon = get_object_or_404(Abon.objects.select_related('group'), pk=obj_id)
+        if not user.has_perm('abonapp.view_abon'):
+            return False
+        if abon.group is None:
+            return user.has_perm('group_app.view_group')
+        return user.has_perm('group_app.view_group', abon.group)
+    if kind == 'group':
+        return user.has_perm('group_app.view_group', get_object_or_404(Group, pk=obj_id))
+    return True
+
+
+def traffic_permission(kind: str = None):
+    """
+    Return 403 if user can not see traffic of object,
+    kind is taken from url if it is not passed
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapped(request, *args, **kwargs):
+            obj_kind = kind or kwargs.get('kind')
+            obj_id = kwargs.get('obj_id', kwargs.get('uid'))
+            if not can_view_traffic(request.user, obj_kind, obj_id):
+                return HttpResponseForbidden()
+            return fn(request, *args, **kwargs)
+        return wrapped
+    return decorator
+
+
+@login_required
+@only_admins
+@traffic_permission('abon')
+@json_view
+def abon_chart(request, uid: int):
+    """
+    Chart of subscriber traffic. Time range is passed
+    in unix time, last day by default
+    """
+    time_range = _time_range(request)
+    if time_range is None:
+        return {'text': 'Bad time range'}
+    start, end = time_range
+    points = min(lib.safe_int(request.GET.get('points')) or DEFAULT_POINTS, DEFAULT_POINTS * 4)
+    return traffic_chart(uid, start, end, points) or {'x': [], 'y': []}
+
+
+def _traffic_query(request, kind: str, obj_id: int):
+    if kind not in KINDS:
+        raise Http404
+    time_range = _time_range(request)
+    resolution = request.GET.get('resolution')
+    if time_range is None or (resolution is not None and resolution not in RESOLUTIONS_BY_NAME):
+        return
+    return TrafficQuery.make(kind, obj_id, *time_range, resolution=resolution)
+
+
+def _traffic_etag(request, kind: str, obj_id: int):
+    query = _traffic_query(request, kind, obj_id)
+    if query is not None:
+        return query.etag()
+
+
+@login_required
+@only_admins
+@traffic_permission()
+@condition(etag_func=_traffic_etag)
+@json_view
+def traffic_json(request, kind: str, obj_id: int):
+    """
+    Traffic of subscriber, group or gateway summed by steps of time.
+    Time range is passed in unix time, resolution is chosen by
+    length of range if it is not passed.
+    """
+    query = _traffic_query(request, kind, obj_id)
+    if query is None:
+        return {'text': 'Bad time range'}
+    try:
+        return query_traffic(query)
+    except RedisError:
+        return query.run()
+
+
+def _days_etag(request):
+    try:
+        days = traffic_days()
+    except RedisError:
+        return
+    if days:
+        return '%d-%d-%d' % (days[0].toordinal(), days[-1].toordinal(), len(days))
+
+
+@login_required
+@only_admins
+@condition(etag_func=_days_etag)
+@json_view
+def traffic_days_json(request):
+    """
+    Days on which there is any traffic
+    """
+    try:
+        days = traffic_days()
+    except RedisError as e:
+        return {'text': str(e)}
+    return {
+        'days': [d.isoformat() for d in days]
+    }
+
+
+def _talkers_groups(user):
+    return get_objects_for_user(
+        user, 'group_app.view_group', klass=Group,
+        use_groups=False, accept_global_perms=False
+    )
+
+
+def _top_talkers(request, groups):
+    """
+    Talkers of window from GET, of all subscribers or of group or gateway,
+    only subscribers of groups that user can see are given
+    :raises PermissionDenied: if user can not see subscribers or passed group
+    """
+    if not request.user.has_perm('abonapp.view_abon'):
+        raise PermissionDenied
+    window = lib.safe_int(request.GET.get('window')) or WINDOWS[0]
+    group_id = lib.safe_int(request.GET.get('group'))
+    nas_id = lib.safe_int(request.GET.get('nas'))
+    if group_id and not groups.filter(pk=group_id).exists():
+        raise PermissionDenied
+    snapshot = get_top_talkers()
+    if snapshot is None or str(window) not in snapshot:
+        return window, group_id, nas_id, None
+    snapshot = snapshot[str(window)]
+    if group_id:
+        return window, group_id, nas_id, snapshot['groups'].get(str(group_id), [])
+    if nas_id:
+        talkers = snapshot['nas'].get(str(nas_id), [])
+    else:
+        talkers = snapshot['all']
+    visible = set(Abon.objects.filter(
+        pk__in=[t[0] for t in talkers], group__in=groups
+    ).values_list('pk', flat=True))
+    return window, group_id, nas_id, [t for t in talkers if t[0] in visible]
+
+
+@login_required
+@only_admins
+@json_view
+def top_talkers_json(request):
+    try:
+        window, group_id, nas_id, talkers = _top_talkers(request, _talkers_groups(request.user))
+    except RedisError as e:
+        return {'text': str(e)}
+    if talkers is None:
+        return {'text': 'Collector does not publish top talkers'}
+    return {
+        'window': window,
+        'talkers': talkers
+    }
+
+
+@login_required
+@only_admins
+def top_talkers(request):
+    groups = _talkers_groups(request.user)
+    try:
+        window, group_id, nas_id, talkers = _top_talkers(request, groups)
+        error = None
+    except RedisError as e:
+        window, group_id, nas_id, talkers = WINDOWS[0], 0, 0, None
+        error = e
+    if talkers:
+        abons = Abon.objects.filter(pk__in=[t[0] for t in talkers]).only(
+            'pk', 'username', 'fio', 'group_id', 'ip_address'
+        ).in_bulk()
+        talkers = [(abons.get(uid), octets, mbit) for uid, octets, mbit in talkers]
+    return render(request, 'statistics/top_talkers.html', {
+        'talkers': talkers,
+        'error': error,
+        'windows': WINDOWS,
+        'window': window,
+        'group_id': group_id,
+        'nas_id': nas_id,
+        'groups': groups,
+        'nases': NASModel.objects.filter(abon__group__in=groups).distinct()
+    })